@@ -16,8 +16,21 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import array
+import bisect
+import collections
+import contextlib
+import hashlib
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
 import time
-from pyftdi import gpio
+
+#In a sequence of register writes, writes are not moved across a BARRIER by DacCom.order_writes
+BARRIER = None
 
 class DDS(object):
     """The DDS library controls the DAC38RF82EVM board and implements a two channel DDS from 0-4 GHz.
@@ -28,74 +41,134 @@ class DDS(object):
 
         This library allows to use the board in standalone mode without an additional FPGA card.
     """
-    def __init__(self, config="./config/PLL_M9N5Ref1228_8MHz_PLLlock.cfg"):
+    #Base address of the NCO frequency words per channel, 'ab' writes both DUC pages at once
+    NCO_FREQ_ADR = {'a': 0x011E, 'b': 0x021E, 'ab': 0x031E}
+    TRIGGER = [(0x0328,0x330), (0x0328,0x332), (0x0328,0x330)]
+
+    #LMK04828 writes of nco_sync: arming the SYSREF machinery, then the SYSREF pulse
+    SYNC_ARM = [(0x0139,0x00), (0x0143,0x11), (0x0144,0x7E), (0x0144,0x7C), (0x0143,0x31), (0x0143,0x11),
+                (0x0144,0xFC), (0x0144,0xFD), (0x0144,0xFF), (0x0139,0x03)]
+    SYNC_PULSE = [(0x010E,0x70), (0x0106,0x70), (0x010E,0x71), (0x0106,0x71)]
+
+    #operations timed by instrument()
+    INSTRUMENTED = ('config_board', 'attach', 'start_up_sequence', 'nco_freq_a', 'nco_freq_b', 'nco_phase_a',
+                    'nco_phase_b', 'amplitude_a', 'amplitude_b', 'update', 'sweep', 'envelope', 'nco_sync')
+
+    def __init__(self, config="./config/PLL_M9N5Ref1228_8MHz_PLLlock.cfg", transport=None):
         """Initialize the library
 
             :param str config: Path to configuration file
+            :param transport: SPI transport, e.g. :class:`MpsseTransport`, defaults to :class:`BitBangTransport`
         """
-        self.dac=DacCom(config=config)
+        self.dac=DacCom(config=config, transport=transport)
         self.DAC_SAMPLING_RATE = 1228.8*9*4/5
+        self._batch = None #parameter changes collected by batch()
+        self.METRICS = None #Metrics while instrumented
+        self._sync_armed = False #SYSREF armed by nco_sync
+        self._sync_cache = {} #rendered nco_sync sequences
+
+    def connect(self):
+        """Load the configuration and open the FTDI interfaces now instead of on the first register access.
+
+        :return: self
+        """
+        self.dac.connect()
+        return self
 
-    def config_board(self):
+    def config_board(self, verify='full', warm=False):
         """Configures the DAC and the clock distribution chip on the board
 
         Resets the DAC by its reset pin and loads the configuration file in to the DAC and the clock distribution chip.
+        The registers are written in bulk and verified afterwards, see :meth:`DacCom.configure`.
+
+        In warm mode the DAC is not reset, the register state is read back and only the registers differing from
+        the configuration are written, see :meth:`DacCom.warm_configure`.
+
+        :param str verify: read back verification, 'full', 'sampled' or 'off'
+        :param bool warm: write only the differences to the running board
+        :return: in warm mode, list of (bus, address, set value, read value) of the registers that were written
         """
+        self._sync_armed = False
+        if warm:
+            print("Comparing board with configuration...")
+            deltas = self.dac.warm_configure()
+            print("done, %d registers written" % len(deltas))
+            return deltas
         self.dac.dac_reset()
-        print("Configuring clock generation...")
-        self.dac.lmk_configure()
-        print("done")
-        print("Configuring DAC38RF82...")
-        self.dac.dac_configure()
+        print("Configuring clock generation and DAC38RF82...")
+        self.dac.configure(verify=verify)
         print("done")
 
+    def attach(self):
+        """Attach to a running board without a full bring-up.
+
+        Writes only the registers differing from the configuration, without resetting the DAC. The start up sequence
+        (PLL re-lock and SYSREF synchronization) runs only if registers had to be written. NCO frequencies, phases
+        and amplitudes keep their running values.
+
+        :return: list of (bus, address, set value, read value) of the registers that were written
+        """
+        deltas = self.config_board(warm=True)
+        if deltas:
+            self.start_up_sequence()
+        return deltas
+
     def start_up_sequence(self):
         """Start up sequence
 
         Starts up the PLLs, resets the chips, and synchronizes via SYSREF.
+        The sequence is written in one transfer, grouped by DAC page between its ordered steps.
         """
-        self.dac.lmk_write(0x0139,0x00)
-        self.dac.lmk_write(0x0143,0x11)
-        self.dac.lmk_write(0x0144,0x7E)
-        self.dac.lmk_write(0x0144,0x7C)
-        self.dac.lmk_write(0x0143,0x31)
-        self.dac.lmk_write(0x0143,0x11)
-        self.dac.lmk_write(0x0144,0xFC)
-        self.dac.lmk_write(0x0144,0xFD)
-        self.dac.lmk_write(0x0144,0xFF)
-        self.dac.lmk_write(0x0139,0x03)
-        self.dac.lmk_write(0x010E,0x70)
-        self.dac.lmk_write(0x0106,0x70)
-
-        self.dac.dac_write(0x0124,0x00)
-        self.dac.dac_write(0x0224,0x00)
-        self.dac.dac_write(0x015C,0x00)
-        self.dac.dac_write(0x025C,0x00)
-        self.dac.dac_write(0x040A,0xFC03)
-        self.dac.dac_write(0x040A,0x7C03)
-        self.dac.dac_write(0x0000,0x5801)
-        self.dac.dac_write(0x0000,0x5803)
-
-        self.dac.dac_write(0x0124,0x30)
-        self.dac.dac_write(0x0224,0x20)
-        self.dac.dac_write(0x015C,0x2)
-        self.dac.dac_write(0x025C,0x3)
-        self.dac.dac_write(0x0000,0x5801)
-        self.dac.dac_write(0x0000,0x5800)
-
-        self.dac.lmk_write(0x010E,0x71)
-        self.dac.lmk_write(0x0106,0x71)
-
-        self.dac.dac_write(0x0128,0x0332)
-        self.dac.dac_write(0x0128,0x0330)
-        self.dac.dac_write(0x0228,0x0332)
-        self.dac.dac_write(0x0228,0x0330)
+        self.dac.write_batch([
+            ('lmk',0x0139,0x00),
+            ('lmk',0x0143,0x11),
+            ('lmk',0x0144,0x7E),
+            ('lmk',0x0144,0x7C),
+            ('lmk',0x0143,0x31),
+            ('lmk',0x0143,0x11),
+            ('lmk',0x0144,0xFC),
+            ('lmk',0x0144,0xFD),
+            ('lmk',0x0144,0xFF),
+            ('lmk',0x0139,0x03),
+            ('lmk',0x010E,0x70),
+            ('lmk',0x0106,0x70),
+            BARRIER,
+            ('dac',0x0124,0x00),
+            ('dac',0x0224,0x00),
+            ('dac',0x015C,0x00),
+            ('dac',0x025C,0x00),
+            BARRIER,
+            ('dac',0x040A,0xFC03),
+            ('dac',0x040A,0x7C03),
+            BARRIER,
+            ('dac',0x0000,0x5801),
+            ('dac',0x0000,0x5803),
+            BARRIER,
+            ('dac',0x0124,0x30),
+            ('dac',0x0224,0x20),
+            ('dac',0x015C,0x2),
+            ('dac',0x025C,0x3),
+            BARRIER,
+            ('dac',0x0000,0x5801),
+            ('dac',0x0000,0x5800),
+            BARRIER,
+            ('lmk',0x010E,0x71),
+            ('lmk',0x0106,0x71),
+            BARRIER,
+            ('dac',0x0128,0x0332),
+            ('dac',0x0128,0x0330),
+            ('dac',0x0228,0x0332),
+            ('dac',0x0228,0x0330),
+        ])
 
     def nco_freq_a(self, freq):
         """Set frequency of channel A's NCO.
 
         :param float freq: Frequency in MHz
         """
+        if self._batch is not None:
+            self._batch['freq_a'] = freq
+            return
         freq_bin=int(0xFFFFFFFFFFFF*freq/float(self.DAC_SAMPLING_RATE))
         self.dac.dac_write(0x011E,freq_bin%0x10000)
         self.dac.dac_write(0x011F,freq_bin%0x100000000>>16)
@@ -113,6 +186,9 @@ class DDS(object):
 
         :param float freq: Frequency in MHz
         """
+        if self._batch is not None:
+            self._batch['freq_b'] = freq
+            return
         freq_bin=int(0xFFFFFFFFFFFF*freq/float(self.DAC_SAMPLING_RATE))
         self.dac.dac_write(0x021E,freq_bin%0x10000)
         self.dac.dac_write(0x021F,freq_bin%0x100000000>>16)
@@ -128,35 +204,169 @@ class DDS(object):
     def _trigger_spi(self):
         """Trigger SPI
         """
-        self.dac.dac_write(0x0328,0x330)
-        self.dac.dac_write(0x0328,0x332)
-        self.dac.dac_write(0x0328,0x330)
+        for address, data in self.TRIGGER:
+            self.dac.dac_write(address, data)
 
-    def nco_sync(self):
+    def frequency_word(self, freq):
+        """Frequency tuning word of the NCOs.
+
+        :param float freq: Frequency in MHz
+        :return: list of the 16 bit words of the registers 0x1E, 0x1F, 0x20
+        """
+        freq_bin=int(0xFFFFFFFFFFFF*freq/float(self.DAC_SAMPLING_RATE))
+        return [freq_bin%0x10000, freq_bin%0x100000000>>16, freq_bin%0x1000000000000>>32]
+
+    def phase_word(self, deg):
+        """Phase word of the NCOs.
+
+        :param float deg: Phase in degrees
+        :return: 16 bit word of the register 0x1C
+        """
+        return int(deg/360.0*0xFFFF)
+
+    def frequency_words(self, freqs):
+        """Compute the 48 bit frequency tuning words of many frequencies in one vectorized pass.
+
+        :param freqs: frequencies in MHz, array like
+        :return: NumPy array of shape (n, 3) with the 16 bit words of the registers 0x1E, 0x1F, 0x20
+        """
+        import numpy as np
+        freq_bin = (0xFFFFFFFFFFFF*np.asarray(freqs, dtype=np.float64)/float(self.DAC_SAMPLING_RATE)).astype(np.int64)
+        return np.stack([freq_bin & 0xFFFF, (freq_bin >> 16) & 0xFFFF, (freq_bin >> 32) & 0xFFFF], axis=1)
+
+    def sweep(self, start=None, stop=None, step=None, channel='a', freqs=None, dwell=0.0):
+        """Sweep the frequency of channel A, B or both.
+
+        The tuning words of all steps are computed at once and the register traffic of every step is rendered
+        before the sweep starts. A step writes only the frequency words that change and one SPI trigger.
+
+        :param float start: first frequency in MHz
+        :param float stop: last frequency in MHz, included if on the step grid
+        :param float step: frequency step in MHz
+        :param str channel: 'a', 'b' or 'ab' for both
+        :param freqs: arbitrary frequencies in MHz instead of start, stop and step, array like
+        :param float dwell: time per step in seconds, 0 to step as fast as possible
+        :return: dictionary with steps, seconds and the achieved rate in steps per second
+        """
+        import numpy as np
+        self._outside_batch('sweep')
+        if freqs is None:
+            freqs = np.arange(start, stop + step/2.0, step)
+        steps = self._render_sweep(self.frequency_words(freqs), self.NCO_FREQ_ADR[channel])
+
+        start_time = time.perf_counter()
+        for i, (buf, updates, page) in enumerate(steps):
+            if dwell:
+                self._wait_until(start_time + i*dwell)
+            self.dac.commit_writes(buf, updates, page)
+        seconds = time.perf_counter() - start_time
+        return {'steps': len(steps), 'seconds': seconds, 'rate': len(steps)/seconds if seconds else float('inf')}
+
+    def _wait_until(self, deadline):
+        """Wait for a perf_counter deadline, sleeping first and spinning for the last millisecond.
+
+        :param float deadline: time.perf_counter() value
+        """
+        remaining = deadline - time.perf_counter()
+        if remaining > 0.002:
+            time.sleep(remaining - 0.001)
+        while time.perf_counter() < deadline:
+            pass
+
+    def _render_sweep(self, words, address):
+        """Render the register traffic of frequency steps.
+
+        :param words: tuning words as returned by :meth:`frequency_words`
+        :param int address: address of the first frequency word
+        :return: list of (buffer, shadow updates, page) for :meth:`DacCom.commit_writes`
+        """
+        dac = self.dac
+        steps = []
+        page = dac.DAC_PAGE
+        previous = None
+        for row in words.tolist():
+            writes = []
+            for i, word in enumerate(row):
+                if previous is None:
+                    if not dac.dac_unchanged(address + i, word):
+                        writes.append(('dac', address + i, word))
+                elif previous[i] != word:
+                    writes.append(('dac', address + i, word))
+            if previous is None:
+                #Path CD and the idle state of the trigger
+                writes += [('dac', address + 3 + i, 0) for i in range(3) if not dac.dac_unchanged(address + 3 + i, 0)]
+                if not dac.dac_unchanged(*self.TRIGGER[0]):
+                    writes.append(('dac',) + self.TRIGGER[0])
+            writes += [('dac',) + w for w in self.TRIGGER[1:]]
+            transactions, updates, page = dac.plan_writes(writes, force=True, page=page)
+            steps.append((dac.transport.render(transactions), updates, page))
+            previous = row
+        return steps
+
+    def nco_sync(self, arm=None):
         """Synchronize NCO's by asserting SYSREF
 
            Call this function after a frequecy change to resynchronize the phase.
+
+           The sequence is rendered once and sent in one transfer. Arming the SYSREF machinery (SYNC_ARM) is
+           skipped if it was armed before and the shadow shows the LMK04828 still in the armed state, then only
+           the SYSREF pulse (SYNC_PULSE) is sent. If instrumented, the latencies are recorded as nco_sync_arm
+           and nco_sync_pulse.
+
+           :param arm: True to always arm, False to send the pulse only, None to arm if needed
+           :return: True if SYSREF was armed
+        """
+        self._outside_batch('nco_sync')
+        if arm is None:
+            arm = not self.sync_armed()
+        start = time.perf_counter()
+        buf, updates = self._sync_buffer(arm)
+        self.dac.commit_writes(buf, updates, self.dac.DAC_PAGE)
+        if arm:
+            self._sync_armed = True
+        if self.METRICS is not None:
+            self.METRICS.observe('nco_sync_arm' if arm else 'nco_sync_pulse', time.perf_counter() - start)
+        return arm
+
+    def nco_sync_pulse(self):
+        """Synchronize NCO's with a SYSREF pulse only, see :meth:`nco_sync`.
+        """
+        self._outside_batch('nco_sync_pulse')
+        self.nco_sync(arm=False)
+
+    def sync_armed(self):
+        """True if SYSREF was armed by :meth:`nco_sync` and the shadow shows it still armed.
+
+        Always False without shadowing, the LMK04828 state is then unknown.
+        """
+        if not self.dac.SHADOW:
+            return False
+        shadow = self.dac.lmk_shadow
+        return self._sync_armed and all(shadow.get(a) == v for a, v in dict(self.SYNC_ARM).items())
+
+    def _sync_buffer(self, arm):
+        """Rendered SYSREF sequence, cached per transport.
+
+        :param bool arm: include the arming writes
+        :return: buffer and shadow updates for :meth:`DacCom.commit_writes`
         """
-        self.dac.lmk_write(0x0139,0x00)
-        self.dac.lmk_write(0x0143,0x11)
-        self.dac.lmk_write(0x0144,0x7E)
-        self.dac.lmk_write(0x0144,0x7C)
-        self.dac.lmk_write(0x0143,0x31)
-        self.dac.lmk_write(0x0143,0x11)
-        self.dac.lmk_write(0x0144,0xFC)
-        self.dac.lmk_write(0x0144,0xFD)
-        self.dac.lmk_write(0x0144,0xFF)
-        self.dac.lmk_write(0x0139,0x03)
-        self.dac.lmk_write(0x010E,0x70)
-        self.dac.lmk_write(0x0106,0x70)
-        self.dac.lmk_write(0x010E,0x71)
-        self.dac.lmk_write(0x0106,0x71)
+        transport = self.dac.transport
+        if self._sync_cache.get('transport') is not transport:
+            self._sync_cache = {'transport': transport}
+        if arm not in self._sync_cache:
+            writes = [('lmk', a, v) for a, v in (self.SYNC_ARM if arm else []) + self.SYNC_PULSE]
+            transactions, updates, page = self.dac.plan_writes(writes, force=True)
+            self._sync_cache[arm] = (transport.render(transactions), updates)
+        return self._sync_cache[arm]
 
     def nco_phase_a(self, deg):
         """Set phase of channel A's NCO.
 
         :param float deg: Phase in degrees
         """
+        if self._batch is not None:
+            self._batch['phase_a'] = deg
+            return
         phase_bin=int(deg/360.0*0xFFFF)
         self.dac.dac_write(0x011C,phase_bin)
 
@@ -167,148 +377,1857 @@ class DDS(object):
     def nco_phase_b(self, deg):
         """Set phase of channel B's NCO.
 
-        :param float deg: Phase in degrees
+        :param float deg: Phase in degrees
+        """
+        if self._batch is not None:
+            self._batch['phase_b'] = deg
+            return
+        phase_bin = int(deg/360.0*0xFFFF)
+        self.dac.dac_write(0x021C,phase_bin)
+
+        #Phase CD
+        self.dac.dac_write(0x021D,0)
+        self._trigger_spi()
+
+    def amplitude_a(self, gain):
+        """Amplitude of channel A.
+
+        :param float gain: Amplitude setting (0-2)
+
+        Above gain 1 distortions may accure. Allows 1024 steps in the gain range from 0-1.
+        """
+        if self._batch is not None:
+            self._batch['amp_a'] = gain
+            return
+        gain_hex = int(gain/2.0*(2**11-1))
+        self.dac.dac_write(0x0132, gain_hex | 0x8000) #Enable gain and choose gain
+
+    def amplitude_b(self, gain):
+        """Amplitude of channel B.
+
+        :param float gain: Amplitude setting (0-2)
+
+        Above gain 1 distortions may accure. Allows 1024 steps in the gain range from 0-1.
+        """
+        if self._batch is not None:
+            self._batch['amp_b'] = gain
+            return
+        gain_hex = int(gain/2.0*(2**11-1))
+        self.dac.dac_write(0x0232, gain_hex | 0x8000) #Enable gain and choose gain
+
+    def gain_word(self, gain):
+        """Gain word of the channels with the gain enabled.
+
+        :param float gain: Amplitude setting (0-2)
+        :return: 16 bit word of the register 0x32
+        """
+        return int(gain/2.0*(2**11-1)) | 0x8000
+
+    def gain_words(self, gains):
+        """Gain words of many amplitudes in one vectorized pass.
+
+        :param gains: Amplitude settings (0-2), array like, values outside are clipped
+        :return: NumPy array of the 16 bit words of the register 0x32 with the gain enabled
+        """
+        import numpy as np
+        gains = np.clip(np.asarray(gains, dtype=np.float64), 0.0, 2.0)
+        return (gains/2.0*(2**11-1)).astype(np.int64) | 0x8000
+
+    def envelope(self, gains_a=None, gains_b=None, dwell=0.0):
+        """Play amplitude envelopes on channel A, B or both, e.g. to shape pulses.
+
+        The gains are quantized to gain words at once and consecutive steps with the same words are dropped.
+        The register traffic is rendered before the envelope starts: a step writes only the gains that change,
+        both channels at once through the broadcast page if they are equal. Without dwell the whole envelope is
+        sent in one transfer, the steps following each other as fast as the transport clocks them out.
+
+        :param gains_a: Amplitudes of channel A per step (0-2), array like, None to leave A alone
+        :param gains_b: Amplitudes of channel B per step (0-2), array like, None to leave B alone
+        :param float dwell: time per step in seconds, 0 to step as fast as possible
+        :return: dictionary with steps, dropped duplicate steps, seconds and the achieved rate in steps per second
+        """
+        import numpy as np
+        self._outside_batch('envelope')
+        if gains_a is None and gains_b is None:
+            raise ValueError('no envelope given')
+        n = len(gains_a) if gains_a is not None else len(gains_b)
+        if gains_a is not None and gains_b is not None and len(gains_b) != n:
+            raise ValueError('envelopes of channel A and B differ in length')
+        words = np.full((n, 2), -1, dtype=np.int64) #-1 for a channel left alone
+        for i, gains in enumerate((gains_a, gains_b)):
+            if gains is not None:
+                words[:, i] = self.gain_words(gains)
+        keep = np.ones(n, dtype=bool)
+        keep[1:] = np.any(words[1:] != words[:-1], axis=1)
+        words = words[keep]
+
+        dac = self.dac
+        steps = self._envelope_writes(words)
+        start_time = time.perf_counter()
+        if dwell:
+            page = dac.DAC_PAGE
+            rendered = []
+            for writes in steps:
+                transactions, updates, page = dac.plan_writes(writes, force=True, page=page)
+                rendered.append((dac.transport.render(transactions), updates, page))
+            start_time = time.perf_counter()
+            for i, (buf, updates, page) in enumerate(rendered):
+                self._wait_until(start_time + i*dwell)
+                dac.commit_writes(buf, updates, page)
+        else:
+            transactions, updates, page = dac.plan_writes([w for writes in steps for w in writes], force=True,
+                                                          page=dac.DAC_PAGE)
+            buf = dac.transport.render(transactions)
+            start_time = time.perf_counter()
+            if transactions:
+                dac.commit_writes(buf, updates, page)
+        seconds = time.perf_counter() - start_time
+        return {'steps': len(steps), 'dropped': n - len(steps), 'seconds': seconds,
+                'rate': len(steps)/seconds if seconds else float('inf')}
+
+    def _envelope_writes(self, words):
+        """Register writes of the envelope steps.
+
+        :param words: NumPy array of shape (n, 2) with the gain words of channel A and B, -1 to leave one alone
+        :return: list of the writes of each step
+        """
+        dac = self.dac
+        previous = [dac.dac_shadow.get(0x0132) if dac.SHADOW else None,
+                    dac.dac_shadow.get(0x0232) if dac.SHADOW else None]
+        page = dac.DAC_PAGE
+        steps = []
+        for a, b in words.tolist():
+            writes = []
+            change_a = a >= 0 and a != previous[0]
+            change_b = b >= 0 and b != previous[1]
+            if change_a and change_b and a == b:
+                writes.append(('dac', 0x0332, a))
+            else:
+                if change_a:
+                    writes.append(('dac', 0x0132, a))
+                if change_b:
+                    writes.append(('dac', 0x0232, b))
+                if page == 2:
+                    writes.reverse() #start on the selected page
+            if writes:
+                page = writes[-1][1] >> 8
+            if a >= 0:
+                previous[0] = a
+            if b >= 0:
+                previous[1] = b
+            steps.append(writes)
+        return steps
+
+    def update(self, freq_a=None, freq_b=None, phase_a=None, phase_b=None, amp_a=None, amp_b=None):
+        """Set frequency, phase and amplitude of both channels at once.
+
+        All changes are written in one transfer. Registers holding the same value on both channels are written
+        once through the multi-DUC1 and multi-DUC2 broadcast page 0b011, see :meth:`DacCom.order_writes`.
+        Frequency and phase changes are applied by a single SPI trigger, so both channels update at the same
+        instant. Parameters left None are not changed.
+
+        :param float freq_a: Frequency of channel A in MHz
+        :param float freq_b: Frequency of channel B in MHz
+        :param float phase_a: Phase of channel A in degrees
+        :param float phase_b: Phase of channel B in degrees
+        :param float amp_a: Amplitude of channel A (0-2)
+        :param float amp_b: Amplitude of channel B (0-2)
+        """
+        if self._batch is not None:
+            params = {'freq_a': freq_a, 'freq_b': freq_b, 'phase_a': phase_a, 'phase_b': phase_b,
+                      'amp_a': amp_a, 'amp_b': amp_b}
+            self._batch.update((k, v) for k, v in params.items() if v is not None)
+            return
+        self.dac.write_batch(self.update_writes(freq_a, freq_b, phase_a, phase_b, amp_a, amp_b))
+
+    def update_writes(self, freq_a=None, freq_b=None, phase_a=None, phase_b=None, amp_a=None, amp_b=None,
+                      shadow=None):
+        """Register writes of :meth:`update`, without writing them.
+
+        :param shadow: DAC register values to compare against instead of the shadow, e.g. planned ones
+        :return: writes for :meth:`DacCom.write_batch`, including the SPI trigger if needed
+        """
+        regs = {}
+        for ch, freq, deg, gain in (('a', freq_a, phase_a, amp_a), ('b', freq_b, phase_b, amp_b)):
+            regs[ch] = {}
+            if freq is not None:
+                for i, word in enumerate(self.frequency_word(freq)):
+                    regs[ch][0x1E + i] = word
+                regs[ch].update({0x21: 0, 0x22: 0, 0x23: 0}) #Path CD
+            if deg is not None:
+                regs[ch][0x1C] = self.phase_word(deg)
+                regs[ch][0x1D] = 0 #Phase CD
+            if gain is not None:
+                regs[ch][0x32] = self.gain_word(gain)
+
+        writes = [('dac', page | offset, value) for page, ch in ((0x100, 'a'), (0x200, 'b'))
+                  for offset, value in sorted(regs[ch].items())]
+        writes = [w for w in writes if not self.dac.dac_unchanged(w[1], w[2], shadow)]
+
+        if any(0x1C <= address % 0x100 <= 0x23 for bus, address, value in writes):
+            writes += [BARRIER] + [('dac', address, data) for address, data in self.TRIGGER]
+        return writes
+
+    def instrument(self, metrics=None):
+        """Record counters and latencies of the DDS operations and the register I/O.
+
+            :param metrics: :class:`Metrics` to record into, a new one by default
+            :return: the :class:`Metrics`
+        """
+        if self.METRICS is not None:
+            return self.METRICS
+        metrics = self.dac.instrument(metrics)
+        for name in self.INSTRUMENTED:
+            metrics.timed(self, name)
+        self.METRICS = metrics
+        return metrics
+
+    def uninstrument(self):
+        """Stop recording, see :meth:`instrument`.
+        """
+        self.dac.uninstrument()
+        self.METRICS = None
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Collect parameter changes and apply them at once with :meth:`update`.
+
+        Inside the block, calls of nco_freq_a, nco_freq_b, nco_phase_a, nco_phase_b, amplitude_a, amplitude_b
+        and update are recorded instead of written. They are discarded if the block raises an exception.
+        nco_sync, nco_sync_pulse, sweep and envelope would write before the recorded changes and raise
+        RuntimeError inside the block, call them after it.
+
+        Example::
+
+            with dds.batch():
+                dds.nco_freq_a(100)
+                dds.nco_freq_b(100)
+                dds.nco_phase_b(90)
+        """
+        if self._batch is not None:
+            yield self
+            return
+        self._batch = {}
+        try:
+            yield self
+            pending = self._batch
+        finally:
+            self._batch = None
+        self.update(**pending)
+
+    def _outside_batch(self, name):
+        """Raise RuntimeError if a batch is open, name writes at once and would overtake the recorded changes.
+        """
+        if self._batch is not None:
+            raise RuntimeError('%s cannot be called inside batch(), call it after the block' % name)
+
+class HopTable(object):
+    """Table of frequencies and phases to hop between with constant latency.
+
+        Every entry is rendered once into a transaction buffer holding the page selection, the frequency words,
+        the phase word and the SPI trigger. All buffers have the same length and do not depend on the previous
+        register state, so a hop is a single send of a precompiled buffer.
+
+        Example::
+
+            table = HopTable(dds, [100.0, 200.0, 300.0], channel='a')
+            table.hop(2)
+            print(table.stats())
+    """
+    NCO_ADR = {'a': 0x011C, 'b': 0x021C, 'ab': 0x031C}
+
+    def __init__(self, dds, freqs, phases=None, channel='a'):
+        """Precompile the hop table.
+
+            The Path CD frequency and phase registers of the channel are cleared once here.
+
+            :param dds: :class:`DDS`
+            :param freqs: frequencies in MHz
+            :param phases: phases in degrees, zero by default
+            :param str channel: 'a', 'b' or 'ab' for both
+        """
+        self.dds = dds
+        self.channel = channel
+        dac = dds.dac
+        base = self.NCO_ADR[channel]
+        page = base >> 8
+        if phases is None:
+            phases = [0]*len(freqs)
+
+        dac.write_batch([('dac', base + 1, 0)] + [('dac', base + 5 + i, 0) for i in range(3)])
+
+        self.entries = []
+        for freq, deg in zip(freqs, phases):
+            writes = [('dac', base + 2 + i, word) for i, word in enumerate(dds.frequency_word(freq))]
+            writes.append(('dac', base, dds.phase_word(deg)))
+            writes += [('dac', address, data) for address, data in dds.TRIGGER]
+            #Select the page explicitly, the buffer must not depend on the page left by the previous access
+            transactions, updates, last_page = dac.plan_writes(writes, force=True, page=None)
+            self.entries.append((dac.transport.render(transactions), updates, last_page))
+        self.latencies = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def hop(self, index):
+        """Hop to an entry of the table.
+
+            :param int index: entry index
+            :return: latency of the hop in seconds
+        """
+        buf, updates, page = self.entries[index]
+        start = time.perf_counter()
+        self.dds.dac.commit_writes(buf, updates, page)
+        latency = time.perf_counter() - start
+        self.latencies.append(latency)
+        return latency
+
+    def stats(self):
+        """Latency statistics of the hops so far.
+
+            :return: dictionary with count, min, max, mean, std, median, p99 and jitter (max - min) in seconds
+        """
+        n = len(self.latencies)
+        if n == 0:
+            return {'count': 0}
+        ordered = sorted(self.latencies)
+        mean = sum(ordered)/n
+        return {
+            'count': n,
+            'min': ordered[0],
+            'max': ordered[-1],
+            'mean': mean,
+            'std': (sum((x - mean)**2 for x in ordered)/n)**0.5,
+            'median': ordered[n//2],
+            'p99': ordered[min(n - 1, int(0.99*n))],
+            'jitter': ordered[-1] - ordered[0],
+        }
+
+    def reset_stats(self):
+        """Forget the recorded latencies.
+        """
+        self.latencies = []
+
+class ConfigurationError(ValueError):
+    """Read back values of a configuration do not correspond to the set values.
+
+        The attribute mismatches lists all of them as (bus, address, set value, read value).
+    """
+    def __init__(self, mismatches):
+        self.mismatches = mismatches
+        lines = ['%s\t%s\t%s\t%s' % (bus, hex(adr), hex(value), hex(read)) for bus, adr, value, read in mismatches]
+        ValueError.__init__(self, 'Configuration, %d set values not equal to read back values:\n' % len(mismatches)
+                            + '\n'.join(lines))
+
+class Metrics(object):
+    """Counters and latency histograms of the register I/O.
+
+        Installed by :meth:`DDS.instrument` or :meth:`DacCom.instrument`, which wrap the methods of the instances.
+        Nothing is wrapped while instrumentation is off, so it costs nothing.
+
+        Counters: port_flush, usb_write, read_port, usb_exchange, set_direction, bytes_written, bytes_read and
+        page_switch (DAC page register writes issued or planned). An exchange, writing port states and returning
+        their samples in one transfer, also counts as read_port. Latencies are recorded per operation in histograms with
+        buckets doubling from 1 us to about 1 s.
+    """
+    BUCKETS = tuple(1e-6*2**i for i in range(21))
+
+    def __init__(self):
+        self._installed = []
+        self.reset()
+
+    def reset(self):
+        """Set all counters and histograms to zero.
+        """
+        self.counters = collections.Counter()
+        self.histograms = {} #operation -> [bucket counts, sum of seconds]
+
+    def count(self, name, n=1):
+        """Add to a counter.
+
+            :param str name: counter
+            :param int n: increment
+        """
+        self.counters[name] += n
+
+    def observe(self, name, seconds):
+        """Record the latency of an operation.
+
+            :param str name: operation
+            :param float seconds: latency
+        """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = [[0]*(len(self.BUCKETS) + 1), 0.0]
+        histogram[0][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        histogram[1] += seconds
+
+    def install(self, obj, name, wrapper):
+        """Replace a method of an instance by a wrapper, undone by :meth:`uninstall`.
+
+            :param obj: instance
+            :param str name: method name
+            :param wrapper: callable(function) returning the replacement
+        """
+        previous = obj.__dict__.get(name)
+        replacement = wrapper(getattr(obj, name))
+        setattr(obj, name, replacement)
+        self._installed.append((obj, name, previous, replacement))
+
+    def timed(self, obj, name, operation=None):
+        """Record the latency of every call of a method.
+
+            :param obj: instance
+            :param str name: method name
+            :param str operation: histogram name, defaults to the method name
+        """
+        operation = operation or name
+        perf_counter = time.perf_counter
+        def wrapper(function):
+            def timed_call(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(operation, perf_counter() - start)
+            return timed_call
+        self.install(obj, name, wrapper)
+
+    def counted(self, obj, name, counter, size=None, size_counter='bytes_written'):
+        """Count the calls of a method.
+
+            :param obj: instance
+            :param str name: method name
+            :param str counter: counter name
+            :param size: callable(args) returning bytes transferred, added to the counter size_counter
+            :param str size_counter: counter of the bytes transferred
+        """
+        counters = self.counters
+        def wrapper(function):
+            def counted_call(*args, **kwargs):
+                counters[counter] += 1
+                if size is not None:
+                    counters[size_counter] += size(args)
+                return function(*args, **kwargs)
+            return counted_call
+        self.install(obj, name, wrapper)
+
+    def exchanged(self, obj, name, counter='usb_exchange', read_counter='read_port'):
+        """Count the calls of a method writing a buffer and returning the bytes read in the same transfer.
+
+            :param obj: instance
+            :param str name: method name
+            :param str counter: counter of the calls
+            :param str read_counter: counter of the read transactions, also counting the calls
+        """
+        counters = self.counters
+        def wrapper(function):
+            def exchanged_call(data, *args, **kwargs):
+                counters[counter] += 1
+                counters[read_counter] += 1
+                counters['bytes_written'] += len(data)
+                result = function(data, *args, **kwargs)
+                counters['bytes_read'] += len(result)
+                return result
+            return exchanged_call
+        self.install(obj, name, wrapper)
+
+    def uninstall(self):
+        """Restore all wrapped methods.
+
+            A method wrapped again by someone else after :meth:`install` keeps its wrappers.
+        """
+        for obj, name, previous, replacement in reversed(self._installed):
+            if obj.__dict__.get(name) is not replacement:
+                continue
+            if previous is None:
+                delattr(obj, name)
+            else:
+                setattr(obj, name, previous)
+        self._installed = []
+
+    def snapshot(self):
+        """Current counters and latency histograms.
+
+            :return: dictionary with 'counters' by name and 'latency' by operation, each with count, sum of seconds
+                     and the cumulative bucket counts as list of (upper bound in seconds, count)
+        """
+        latency = {}
+        for name, (buckets, total) in self.histograms.items():
+            cumulative = []
+            n = 0
+            for bound, c in zip(self.BUCKETS + (float('inf'),), buckets):
+                n += c
+                cumulative.append((bound, n))
+            latency[name] = {'count': n, 'sum': total, 'buckets': cumulative}
+        return {'counters': dict(self.counters), 'latency': latency}
+
+    def prometheus(self, prefix='pydualdds'):
+        """Metrics in the Prometheus text exposition format.
+
+            :param str prefix: metric name prefix
+            :return: text
+        """
+        snapshot = self.snapshot()
+        lines = ['# TYPE %s_io_total counter' % prefix]
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append('%s_io_total{event="%s"} %d' % (prefix, name, value))
+        lines.append('# TYPE %s_latency_seconds histogram' % prefix)
+        for name, histogram in sorted(snapshot['latency'].items()):
+            for bound, n in histogram['buckets']:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('%s_latency_seconds_bucket{op="%s",le="%s"} %d' % (prefix, name, le, n))
+            lines.append('%s_latency_seconds_sum{op="%s"} %r' % (prefix, name, histogram['sum']))
+            lines.append('%s_latency_seconds_count{op="%s"} %d' % (prefix, name, histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, file_name, prefix='pydualdds'):
+        """Write the metrics for the textfile collector of the Prometheus node exporter.
+
+            The file is replaced atomically.
+
+            :param str file_name: path of the .prom file
+            :param str prefix: metric name prefix
+        """
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_name)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.prometheus(prefix))
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, file_name)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+class SpiRecorder(object):
+    """Recorder of the logical SPI transactions issued by :class:`DacCom`.
+
+        Every transaction is kept in a ring buffer of the last RING records, the flight recorder, and appended
+        to a binary log file if one is given. A record is (timestamp, bus, read, page, address, value) with
+        bus 'dac' or 'lmk', read True for reads, the DAC page selected and the address without page. Resets of
+        the DAC are recorded with bus 'reset'.
+
+        The log file starts with MAGIC followed by records packed as RECORD: timestamp in seconds since the
+        epoch, flags (bit 0 LMK, bit 1 read, bit 2 reset), page, address, value.
+    """
+    MAGIC = b'PDDSREC1'
+    RECORD = struct.Struct('<dBBHH')
+    FLAG_LMK = 1
+    FLAG_READ = 2
+    FLAG_RESET = 4
+
+    def __init__(self, file_name=None, ring=4096):
+        """
+            :param str file_name: binary log file, appended to if it exists
+            :param int ring: number of records kept in memory
+        """
+        self.RING = ring
+        self.ring = collections.deque(maxlen=ring)
+        self.file = None
+        if file_name is not None:
+            self.file = open(file_name, 'ab')
+            if self.file.tell() == 0:
+                self.file.write(self.MAGIC)
+
+    def record(self, bus, read, page, address, value, timestamp=None):
+        """Record a transaction.
+
+            :param str bus: 'dac', 'lmk' or 'reset'
+            :param bool read: True for a read
+            :param int page: DAC page selected
+            :param int address: address without page
+            :param int value: value written or read
+            :param float timestamp: time of the transaction, now by default
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        self.ring.append((timestamp, bus, read, page, address, value))
+        if self.file is not None:
+            self.file.write(self.pack(timestamp, bus, read, page, address, value))
+
+    @classmethod
+    def pack(cls, timestamp, bus, read, page, address, value):
+        """Pack a record for the log file.
+
+            :return: bytes
+        """
+        flags = (cls.FLAG_LMK if bus == 'lmk' else 0) | (cls.FLAG_READ if read else 0) \
+            | (cls.FLAG_RESET if bus == 'reset' else 0)
+        return cls.RECORD.pack(timestamp, flags, page, address, value)
+
+    @classmethod
+    def read_log(cls, file_name):
+        """Read the records of a log file.
+
+            :param str file_name: binary log file
+            :return: list of (timestamp, bus, read, page, address, value)
+        """
+        with open(file_name, 'rb') as f:
+            data = f.read()
+        if not data.startswith(cls.MAGIC):
+            raise ValueError('%s is not a SPI transaction log' % file_name)
+        records = []
+        end = len(data) - (len(data) - len(cls.MAGIC)) % cls.RECORD.size #an interrupted write leaves a partial record
+        for timestamp, flags, page, address, value in cls.RECORD.iter_unpack(data[len(cls.MAGIC):end]):
+            if flags & cls.FLAG_RESET:
+                bus = 'reset'
+            else:
+                bus = 'lmk' if flags & cls.FLAG_LMK else 'dac'
+            records.append((timestamp, bus, bool(flags & cls.FLAG_READ), page, address, value))
+        return records
+
+    def records(self):
+        """Records of the ring buffer, oldest first.
+
+            :return: list of (timestamp, bus, read, page, address, value)
+        """
+        return list(self.ring)
+
+    def dump(self, file_name):
+        """Write the ring buffer to a log file, e.g. after a failure.
+
+            :param str file_name: binary log file, overwritten
+        """
+        with open(file_name, 'wb') as f:
+            f.write(self.MAGIC)
+            for r in self.ring:
+                f.write(self.pack(*r))
+
+    def flush(self):
+        """Write buffered records to the log file.
+        """
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        """Close the log file.
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class CompiledConfig(object):
+    """Configuration file compiled into typed (address, value) arrays for the LMK04828 and the DAC.
+
+        Compiled configurations are cached on disk in CACHE_DIR, keyed by the path and the modification time of
+        the configuration file, and memory-mapped when loaded. Wire streams of the whole configuration rendered by
+        a transport are stored alongside, so a later :meth:`DacCom.configure` skips parsing and rendering.
+    """
+    CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'pydualdds')
+    MAGIC = b'PDDSCFG1' + (b'L' if sys.byteorder == 'little' else b'B')
+    HEADER = struct.Struct('<qqII')
+
+    def __init__(self, lmk_adr, lmk_value, dac_adr, dac_value, wires=None, cache=None, key=None):
+        """
+            :param lmk_adr: LMK04828 addresses, typed array
+            :param lmk_value: LMK04828 values, typed array
+            :param dac_adr: DAC addresses with page prefix, typed array
+            :param dac_value: DAC values, typed array
+            :param dict wires: rendered wire streams by transport
+            :param str cache: path of the cache file, None to not cache
+            :param tuple key: (mtime, size) of the configuration file
+        """
+        self.lmk_adr = lmk_adr
+        self.lmk_value = lmk_value
+        self.dac_adr = dac_adr
+        self.dac_value = dac_value
+        self.wires = wires if wires is not None else {}
+        self.cache = cache
+        self.key = key
+
+    @classmethod
+    def parse(cls, file_name):
+        """Parse a TI style configuration file in one pass.
+
+            The LMK04828 registers precede the line DAC_RESET, the DAC registers follow the line DAC38RF8x.
+
+            :param str file_name: Path to the configuration file
+            :return: :class:`CompiledConfig`
+        """
+        lmk_adr, lmk_value = array.array('H'), array.array('H')
+        dac_adr, dac_value = array.array('H'), array.array('H')
+        section = 'lmk'
+        with open(file_name,'r') as f:
+            for line in f:
+                d = line.strip().split()
+                if 'DAC_RESET' in d:
+                    section = None
+                elif 'DAC38RF8x' in d:
+                    section = 'dac'
+                elif len(d)>1 and section == 'lmk':
+                    lmk_adr.append(int(d[0],16))
+                    lmk_value.append(int(d[1],16))
+                elif len(d)>1 and section == 'dac':
+                    dac_adr.append(int(d[0],16))
+                    dac_value.append(int(d[1],16))
+        return cls(lmk_adr, lmk_value, dac_adr, dac_value)
+
+    @classmethod
+    def cache_path(cls, file_name, cache_dir=None):
+        """Path of the cache file of a configuration file.
+
+            :param str file_name: Path to the configuration file
+            :param str cache_dir: cache directory, defaults to CACHE_DIR
+        """
+        name = hashlib.sha1(os.path.abspath(file_name).encode('utf-8')).hexdigest()
+        return os.path.join(cache_dir or cls.CACHE_DIR, name + '.cfgc')
+
+    @classmethod
+    def load(cls, file_name, cache_dir=None):
+        """Load a configuration file, from the cache if it is up to date.
+
+            :param str file_name: Path to the configuration file
+            :param str cache_dir: cache directory, defaults to CACHE_DIR
+            :return: :class:`CompiledConfig`
+        """
+        st = os.stat(file_name)
+        key = (st.st_mtime_ns, st.st_size)
+        cache = cls.cache_path(file_name, cache_dir)
+        try:
+            with open(cache, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            config = cls.from_buffer(mm, key)
+        except (OSError, ValueError, TypeError, struct.error):
+            config = None
+        if config is None:
+            config = cls.parse(file_name)
+            config.key = key
+            config.cache = cache
+            config.save()
+        else:
+            config.cache = cache
+        return config
+
+    @classmethod
+    def from_buffer(cls, buf, key):
+        """Map a compiled configuration onto a buffer.
+
+            :param buf: cache file contents, e.g. a mmap
+            :param tuple key: expected (mtime, size) of the configuration file
+            :return: :class:`CompiledConfig`, None if the buffer is stale or truncated
+        """
+        view = memoryview(buf)
+        n = len(cls.MAGIC)
+        if len(view) < n + cls.HEADER.size or bytes(view[:n]) != cls.MAGIC:
+            return None
+        mtime, size, n_lmk, n_dac = cls.HEADER.unpack_from(view, n)
+        if (mtime, size) != key:
+            return None
+        offset = n + cls.HEADER.size
+        arrays = []
+        for count in (n_lmk, n_lmk, n_dac, n_dac):
+            if offset + 2*count > len(view):
+                return None
+            arrays.append(view[offset:offset + 2*count].cast('H'))
+            offset += 2*count
+        wires = {}
+        entry = struct.Struct('<HQ')
+        while offset < len(view):
+            if offset + entry.size > len(view):
+                return None
+            name_len, data_len = entry.unpack_from(view, offset)
+            offset += entry.size
+            if offset + name_len + data_len > len(view):
+                return None
+            name = bytes(view[offset:offset + name_len]).decode('ascii')
+            offset += name_len
+            wires[name] = view[offset:offset + data_len]
+            offset += data_len
+        return cls(*arrays, wires=wires, key=key)
+
+    def save(self):
+        """Write the compiled configuration and its wire streams to the cache file.
+
+            Failures to write the cache are ignored, the configuration is then compiled again next time.
+        """
+        if self.cache is None or self.key is None:
+            return
+        out = bytearray(self.MAGIC)
+        out += self.HEADER.pack(self.key[0], self.key[1], len(self.lmk_adr), len(self.dac_adr))
+        for a in (self.lmk_adr, self.lmk_value, self.dac_adr, self.dac_value):
+            out += array.array('H', a).tobytes()
+        for name, data in sorted(self.wires.items()):
+            name = name.encode('ascii')
+            out += struct.pack('<HQ', len(name), len(data)) + name + bytes(data)
+        try:
+            os.makedirs(os.path.dirname(self.cache), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.cache), suffix='.tmp')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(out)
+            os.replace(tmp, self.cache)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def wire(self, name):
+        """Rendered wire stream of the whole configuration.
+
+            :param str name: wire format of the transport, see :attr:`Transport.WIRE`
+            :return: bytes, None if not rendered yet
+        """
+        data = self.wires.get(name)
+        return bytes(data) if data is not None else None
+
+    def store_wire(self, name, buf):
+        """Store a rendered wire stream of the whole configuration in the cache.
+
+            :param str name: wire format of the transport
+            :param bytes buf: rendered stream
+        """
+        self.wires[name] = bytes(buf)
+        self.save()
+
+    def expected(self):
+        """Register values expected after the configuration.
+
+            The last value written to a register is the expected one. Register 0 of the DAC has self clearing bits
+            and is left out.
+
+            :return: dictionary (bus, address) -> value
+        """
+        expected = {}
+        for bus, adr, value in self.writes():
+            if not (bus == 'dac' and adr == 0):
+                expected[(bus, adr)] = value
+        return expected
+
+    def writes(self):
+        """All register writes of the configuration, the LMK04828 first.
+
+            :return: list of (bus, address, value)
+        """
+        return ([('lmk', a, v) for a, v in zip(self.lmk_adr, self.lmk_value)]
+                + [('dac', a, v) for a, v in zip(self.dac_adr, self.dac_value)])
+
+    def lmk_config(self):
+        """LMK04828 configuration as list of {'adr', 'value'} dictionaries.
+        """
+        return [{'adr': a, 'value': v} for a, v in zip(self.lmk_adr, self.lmk_value)]
+
+    def dac_config(self):
+        """DAC configuration as list of {'adr', 'value'} dictionaries.
+        """
+        return [{'adr': a, 'value': v} for a, v in zip(self.dac_adr, self.dac_value)]
+
+class PlannedUpdates(list):
+    """Shadow updates returned by :meth:`DacCom.plan_writes`.
+
+        The attribute page_writes holds the number of DAC page changes the planned transactions contain,
+        counted as page_switch by :meth:`DacCom.commit_writes` when instrumented. The attribute start_page holds
+        the DAC page the transactions rely on being selected before them, None if they select their own.
+    """
+    page_writes = 0
+    start_page = None
+
+class DacCom(object):
+    DAC_PAGES = (0b001, 0b010, 0b100)
+
+    #Registers with self clearing bits or status, never elided nor served from the shadow: DAC reset and the
+    #JESD alarm registers 0x64-0x6D of the DUC pages, cleared by writing
+    DAC_VOLATILE = frozenset([0x0000] + [page << 8 | a for page in (0b001, 0b010, 0b011) for a in range(0x64, 0x6E)])
+    LMK_VOLATILE = frozenset([0x000, 0x002] + list(range(0x182, 0x18A)))
+
+    #Registers set at run time by DDS: NCO frequency and phase, SPI trigger, gain
+    DAC_RUNTIME = frozenset(list(range(0x011C, 0x0124)) + list(range(0x021C, 0x0224))
+                            + [0x0128, 0x0228, 0x0132, 0x0232])
+
+    #Members of DacCom before the transports, now served by the transport, see :meth:`__getattr__`
+    TRANSPORT_MEMBERS = frozenset(['gpio', 'gpio_dac', 'set_bit', 'set_bit_on_port', 'port_flush',
+                                   'LMK_SCK', 'LMK_SDIO', 'LMK_SDO', 'LMK_CS',
+                                   'DAC_SCK', 'DAC_SDIO', 'DAC_SDO', 'DAC_SDENB'])
+
+    def __init__(self, config = "./config/PLL_M9N5Ref1228_8MHz_PLLlock.cfg", transport = None):
+        """Initialize the communication with the DAC card.
+
+            Neither the configuration file nor the FTDI interfaces are touched here: the configuration is loaded
+            on first use and the default transport opened by the first register access or :meth:`connect`.
+
+            :param str config: Path to configuration file
+            :param transport: SPI transport, defaults to :class:`BitBangTransport`
+        """
+        self.CONFIG_FILE = config
+        self._config = None
+        self._lmk_config = None
+        self._dac_config = None
+        self._dac_configured = None
+        self._transport = transport
+
+        self.DAC_PAGE_ADR = 0x09
+        self.DAC_PAGE = 0 #keep track of register pages to speed up communication
+
+        self.DEBUG = True
+
+        #Shadow copies of the registers written or read, keyed by address (DAC addresses with single page prefix)
+        self.SHADOW = True #skip writes of unchanged values and serve reads from the shadow
+        self.dac_shadow = {}
+        self.lmk_shadow = {}
+
+        self.METRICS = None #Metrics while instrumented
+        self.RECORDER = None #SpiRecorder while recording
+
+    @property
+    def CONFIG(self):
+        """The :class:`CompiledConfig`, loaded on first use.
+        """
+        if self._config is None:
+            self._config = CompiledConfig.load(self.CONFIG_FILE)
+        return self._config
+
+    @property
+    def LMK_CONFIG(self):
+        """LMK04828 configuration as list of {'adr', 'value'} dictionaries, built on first use.
+        """
+        if self._lmk_config is None:
+            self._lmk_config = self.CONFIG.lmk_config()
+        return self._lmk_config
+
+    @property
+    def DAC_CONFIG(self):
+        """DAC configuration as list of {'adr', 'value'} dictionaries, built on first use.
+        """
+        if self._dac_config is None:
+            self._dac_config = self.CONFIG.dac_config()
+        return self._dac_config
+
+    def dac_cacheable(self, address):
+        """Check if a value read from a DAC register may be kept in the shadow.
+
+            Only registers written before or by the configuration are cached, other registers may be status.
+
+            :param int address: Address of register with page prefix
+            :return: True if the value may be cached
+        """
+        if address in self.DAC_VOLATILE or len(self.dac_shadow_keys(address)) != 1:
+            return False
+        if self._dac_configured is None:
+            self._dac_configured = frozenset(k for bus, adr in self.CONFIG.expected() if bus == 'dac'
+                                             for k in self.dac_shadow_keys(adr))
+        return address in self.dac_shadow or address in self._dac_configured
+
+    @property
+    def transport(self):
+        """The SPI transport, the default :class:`BitBangTransport` is opened on first use.
+        """
+        if self._transport is None:
+            self._transport = BitBangTransport()
+        return self._transport
+
+    @transport.setter
+    def transport(self, transport):
+        self._transport = transport
+
+    def __getattr__(self, name):
+        """Forward the members of TRANSPORT_MEMBERS to the transport, e.g. dac.gpio or dac.port_flush().
+
+            They exist only on transports driving the port directly, such as :class:`BitBangTransport`.
+        """
+        if name in self.TRANSPORT_MEMBERS:
+            return getattr(self.transport, name)
+        raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+    @property
+    def PORT(self):
+        """Output port state of the transport, see :attr:`BitBangTransport.PORT`.
+        """
+        return self.transport.PORT
+
+    @PORT.setter
+    def PORT(self, port):
+        self.transport.PORT = port
+
+    @property
+    def connected(self):
+        """True if the transport is open.
+        """
+        return self._transport is not None
+
+    def connect(self):
+        """Load the configuration and open the transport now instead of on first use.
+
+            :return: self
+        """
+        self.CONFIG
+        self.transport
+        return self
+
+    def dac_reset(self):
+        """Reset the DAC
+
+            The DAC registers return to their defaults, the DAC shadow is invalidated.
+        """
+        self.transport.dac_reset()
+        self.DAC_PAGE = 0
+        self.shadow_invalidate(lmk=False)
+        if self.RECORDER is not None:
+            self.RECORDER.record('reset', False, 0, 0, 0)
+
+    def shadow_invalidate(self, dac=True, lmk=True):
+        """Forget the shadow copies of the registers.
+
+            :param bool dac: invalidate the DAC shadow
+            :param bool lmk: invalidate the LMK04828 shadow
+        """
+        if dac:
+            self.dac_shadow.clear()
+        if lmk:
+            self.lmk_shadow.clear()
+
+    def shadow_resync(self):
+        """Invalidate the shadow and read back all registers of the configuration into it.
+        """
+        self.shadow_invalidate()
+        for d in self.LMK_CONFIG:
+            self.lmk_read(d['adr'], cached=False)
+        for d in self.DAC_CONFIG:
+            self.dac_read(d['adr'], cached=False)
+
+    def dac_shadow_keys(self, address):
+        """Shadow keys written by a DAC address, one per page selected by its page prefix.
+
+            :param int address: Address of register with page prefix, e.g. 0x0328
+            :return: list of addresses with single page prefix, e.g. [0x0128, 0x0228]
+        """
+        page = address >> 8
+        address_without_page = address % 0x100
+        if page == 0:
+            return [address_without_page]
+        return [(p << 8) | address_without_page for p in self.DAC_PAGES if page & p]
+
+    def lmk_configure(self):
+        """Configure the LMK04828 clock cleaner from the provided configuration file
+
+            :raises ValueError: if the read value does not correspond to the set value
+        """
+
+        if self.DEBUG:
+            print("Adr:\tSet:\tRead:")
+        for d in self.LMK_CONFIG:
+            self.lmk_write(d['adr'],d['value'], force=True)
+            read_back =self.lmk_read(d['adr'], cached=False)
+            if self.DEBUG:
+                print(str(d['adr'])+ "\t" + str(d['value']) +'\t'+str(read_back) )
+            if read_back!=d['value']:
+                raise ValueError('LMK configuration, set value not equal to read back value')
+
+    def dac_configure(self):
+        """Configure the DAC from the provided configuration file.
+
+            :raises ValueError: if the read value does not correspond to the set value
+        """
+        if self.DEBUG:
+            print("Adr:\tSet:\tRead:")
+        for i in range(len(self.DAC_CONFIG)):
+            d = self.DAC_CONFIG[i]
+            self.dac_write(d['adr'],d['value'], force=True)
+            read_back =self.dac_read(d['adr'], cached=False)
+            if self.DEBUG:
+                print(str(hex(d['adr']))+ "\t" + str(hex(d['value'])) +'\t'+str(hex(read_back)) )
+            if read_back!=d['value'] and d['adr']!=0:
+                raise ValueError('DAC configuration, set value not equal to read back value')
+
+    def configure(self, verify='full', samples=16):
+        """Configure the LMK04828 and the DAC from the provided configuration file in bulk.
+
+            All registers are written in large batched transfers, the LMK04828 first. The read back
+            verification runs afterwards in one pass and reports all mismatches together.
+
+            :param str verify: 'full' reads back every register, 'sampled' a random subset of each device, 'off' none
+            :param int samples: number of registers per device verified in 'sampled' mode
+            :raises ConfigurationError: if read values do not correspond to the set values
+        """
+        writes = self.CONFIG.writes()
+        lmk = [w for w in writes if w[0] == 'lmk']
+        dac = [w for w in writes if w[0] == 'dac']
+        transactions, updates, page = self.plan_writes(self.order_writes(lmk + [BARRIER] + dac), force=True)
+        wire = self.transport.WIRE
+        if wire:
+            #the stream is only valid for the very same transactions
+            wire += '-' + hashlib.sha1(repr(transactions).encode('ascii')).hexdigest()[:16]
+        buf = self.CONFIG.wire(wire) if wire else None
+        if buf is None:
+            buf = self.transport.render(transactions)
+            if wire:
+                self.CONFIG.store_wire(wire, buf)
+        self.commit_writes(buf, updates, page)
+
+        expected = self.CONFIG.expected()
+        if verify == 'off':
+            return
+        elif verify == 'sampled':
+            checks = []
+            for device in ('lmk', 'dac'):
+                keys = [k for k in expected if k[0] == device]
+                checks += random.sample(keys, min(samples, len(keys)))
+        elif verify == 'full':
+            checks = list(expected)
+        else:
+            raise ValueError("verify must be 'full', 'sampled' or 'off'")
+
+        read_back = self.read_batch(checks, cached=False)
+        if self.DEBUG:
+            print("Bus:\tAdr:\tSet:\tRead:")
+            for (bus, adr), value in zip(checks, read_back):
+                print(bus + "\t" + hex(adr) + "\t" + hex(expected[(bus, adr)]) + "\t" + hex(value))
+        mismatches = [(bus, adr, expected[(bus, adr)], value) for (bus, adr), value in zip(checks, read_back)
+                      if value != expected[(bus, adr)]]
+        if mismatches:
+            raise ConfigurationError(mismatches)
+
+    def config_deltas(self):
+        """Read back the configured registers in bulk and compare them with the configuration.
+
+            Registers set at run time by :class:`DDS` (DAC_RUNTIME) are read into the shadow but not compared,
+            so a running board keeps its frequencies, phases and amplitudes.
+
+            :return: list of (bus, address, set value, read value) of the registers that differ
+        """
+        expected = self.CONFIG.expected()
+        checks = list(expected)
+        read_back = self.read_batch(checks, cached=False)
+        return [(bus, adr, expected[(bus, adr)], value) for (bus, adr), value in zip(checks, read_back)
+                if value != expected[(bus, adr)] and not (bus == 'dac' and adr in self.DAC_RUNTIME)]
+
+    def warm_configure(self):
+        """Configure a running board by writing only the registers that differ from the configuration.
+
+            The DAC is not reset.
+
+            :return: list of (bus, address, set value, read value) of the registers that were written
+        """
+        deltas = self.config_deltas()
+        self.write_batch([(bus, adr, value) for bus, adr, value, read in deltas], force=True)
+        return deltas
+
+    def read_lmk_config(self, file_name):
+        """Read the configuration file and extract the LMK04828 data from it.
+
+            :param str file_name: Path to the configuration file
+            :return: LMK04828 configuration dictionary
+        """
+        return CompiledConfig.parse(file_name).lmk_config()
+
+    def read_dac_config(self, file_name):
+        """Read the configuration file and extract the DAC data from it.
+
+            :param str file_name: Path to the configuration file
+            :return: DAC configuration dictionary
+        """
+        return CompiledConfig.parse(file_name).dac_config()
+
+    def dac_unchanged(self, address, data, shadow=None):
+        """Check if the shadow shows a DAC register already holds a value.
+
+            :param int address: Address of register with page prefix
+            :param int data: value
+            :param shadow: mapping to check instead of the DAC shadow
+            :return: True if the write can be skipped
+        """
+        if not self.SHADOW or address in self.DAC_VOLATILE:
+            return False
+        if shadow is None:
+            shadow = self.dac_shadow
+        return all(shadow.get(k) == data for k in self.dac_shadow_keys(address))
+
+    def lmk_unchanged(self, address, data, shadow=None):
+        """Check if the shadow shows a LMK04828 register already holds a value.
+
+            :param int address: Address of register
+            :param int data: value
+            :param shadow: mapping to check instead of the LMK04828 shadow
+            :return: True if the write can be skipped
+        """
+        if not self.SHADOW or address in self.LMK_VOLATILE:
+            return False
+        if shadow is None:
+            shadow = self.lmk_shadow
+        return shadow.get(address) == data
+
+    def write_batch(self, writes, force=False, reorder=True):
+        """Write many registers of both devices in as few transfers as the transport allows.
+
+            :param writes: sequence of (bus, address, data) with bus 'dac' (address with page prefix) or 'lmk',
+                and BARRIER separating writes that must stay in order
+            :param bool force: write even if the shadow holds the value
+            :param bool reorder: group the writes by DAC page with :meth:`order_writes`, else keep their order
+        """
+        if reorder:
+            writes = self.order_writes(writes, self.DAC_PAGE)
+        else:
+            writes = [w for w in writes if w is not BARRIER]
+        transactions, updates, page = self.plan_writes(writes, force, self.DAC_PAGE)
+        if transactions:
+            self.commit_writes(self.transport.render(transactions), updates, page)
+
+    def order_writes(self, writes, page=None):
+        """Reorder register writes to minimize DAC page changes.
+
+            BARRIERs split the writes into segments which keep their order. Within a segment writes to different
+            registers are assumed to commute:
+
+            * the LMK04828 writes come first, in their original order,
+            * writes to a multi-DUC1 register and its multi-DUC2 twin with the same sequence of values are merged
+              into writes to the broadcast page 0b011,
+            * the DAC writes are grouped by page, writes to the same register keep their order.
+
+            :param writes: sequence of (bus, address, data) and BARRIERs
+            :param int page: DAC page selected before the writes, None if unknown
+            :return: list of (bus, address, data)
+        """
+        ordered = []
+        segment = []
+        for w in list(writes) + [BARRIER]:
+            if w is not BARRIER:
+                segment.append(w)
+                continue
+            ordered += [x for x in segment if x[0] == 'lmk']
+            dac = self._merge_duc_writes([x for x in segment if x[0] == 'dac'])
+            while dac:
+                blocked = set()
+                pick = 0
+                for i, x in enumerate(dac):
+                    keys = set(self.dac_shadow_keys(x[1]))
+                    if x[1] >> 8 == page and not keys & blocked:
+                        pick = i
+                        break
+                    blocked |= keys
+                ordered.append(dac.pop(pick))
+                page = ordered[-1][1] >> 8
+            segment = []
+        return ordered
+
+    def _merge_duc_writes(self, writes):
+        """Merge writes to multi-DUC1 and multi-DUC2 registers with equal value sequences into broadcast writes.
+
+            :param writes: DAC writes of one segment
+            :return: list of DAC writes
+        """
+        sequences = collections.defaultdict(list)
+        for bus, address, data in writes:
+            sequences[address].append(data)
+        merged = set()
+        for address in sequences:
+            offset = address % 0x100
+            if address >> 8 != 0b001 or sequences[address] != sequences.get(0x200 | offset):
+                continue
+            #any other write touching one of the two registers keeps them apart
+            if not any(a % 0x100 == offset and a >> 8 & 0b011 and a >> 8 not in (0b001, 0b010) for a in sequences):
+                merged.add(offset)
+        result = []
+        for bus, address, data in writes:
+            if address % 0x100 in merged and address >> 8 in (0b001, 0b010):
+                if address >> 8 == 0b001:
+                    result.append((bus, 0x300 | address % 0x100, data))
+            else:
+                result.append((bus, address, data))
+        return result
+
+    def plan_writes(self, writes, force=False, page=None):
+        """Turn register writes into transport transactions, inserting DAC page changes and skipping unchanged values.
+
+            :param writes: sequence of (bus, address, data) with bus 'dac' (address with page prefix) or 'lmk'
+            :param bool force: write even if the shadow holds the value
+            :param int page: DAC page selected before the writes, None if unknown
+            :return: transactions for :meth:`Transport.render`, shadow updates, DAC page selected afterwards
+        """
+        transactions = []
+        updates = PlannedUpdates()
+        #Values planned so far take precedence over the shadow
+        dac_planned = collections.ChainMap({}, self.dac_shadow)
+        lmk_planned = collections.ChainMap({}, self.lmk_shadow)
+        for bus, address, data in writes:
+            if bus == 'dac':
+                if not force and self.dac_unchanged(address, data, dac_planned):
+                    continue
+                if address >> 8 != page:
+                    page = address >> 8
+                    transactions.append(('dac', self.DAC_PAGE_ADR, page))
+                    updates.page_writes += 1
+                elif updates.page_writes == 0:
+                    updates.start_page = page
+                transactions.append(('dac', address % 0x100, data))
+                for k in self.dac_shadow_keys(address):
+                    dac_planned[k] = data
+            else:
+                if not force and self.lmk_unchanged(address, data, lmk_planned):
+                    continue
+                transactions.append(('lmk', address, data))
+                lmk_planned[address] = data
+            updates.append((bus, address, data))
+        return transactions, updates, page
+
+    def commit_writes(self, buf, updates, page):
+        """Send a rendered buffer and record its effect.
+
+            The page the buffer starts on is selected first if another page was selected since it was planned.
+
+            :param buf: buffer rendered by the transport from :meth:`plan_writes`
+            :param updates: shadow updates from :meth:`plan_writes`
+            :param int page: DAC page selected after the buffer
+        """
+        start_page = getattr(updates, 'start_page', None)
+        if start_page is not None and self.DAC_PAGE != start_page:
+            self.dac_change_page(start_page)
+        self.transport.send(buf)
+        self.DAC_PAGE = page
+        if self.METRICS is not None:
+            self.METRICS.count('page_switch', getattr(updates, 'page_writes', 0))
+        if self.RECORDER is not None:
+            now = time.time()
+            for bus, address, data in updates:
+                if bus == 'dac':
+                    self.RECORDER.record(bus, False, address >> 8, address % 0x100, data, now)
+                else:
+                    self.RECORDER.record(bus, False, 0, address, data, now)
+        for bus, address, data in updates:
+            if bus == 'dac':
+                for k in self.dac_shadow_keys(address):
+                    self.dac_shadow[k] = data
+            else:
+                self.lmk_shadow[address] = data
+
+    def instrument(self, metrics=None):
+        """Record counters and latencies of the register I/O, see :class:`Metrics`.
+
+            :param metrics: :class:`Metrics` to record into, a new one by default
+            :return: the :class:`Metrics`
+        """
+        if self.METRICS is not None:
+            return self.METRICS
+        if metrics is None:
+            metrics = Metrics()
+        for name in ('dac_write', 'dac_read', 'lmk_write', 'lmk_read', 'write_batch', 'read_batch'):
+            metrics.timed(self, name)
+
+        self.transport.instrument(metrics)
+        self.METRICS = metrics
+        return metrics
+
+    def uninstrument(self):
+        """Stop recording and restore the methods wrapped by :meth:`instrument`.
+        """
+        if self.METRICS is not None:
+            self.METRICS.uninstall()
+            self.METRICS = None
+
+    def start_recording(self, file_name=None, ring=4096):
+        """Record the SPI transactions, see :class:`SpiRecorder`.
+
+            :param str file_name: binary log file, appended to if it exists
+            :param int ring: number of records kept in memory
+            :return: the :class:`SpiRecorder`
+        """
+        self.stop_recording()
+        self.RECORDER = SpiRecorder(file_name, ring)
+        return self.RECORDER
+
+    def stop_recording(self):
+        """Stop recording and close the log file.
+
+            :return: the :class:`SpiRecorder`, with its ring buffer still readable, or None
+        """
+        recorder = self.RECORDER
+        if recorder is not None:
+            recorder.close()
+            self.RECORDER = None
+        return recorder
+
+    @contextlib.contextmanager
+    def coalesce(self):
+        """Combine the writes of the enclosed operations into one transfer where the transport allows it.
+
+        The combined writes are sent when the block is left, or earlier if an operation inside reads.
+        If sending them fails, the shadow entries set inside the block are forgotten.
+        """
+        self.transport.hold()
+        shadow = self.shadow_copy()
+        try:
+            yield self
+        finally:
+            try:
+                self.transport.release()
+            except Exception:
+                self.invalidate_shadow(shadow)
+                raise
+
+    @contextlib.contextmanager
+    def discard_on_error(self):
+        """Undo an operation inside :meth:`coalesce` that raises.
+
+            Its writes still held by the transport are dropped and the shadow entries it set are forgotten.
+        """
+        mark = self.transport.mark_held()
+        shadow = self.shadow_copy()
+        try:
+            yield self
+        except Exception:
+            self.transport.discard_held(mark)
+            self.invalidate_shadow(shadow)
+            raise
+
+    def shadow_copy(self):
+        """Copy of the shadows for :meth:`invalidate_shadow`.
+
+            :return: (DAC shadow, LMK04828 shadow)
+        """
+        return dict(self.dac_shadow), dict(self.lmk_shadow)
+
+    def invalidate_shadow(self, shadow):
+        """Forget the shadow entries set since a copy was taken, their writes may not have reached the chips.
+
+            The selected DAC page becomes unknown as well.
+
+            :param shadow: result of :meth:`shadow_copy`
+        """
+        dac, lmk = shadow
+        for current, before in ((self.dac_shadow, dac), (self.lmk_shadow, lmk)):
+            for k in [k for k, v in current.items() if k not in before or before[k] != v]:
+                del current[k]
+        self.DAC_PAGE = None
+
+    def read_batch(self, reads, cached=True):
+        """Read many registers of both devices.
+
+            The registers not served from the shadow are read by one :meth:`Transport.read_batch`, with the
+            DAC page changes in between, which the transport may send in a single transfer.
+
+            :param reads: sequence of (bus, address) with bus 'dac' (address with page prefix) or 'lmk'
+            :param bool cached: serve values from the shadow if known
+            :return: list of register values
+        """
+        values = [None]*len(reads)
+        transactions = []
+        slots = []
+        page = self.DAC_PAGE
+        for i, (bus, address) in enumerate(reads):
+            if bus == 'dac':
+                volatile = address in self.DAC_VOLATILE
+                if self.SHADOW and cached and not volatile and address in self.dac_shadow:
+                    values[i] = self.dac_shadow[address]
+                    continue
+                if address >> 8 != page:
+                    page = address >> 8
+                    transactions.append(('dac', self.DAC_PAGE_ADR, page))
+                transactions.append(('dac', address % 0x100, None))
+            else:
+                volatile = address in self.LMK_VOLATILE
+                if self.SHADOW and cached and not volatile and address in self.lmk_shadow:
+                    values[i] = self.lmk_shadow[address]
+                    continue
+                transactions.append(('lmk', address, None))
+            slots.append(i)
+        if not transactions:
+            return values
+
+        self.DAC_PAGE = None #unknown if the transfer fails
+        results = iter(self.transport.read_batch(transactions))
+        self.DAC_PAGE = page
+        if self.METRICS is not None:
+            self.METRICS.count('page_switch', len(transactions) - len(slots))
+        slots = iter(slots)
+        for bus, address, data in transactions:
+            if data is not None:
+                #page change
+                if self.RECORDER is not None:
+                    self.RECORDER.record('dac', False, data, address, data)
+                continue
+            i = next(slots)
+            values[i] = data = next(results)
+            if bus == 'dac':
+                if self.RECORDER is not None:
+                    self.RECORDER.record('dac', True, reads[i][1] >> 8, address, data)
+                address = reads[i][1]
+                if self.dac_cacheable(address):
+                    self.dac_shadow[address] = data
+            else:
+                if self.RECORDER is not None:
+                    self.RECORDER.record('lmk', True, 0, address, data)
+                if address not in self.LMK_VOLATILE:
+                    self.lmk_shadow[address] = data
+        return values
+
+    def dac_write(self, address, data, force=False):
+        """Write a DAC register
+
+            The write is skipped if the shadow shows the register already holds the value.
+
+            :param int address: Address of register to write in
+            :param int data: data to write to register
+            :param bool force: write even if the shadow holds the value
+        """
+        keys = self.dac_shadow_keys(address)
+        if not force and self.dac_unchanged(address, data):
+            return
+
+        #Get page from address
+        page = address>>8
+        address_without_page = address%0x100
+
+        self.dac_change_page(page)
+        self.dac_write_byte(address_without_page, data)
+        for k in keys:
+            self.dac_shadow[k] = data
+
+    def dac_change_page(self, page):
+        """Change register mapping page.
+
+            The registers are devided in three pages: multi-DUC1 (0b001), multi-DUC2 (0b010), and DIG_MISC (0b100).
+
+            Multiple pages can be written at the same time, i.e. 0x011 writes multi-DUC1 and multi-DUC2 at the same time.
+
+            Function keeps track of the selected pages in variable self.DAC_PAGE.
+
+            :param int page: 0b000 - 0b111
+        """
+
+        #write page only if not set already, for speed up
+        if self.DAC_PAGE != page:
+            self.DAC_PAGE = page
+            self.dac_write_byte(self.DAC_PAGE_ADR, page)
+            if self.METRICS is not None:
+                self.METRICS.count('page_switch')
+
+    def dac_write_byte(self, address, data):
+        """Write a byte to the DAC.
+
+            :param int address: Address of register with page prefix, e.g 0x0328 writes the register 0x28 of page multi-DUC1 and multi=DUC2 at the same time.
+            :param int data: data to write to register (0x00-0xFF)
+        """
+        self.transport.dac_write_byte(address, data)
+        if self.RECORDER is not None:
+            self.RECORDER.record('dac', False, self.DAC_PAGE, address, data)
+
+    def dac_read(self, address, cached=True):
+        """Read a register from the DAC.
+
+            :param int address: Address of register with page prefix, e.g 0x0128 reads the register 0x28 of page multi-DUC1.
+            :param bool cached: serve the value from the shadow if known
+            :return: Register value
+        """
+        volatile = address in self.DAC_VOLATILE
+        if self.SHADOW and cached and not volatile and address in self.dac_shadow:
+            return self.dac_shadow[address]
+
+        #Get page from address
+        page = address >> 8
+        address_without_page = address % 0x100
+
+        self.dac_change_page(page)
+        data = self.dac_read_byte(address_without_page)
+        if self.dac_cacheable(address):
+            self.dac_shadow[address] = data
+        return data
+
+    def dac_read_byte(self, address):
+        """Read a register from the DAC without page correction.
+
+            :param int address: Address of register
+            :return: Register value
+        """
+        data = self.transport.dac_read_byte(address)
+        if self.RECORDER is not None:
+            self.RECORDER.record('dac', True, self.DAC_PAGE, address, data)
+        return data
+
+    def lmk_write(self, address, data, force=False):
+        """Write data to a address in the LMK04828.
+
+            The write is skipped if the shadow shows the register already holds the value.
+
+            :param int address: Address of register
+            :param int data: data
+            :param bool force: write even if the shadow holds the value
+        """
+        if not force and self.lmk_unchanged(address, data):
+            return
+        self.transport.lmk_write(address, data)
+        if self.RECORDER is not None:
+            self.RECORDER.record('lmk', False, 0, address, data)
+        self.lmk_shadow[address] = data
+
+    def lmk_read(self, address, cached=True):
+        """Read data from an address of the LMK04828
+
+            :param int address: Address of register
+            :param bool cached: serve the value from the shadow if known
+            :return: Data at address
+        """
+        volatile = address in self.LMK_VOLATILE
+        if self.SHADOW and cached and not volatile and address in self.lmk_shadow:
+            return self.lmk_shadow[address]
+        data = self.transport.lmk_read(address)
+        if self.RECORDER is not None:
+            self.RECORDER.record('lmk', True, 0, address, data)
+        if not volatile:
+            self.lmk_shadow[address] = data
+        return data
+
+    def close(self):
+        """Close the connection to the DAC card.
+        """
+        if self._transport is not None:
+            self._transport.close()
+
+class Transport(object):
+    """Base class of the SPI transports used by :class:`DacCom`.
+
+        A transport moves single register transactions to and from the DAC38RF82 and the LMK04828.
+        Register pages of the DAC are handled by :class:`DacCom`, the transport only sees the 7 bit address.
+        Port A (interface 1) of the FT2232H drives the DAC reset pin, port B (interface 2) carries both SPI buses.
+    """
+    URL_RESET = 'ftdi://ftdi:2232h/1'
+    URL_SPI = 'ftdi://ftdi:2232h/2'
+
+    WIRE = None #format of rendered buffers if they are bytes that can be cached, e.g. 'bitbang-2'
+
+    LMK_SCK  = int('10000',2)
+    LMK_SDIO = int('100000',2)
+    LMK_SDO  = int('1000000',2)
+    LMK_CS   = int('10000000',2)
+
+    DAC_SCK   = int('1',2)
+    DAC_SDIO  = int('10',2)
+    DAC_SDO   = int('100',2)
+    DAC_SDENB = int('1000',2)
+
+    def dac_reset(self):
+        """Reset the DAC
+        """
+        self.gpio_dac.write_port(int('00000000',2))
+        self.gpio_dac.write_port(int('00100000',2))
+
+    def dac_write_byte(self, address, data):
+        """Write a DAC register without page correction.
+
+            :param int address: Address of register
+            :param int data: data to write to register
+        """
+        raise NotImplementedError
+
+    def dac_read_byte(self, address):
+        """Read a DAC register without page correction.
+
+            :param int address: Address of register
+            :return: Register value
+        """
+        raise NotImplementedError
+
+    def lmk_write(self, address, data):
+        """Write a LMK04828 register.
+
+            :param int address: Address of register
+            :param int data: data
+        """
+        raise NotImplementedError
+
+    def lmk_read(self, address):
+        """Read a LMK04828 register.
+
+            :param int address: Address of register
+            :return: Data at address
+        """
+        raise NotImplementedError
+
+    def read_batch(self, transactions):
+        """Run a sequence of register reads and writes, e.g. reads with DAC page changes in between.
+
+            :param transactions: sequence of (bus, address, data) with bus 'dac' (address without page) or 'lmk'
+                                 and data None for a read
+            :return: list of the values read
+        """
+        values = []
+        for bus, address, data in transactions:
+            if data is None:
+                values.append(self.dac_read_byte(address) if bus == 'dac' else self.lmk_read(address))
+            elif bus == 'dac':
+                self.dac_write_byte(address, data)
+            else:
+                self.lmk_write(address, data)
+        return values
+
+    def hold(self):
+        """Start combining writes into one transfer, sent by :meth:`release` or before the next read.
+        """
+        pass
+
+    def instrument(self, metrics):
+        """Count the USB traffic into a :class:`Metrics`.
+
+            :param metrics: :class:`Metrics`
+        """
+        pass
+
+    def release(self):
+        """Send the writes combined since :meth:`hold`.
+        """
+        pass
+
+    def mark_held(self):
+        """Position in the writes combined since :meth:`hold`, for :meth:`discard_held`.
         """
-        phase_bin = int(deg/360.0*0xFFFF)
-        self.dac.dac_write(0x021C,phase_bin)
+        return None
 
-        #Phase CD
-        self.dac.dac_write(0x021D,0)
-        self._trigger_spi()
+    def discard_held(self, mark):
+        """Drop the combined writes not sent yet that were added after a mark.
 
-    def amplitude_a(self, gain):
-        """Amplitude of channel A.
+            :param mark: result of :meth:`mark_held`
+        """
+        pass
 
-        :param float gain: Amplitude setting (0-2)
+    def render(self, transactions):
+        """Render a sequence of register writes into a buffer for :meth:`send`.
 
-        Above gain 1 distortions may accure. Allows 1024 steps in the gain range from 0-1.
+            :param transactions: sequence of (bus, address, data) with bus 'dac' (address without page) or 'lmk'
+            :return: transport specific buffer
         """
-        gain_hex = int(gain/2.0*(2**11-1))
-        self.dac.dac_write(0x0132, gain_hex | 0x8000) #Enable gain and choose gain
-
-    def amplitude_b(self, gain):
-        """Amplitude of channel B.
+        return list(transactions)
 
-        :param float gain: Amplitude setting (0-2)
+    def send(self, buf):
+        """Send a buffer rendered by :meth:`render`.
 
-        Above gain 1 distortions may accure. Allows 1024 steps in the gain range from 0-1.
+            :param buf: rendered buffer
         """
-        gain_hex = int(gain/2.0*(2**11-1))
-        self.dac.dac_write(0x0232, gain_hex | 0x8000) #Enable gain and choose gain
+        for bus, address, data in buf:
+            if bus == 'dac':
+                self.dac_write_byte(address, data)
+            else:
+                self.lmk_write(address, data)
 
-class DacCom(object):
-    def __init__(self, config = "./config/PLL_M9N5Ref1228_8MHz_PLLlock.cfg"):
-        self.LMK_CONFIG = self.read_lmk_config(config)
-        self.DAC_CONFIG = self.read_dac_config(config)
+    def close(self):
+        """Close the FTDI interfaces.
+        """
+        raise NotImplementedError
 
-        self.LMK_SCK  = int('10000',2)
-        self.LMK_SDIO = int('100000',2)
-        self.LMK_SDO  = int('1000000',2)
-        self.LMK_CS   = int('10000000',2)
+class SyncGpioController(object):
+    """GPIO controller in synchronous bit-bang mode with the interface of pyftdi's GpioController.
 
-        self.DAC_SCK   = int('1',2)
-        self.DAC_SDIO  = int('10',2)
-        self.DAC_SDO   = int('100',2)
-        self.DAC_SDENB = int('1000',2)
+        In synchronous mode the FTDI samples the pins each time it applies a written port state, so a read
+        waveform and its samples travel in one transfer, see :meth:`exchange`. Plain writes discard the samples.
 
-        self.DAC_PAGE_ADR = 0x09
-        self.DAC_PAGE = 0 #keep track of register pages to speed up communication
+        The FT2232H stops clocking out states once its receive FIFO of about 4 KB is full, buffers are therefore
+        exchanged in chunks of CHUNK states, each read back before the next is written.
+    """
+    CHUNK = 2048 #states per transfer, well below the receive FIFO
 
-        self.PORT = 0
-        self.DEBUG = True
+    def __init__(self):
+        from pyftdi import gpio
+        self._gpio = gpio.GpioSyncController()
+        self._port = 0
 
-        self.gpio_dac = gpio.GpioController()
-        self.gpio_dac.open_from_url('ftdi://ftdi:2232h/1',direction=int('11111111',2))
+    def open_from_url(self, url, direction=0):
+        """Open the interface selected by the URL.
 
-        self.gpio = gpio.GpioController()
-        self.gpio.open_from_url('ftdi://ftdi:2232h/2',direction=int('11111111',2))
+            :param str url: FTDI URL, e.g. 'ftdi://ftdi:2232h/2'
+            :param int direction: direction bit field, 1 for output
+        """
+        self._gpio.configure(url, direction=direction)
 
+    def close(self):
+        """Close the interface.
+        """
+        self._gpio.close()
 
-        #Set CS of LMK to 1
-        self.gpio.write_port(self.LMK_CS)
-        self.PORT=self.LMK_CS
-        self.set_bit_on_port(self.DAC_SDENB, True)
-        self.set_bit_on_port(self.DAC_SCK, False)
-        self.port_flush()
+    def set_direction(self, pins, direction):
+        """Change the direction of the port pins.
 
-    def dac_reset(self):
-        """Reset the DAC
+            :param int pins: pins to change
+            :param int direction: direction bit field, 1 for output
         """
-        self.gpio_dac.write_port(int('00000000',2))
-        self.gpio_dac.write_port(int('00100000',2))
+        self._gpio.set_direction(pins, direction)
 
-    def lmk_configure(self):
-        """Configure the LMK04828 clock cleaner from the provided configuration file
+    def write_port(self, value):
+        """Write a single port state.
 
-            :raises ValueError: if the read value does not correspond to the set value
+            :param int value: port value
         """
+        self.exchange(bytes([value]))
 
-        if self.DEBUG:
-            print("Adr:\tSet:\tRead:")
-        for d in self.LMK_CONFIG:
-            self.lmk_write(d['adr'],d['value'])
-            read_back =self.lmk_read(d['adr'])
-            if self.DEBUG:
-                print(str(d['adr'])+ "\t" + str(d['value']) +'\t'+str(read_back) )
-            if read_back!=d['value']:
-                raise ValueError('LMK configuration, set value not equal to read back value')
+    def write(self, out):
+        """Write a sequence of port states in one transfer.
 
-    def dac_configure(self):
-        """Configure the DAC from the provided configuration file.
+            :param out: port states, bytes or a single int
+        """
+        if isinstance(out, int):
+            out = bytes([out])
+        self.exchange(out)
 
-            :raises ValueError: if the read value does not correspond to the set value
+    def read_port(self):
+        """Read the port pins.
+
+            :return: Port value
         """
-        if self.DEBUG:
-            print("Adr:\tSet:\tRead:")
-        for i in range(len(self.DAC_CONFIG)):
-            d = self.DAC_CONFIG[i]
-            self.dac_write(d['adr'],d['value'])
-            read_back =self.dac_read(d['adr'])
-            if self.DEBUG:
-                print(str(hex(d['adr']))+ "\t" + str(hex(d['value'])) +'\t'+str(hex(read_back)) )
-            if read_back!=d['value'] and d['adr']!=0:
-                raise ValueError('DAC configuration, set value not equal to read back value')
+        return self.exchange(bytes([self._port]))[0]
 
-    def read_lmk_config(self, file_name):
-        """Read the configuration file and extract the LMK04828 data from it.
+    def exchange(self, out):
+        """Write port states and sample the pins in one transfer.
 
-            :param str file_name: Path to the configuration file
-            :return: LMK04828 configuration dictionary
+            :param bytes out: port states
+            :return: one byte per state, the pin levels just before the state was applied
         """
-        f_config = open(file_name,'r')
-        LMK_CONFIG = []
-        with open(file_name,'r') as f:
-            for line in f:
-                if 'DAC_RESET' in line:
-                    break
-                d = line.strip().split()
-                if len(d)>1:
-                    #print(str(d[0])+ "\t" + str(d[1]))
-                    #print(str(int(d[0],16))+ "\t" + str(int(d[1],16)))
-                    LMK_CONFIG.append({'adr':int(d[0],16), 'value':int(d[1],16)})
+        data = bytearray()
+        for i in range(0, len(out), self.CHUNK):
+            data += self._gpio.exchange(out[i:i + self.CHUNK])
+        if out:
+            self._port = out[-1]
+        return bytes(data)
+
+class BitBangTransport(Transport):
+    """SPI transport bit-banging both buses through the GPIO port of the FT2232H.
+
+        With BULK set (default) the edges of a transaction are rendered into one buffer and sent in a single
+        USB transfer, otherwise every edge is written to the port on its own. Rendered buffers are reduced by
+        :meth:`optimize`. The last port state and the pin directions sent are tracked, states and direction
+        changes repeating them are not sent.
+
+        With SYNC set, the default if the GPIO controller has an exchange method like
+        :class:`SyncGpioController`, reads are rendered with their samples taken in the same transfer,
+        see :meth:`read_batch`.
+    """
+    WIRE = 'bitbang-2'
+    SYNC_CHUNK = SyncGpioController.CHUNK #states per exchange in read_batch
+    def __init__(self, url_reset=Transport.URL_RESET, url_spi=Transport.URL_SPI, gpio_class=None, sync=False):
+        """Open the FTDI interfaces in bit-bang mode.
+
+            :param str url_reset: FTDI URL of the interface driving the DAC reset pin
+            :param str url_spi: FTDI URL of the interface carrying the SPI buses
+            :param gpio_class: GPIO controller factory, defaults to pyftdi's GpioController
+            :param bool sync: use :class:`SyncGpioController` if no gpio_class is given
+        """
+        if gpio_class is None:
+            if sync:
+                gpio_class = SyncGpioController
+            else:
+                from pyftdi import gpio
+                gpio_class = gpio.GpioController
 
-        return LMK_CONFIG
+        self.PORT = 0
+        self.BULK = True #render each SPI transaction into one bulk write instead of one write per edge
+        self.DIRECTION = 0xFF #pin directions, 1 for output
+        self._wire = None #last port state sent
+        self._pending = None
+        self._held = None
+        self._held_sent = 0 #number of times held states were sent
 
-    def read_dac_config(self, file_name):
-        """Read the configuration file and extract the DAC data from it.
+        self.gpio_dac = gpio_class()
+        self.gpio_dac.open_from_url(url_reset,direction=int('11111111',2))
 
-            :param str file_name: Path to the configuration file
-            :return: DAC configuration dictionary
-        """
-        DAC_CONFIG = []
-        #Seek DAC38RF8x in file
-        found_dac_description =False
-        with open(file_name,'r') as f:
-            for line in f:
-                if found_dac_description:
-                    d=line.strip().split()
-                    if len(d)>1:
-                        DAC_CONFIG.append({'adr':int(d[0],16), 'value':int(d[1],16)})
+        self.gpio = gpio_class()
+        self.gpio.open_from_url(url_spi,direction=int('11111111',2))
+        self.SYNC = hasattr(self.gpio, 'exchange') #sample reads in the transfer carrying their waveform
+        self._samples = None
 
-                if "DAC38RF8x" in line.strip().split():
-                    found_dac_description =True
 
-        return DAC_CONFIG
+        #Set CS of LMK to 1
+        self.gpio.write_port(self.LMK_CS)
+        self.PORT=self.LMK_CS
+        self._wire=self.LMK_CS
+        self.set_bit_on_port(self.DAC_SDENB, True)
+        self.set_bit_on_port(self.DAC_SCK, False)
+        self.port_flush()
 
     def set_bit(self, bits, position, value):
         """Set bit in bit field bits at a given position to a specified value.
@@ -335,38 +2254,209 @@ class DacCom(object):
 
     def port_flush(self):
         """Flush data to port.
+
+            While a transaction is being rendered the port state is appended to the pending buffer instead,
+            see :meth:`port_commit`.
+        """
+        if self._pending is None:
+            if self.PORT != self._wire:
+                self.gpio.write_port(self.PORT)
+                self._wire = self.PORT
+        else:
+            self._pending.append(self.PORT)
+
+    def port_commit(self):
+        """Send the pending port states in a single bulk transfer.
         """
-        self.gpio.write_port(self.PORT)
+        if self._pending:
+            self.port_write(self.optimize(self._pending))
+            del self._pending[:]
+        if self._held:
+            self.gpio.write(bytes(self._held))
+            del self._held[:]
+            self._held_sent += 1
 
-    def dac_write(self, address, data):
-        """Write a DAC register
+    def port_write(self, buf):
+        """Write a sequence of port states in a single bulk bit-bang transfer.
 
-            :param int address: Address of register to write in
-            :param int data: data to write to register
+            While writes are held, see :meth:`hold`, the states are appended to the held buffer instead.
+
+            :param bytes buf: port states, one byte per edge
         """
-        #Get page from address
-        page = address>>8
-        address_without_page = address%0x100
+        if buf and buf[0] == self._wire:
+            buf = buf[1:]
+        if not buf:
+            return
+        if self._held is None:
+            self.gpio.write(buf)
+        else:
+            self._held += buf
+        self._wire = buf[-1]
+
+    def optimize(self, states):
+        """Remove port states without effect on the SPI buses.
+
+            Repeated states are dropped. The DAC38RF82 and the LMK04828 sample SDIO on the rising SCK edge,
+            a state only changing the data pins of a bus whose clock is low is therefore merged into the
+            state before it, setting up the data together with the falling clock edge or the chip select.
+            The first state is kept, the state of the port before the buffer is not known when rendering.
+
+            :param states: port states, one byte per edge
+            :return: port states as bytes
+        """
+        dac_data = self.DAC_SDIO | self.DAC_SDO
+        lmk_data = self.LMK_SDIO | self.LMK_SDO
+        out = bytearray()
+        for state in states:
+            if out and state == out[-1]:
+                continue
+            if len(out) > 1:
+                prev = out[-1]
+                data = 0
+                if not prev & self.DAC_SCK:
+                    data |= dac_data
+                if not prev & self.LMK_SCK:
+                    data |= lmk_data
+                if not (prev ^ state) & ~data:
+                    out[-1] = state
+                    if out[-1] == out[-2]:
+                        out.pop()
+                    continue
+            out.append(state)
+        return bytes(out)
+
+    def port_outputs(self):
+        """Make all port pins outputs.
+
+            The pins are outputs between transactions, no transfer is spent on it unless a read left them changed.
+        """
+        self.port_direction(0xFF, 0xFF)
 
-        self.dac_change_page(page)
-        self.dac_write_byte(address_without_page, data)
+    def instrument(self, metrics):
+        """Count the port accesses and USB traffic into a :class:`Metrics`.
 
-    def dac_change_page(self, page):
-        """Change register mapping page.
+            :param metrics: :class:`Metrics`
+        """
+        metrics.counted(self, 'port_flush', 'port_flush')
+        metrics.counted(self.gpio, 'write', 'usb_write', lambda args: 1 if isinstance(args[0], int) else len(args[0]))
+        metrics.counted(self.gpio, 'write_port', 'usb_write', lambda args: 1)
+        metrics.counted(self.gpio, 'read_port', 'read_port', lambda args: 1, 'bytes_read')
+        metrics.counted(self.gpio, 'set_direction', 'set_direction')
+        if hasattr(self.gpio, 'exchange'):
+            metrics.exchanged(self.gpio, 'exchange')
+
+    def hold(self):
+        """Start combining writes into one bulk transfer.
+
+            Only effective in BULK mode. Reads and direction changes send the held states first.
+        """
+        if self.BULK and self._held is None:
+            self._held = bytearray()
 
-            The registers are devided in three pages: multi-DUC1 (0b001), multi-DUC2 (0b010), and DIG_MISC (0b100).
+    def release(self):
+        """Send the held port states and stop combining writes.
 
-            Multiple pages can be written at the same time, i.e. 0x011 writes multi-DUC1 and multi-DUC2 at the same time.
+            The held states are dropped if sending them fails.
+        """
+        if self._held is not None:
+            try:
+                self.port_commit()
+            finally:
+                self._held = None
+
+    def mark_held(self):
+        """Position in the held port states, for :meth:`discard_held`.
+        """
+        if self._held is None:
+            return None
+        return self._held_sent, len(self._held)
 
-            Function keeps track of the selected pages in variable self.DAC_PAGE.
+    def discard_held(self, mark):
+        """Drop the held port states added after a mark.
 
-            :param int page: 0b000 - 0b111
+            If the held states were sent since the mark, all states held now were added after it.
+
+            :param mark: result of :meth:`mark_held`
         """
+        if mark is None or not self._held:
+            return
+        sent, length = mark
+        if sent != self._held_sent:
+            length = 0
+        if len(self._held) > length:
+            del self._held[length:]
+            self._wire = None #the port keeps a state that is not known here
 
-        #write page only if not set already, for speed up
-        if self.DAC_PAGE != page:
-            self.DAC_PAGE = page
-            self.dac_write_byte(self.DAC_PAGE_ADR, page)
+    def dac_reset(self):
+        """Reset the DAC, sending held port states first.
+        """
+        self.port_commit()
+        Transport.dac_reset(self)
+
+    def port_read(self):
+        """Read the port, sending pending port states first.
+
+            :return: Port value
+        """
+        self.port_commit()
+        return self.gpio.read_port()
+
+    def port_direction(self, pins, direction):
+        """Set the direction of the port pins, sending pending port states first.
+
+            :param int pins: pins to change
+            :param int direction: direction bit field, 1 for output
+        """
+        new = (self.DIRECTION & ~pins | direction & pins) & 0xFF
+        if new == self.DIRECTION:
+            return
+        self.port_commit()
+        self.gpio.set_direction(pins, direction)
+        self.DIRECTION = new
+
+    def _begin_bulk(self):
+        """Start collecting port states if bulk mode is enabled.
+        """
+        if self.BULK:
+            self._pending = bytearray()
+
+    def _end_bulk(self):
+        """Send the collected port states and return to one write per edge.
+        """
+        if self._pending is not None:
+            self.port_commit()
+            self._pending = None
+
+    def _render(self, edges, *args):
+        """Render a transaction into a buffer without sending it.
+
+            :param edges: edge generator method, e.g. self._dac_write_byte_edges
+            :return: port states as bytes
+        """
+        self._pending = bytearray()
+        try:
+            edges(*args)
+            return self.optimize(self._pending)
+        finally:
+            self._pending = None
+
+    def render_dac_write_byte(self, address, data):
+        """Render a DAC register write without page correction into a port state buffer.
+
+            :param int address: Address of register
+            :param int data: data to write to register
+            :return: port states as bytes, to be sent with :meth:`port_write`
+        """
+        return self._render(self._dac_write_byte_edges, address, data)
+
+    def render_lmk_write(self, address, data):
+        """Render a LMK04828 register write into a port state buffer.
+
+            :param int address: Address of register
+            :param int data: data
+            :return: port states as bytes, to be sent with :meth:`port_write`
+        """
+        return self._render(self._lmk_write_edges, address, data)
 
     def dac_write_byte(self, address, data):
         """Write a byte to the DAC.
@@ -374,8 +2464,15 @@ class DacCom(object):
             :param int address: Address of register with page prefix, e.g 0x0328 writes the register 0x28 of page multi-DUC1 and multi=DUC2 at the same time.
             :param int data: data to write to register (0x00-0xFF)
         """
-        self.gpio.set_direction(0xFF, 0xFF)
-
+        self.port_outputs()
+        if self.BULK:
+            self.port_write(self.render_dac_write_byte(address, data))
+        else:
+            self._dac_write_byte_edges(address, data)
+
+    def _dac_write_byte_edges(self, address, data):
+        """Generate the port states of a DAC register write.
+        """
         self.set_bit_on_port(self.DAC_SCK, False)
         self.port_flush()
 
@@ -408,25 +2505,23 @@ class DacCom(object):
         self.set_bit_on_port(self.DAC_SDENB, True)
         self.port_flush()
 
-    def dac_read(self, address):
-        """Read a register from the DAC.
-
-            :param int address: Address of register with page prefix, e.g 0x0128 reads the register 0x28 of page multi-DUC1.
-            :return: Register value
-        """
-        #Get page from address
-        page = address >> 8
-        address_without_page = address % 0x100
-
-        self.dac_change_page(page)
-        return self.dac_read_byte(address_without_page)
-
     def dac_read_byte(self, address):
         """Read a register from the DAC without page correction.
 
             :param int address: Address of register
             :return: Register value
         """
+        if self.SYNC:
+            return self.read_batch([('dac', address, None)])[0]
+        self._begin_bulk()
+        try:
+            return self._dac_read_byte_edges(address)
+        finally:
+            self._end_bulk()
+
+    def _dac_read_byte_edges(self, address):
+        """Generate the port states of a DAC register read and sample SDO.
+        """
         self.set_bit_on_port(self.DAC_SCK, False)
         self.port_flush()
 
@@ -453,7 +2548,7 @@ class DacCom(object):
             self.port_flush()
             mask = mask >> 1
 
-        self.gpio.set_direction(0xFF, 0b11111001)
+        self.port_direction(0xFF, 0b11111001)
         self.set_bit_on_port(self.DAC_SDIO, False) #Can't set a value which is on read mode
         self.set_bit_on_port(self.DAC_SDO, False) #Can't set a value which is on read mode
 
@@ -464,7 +2559,7 @@ class DacCom(object):
             self.port_flush()
             self.set_bit_on_port(self.DAC_SCK, True)
             self.port_flush()
-            port = self.gpio.read_port()
+            port = self.port_read()
             bit = (port & self.DAC_SDO) > 0
 
             data = data | mask*bit
@@ -477,7 +2572,7 @@ class DacCom(object):
         self.set_bit_on_port(self.DAC_SDENB, True)
         self.port_flush()
 
-        self.gpio.set_direction(0xFF, 0xFF)
+        self.port_direction(0xFF, 0xFF)
         return data
 
     def lmk_write(self, address, data):
@@ -486,7 +2581,15 @@ class DacCom(object):
             :param int address: Address of register
             :param int data: data
         """
-        self.gpio.set_direction(0xFF, 0xFF)
+        self.port_outputs()
+        if self.BULK:
+            self.port_write(self.render_lmk_write(address, data))
+        else:
+            self._lmk_write_edges(address, data)
+
+    def _lmk_write_edges(self, address, data):
+        """Generate the port states of a LMK04828 register write.
+        """
         RW = 0
         W1 = 0
         W0 = 0
@@ -525,7 +2628,17 @@ class DacCom(object):
             :param int address: Address of register
             :return: Data at address
         """
-
+        if self.SYNC:
+            return self.read_batch([('lmk', address, None)])[0]
+        self._begin_bulk()
+        try:
+            return self._lmk_read_edges(address)
+        finally:
+            self._end_bulk()
+
+    def _lmk_read_edges(self, address):
+        """Generate the port states of a LMK04828 register read and sample SDIO.
+        """
         RW = 1
         W1 = 0
         W0 = 0
@@ -553,7 +2666,7 @@ class DacCom(object):
             self.port_flush()
             mask = mask >> 1
 
-        self.gpio.set_direction(0xFF, 0b11011111)
+        self.port_direction(0xFF, 0b11011111)
         self.set_bit_on_port(self.LMK_SDIO, False) #Can't set a value which is on read mode
         self.set_bit_on_port(self.LMK_SCK, False)
         self.port_flush()
@@ -563,7 +2676,7 @@ class DacCom(object):
         data = 0
         mask = 1*2**7
         while mask > 0:
-            port = self.gpio.read_port()
+            port = self.port_read()
             bit = (port & self.LMK_SDIO) > 0
             #print(bit)
 
@@ -580,13 +2693,326 @@ class DacCom(object):
         self.set_bit_on_port(self.LMK_CS, True)
         self.port_flush()
 
-        self.gpio.set_direction(0xFF, 0xFF)
+        self.port_direction(0xFF, 0xFF)
         return data
 
+    def read_batch(self, transactions):
+        """Run a sequence of register reads and writes, sampling the read data in the transfers of the waveform.
+
+            With SYNC the waveform of all transactions is sent with :meth:`SyncGpioController.exchange`, in
+            chunks of SYNC_CHUNK states as long as the pin directions stay the same: DAC reads only turn DAC_SDO into an input,
+            each LMK04828 read needs a direction change between its address and data phase on the shared SDIO.
+            Without SYNC the transactions run one by one.
+
+            :param transactions: sequence of (bus, address, data) with bus 'dac' (address without page) or 'lmk'
+                                 and data None for a read
+            :return: list of the values read
+        """
+        if not self.SYNC:
+            return Transport.read_batch(self, transactions)
+        self.port_commit()
+        values = [None]*sum(1 for t in transactions if t[2] is None)
+        slot = 0
+        self._pending = bytearray()
+        self._samples = []
+        try:
+            for bus, address, data in transactions:
+                if bus == 'dac':
+                    self._sync_direction(self.DAC_SDO, 0)
+                    if data is None:
+                        self._dac_read_sync_edges(address, values, slot)
+                        slot += 1
+                    else:
+                        self._dac_write_byte_edges(address, data)
+                else:
+                    self._sync_direction(self.LMK_SDIO, self.LMK_SDIO)
+                    if data is None:
+                        self._lmk_read_sync_edges(address, values, slot)
+                        slot += 1
+                    else:
+                        self._lmk_write_edges(address, data)
+            self._sync_direction(0xFF, 0xFF)
+            self._exchange()
+        finally:
+            self._pending = None
+            self._samples = None
+        return values
+
+    def _exchange(self):
+        """Send the pending port states with exchange and decode the samples of the reads they carry.
+        """
+        if not self._pending:
+            return
+        levels = bytearray()
+        for i in range(0, len(self._pending), self.SYNC_CHUNK):
+            levels += self.gpio.exchange(bytes(self._pending[i:i + self.SYNC_CHUNK]))
+        self._wire = self._pending[-1]
+        for values, slot, pin, positions in self._samples:
+            data = 0
+            for i in positions:
+                data = (data << 1) | ((levels[i] & pin) > 0)
+            values[slot] = data
+        del self._pending[:]
+        del self._samples[:]
+
+    def _sync_direction(self, pins, direction):
+        """Change pin directions within :meth:`read_batch`, sending the states before the change first.
+        """
+        new = (self.DIRECTION & ~pins | direction & pins) & 0xFF
+        if new == self.DIRECTION:
+            return
+        self._exchange()
+        self.gpio.set_direction(pins, direction)
+        self.DIRECTION = new
+
+    def _sample(self):
+        """Position of the sample of the current port state in the exchanged buffer.
+
+            The pins are sampled just before a state is applied, the current state is seen by the next one.
+        """
+        return len(self._pending)
+
+    def _dac_read_sync_edges(self, address, values, slot):
+        """Generate the port states of a DAC register read with DAC_SDO an input, SDIO stays driven.
+        """
+        send = 0x80 | address
+        self.set_bit_on_port(self.DAC_SDENB, False)
+        for i in range(7, -1, -1):
+            #Data with the falling edge, clock it out
+            self.set_bit_on_port(self.DAC_SCK, False)
+            self.set_bit_on_port(self.DAC_SDIO, (send >> i) & 1)
+            self.port_flush()
+            self.set_bit_on_port(self.DAC_SCK, True)
+            self.port_flush()
+
+        self.set_bit_on_port(self.DAC_SDIO, False)
+        positions = []
+        for i in range(16):
+            #SDO changes on the falling edge, sample it while the clock is high
+            self.set_bit_on_port(self.DAC_SCK, False)
+            self.port_flush()
+            self.set_bit_on_port(self.DAC_SCK, True)
+            self.port_flush()
+            positions.append(self._sample())
+
+        self.set_bit_on_port(self.DAC_SCK, False)
+        self.set_bit_on_port(self.DAC_SDENB, True)
+        self.port_flush()
+        self._samples.append((values, slot, self.DAC_SDO, positions))
+
+    def _lmk_read_sync_edges(self, address, values, slot):
+        """Generate the port states of a LMK04828 read, turning SDIO into an input after the address phase.
+        """
+        send = 0x8000 | address
+        self.set_bit_on_port(self.LMK_CS, False)
+        for i in range(15, -1, -1):
+            self.set_bit_on_port(self.LMK_SCK, False)
+            self.set_bit_on_port(self.LMK_SDIO, (send >> i) & 1)
+            self.port_flush()
+            self.set_bit_on_port(self.LMK_SCK, True)
+            self.port_flush()
+
+        self.set_bit_on_port(self.LMK_SDIO, False) #Can't set a value which is on read mode
+        self._sync_direction(self.LMK_SDIO, 0)
+        positions = []
+        for i in range(8):
+            self.set_bit_on_port(self.LMK_SCK, False)
+            self.port_flush()
+            self.set_bit_on_port(self.LMK_SCK, True)
+            self.port_flush()
+            positions.append(self._sample())
+
+        self.set_bit_on_port(self.LMK_CS, True)
+        self.port_flush()
+        self._samples.append((values, slot, self.LMK_SDIO, positions))
+
+    def render(self, transactions):
+        """Render a sequence of register writes into one buffer of port states.
+
+            :param transactions: sequence of (bus, address, data) with bus 'dac' (address without page) or 'lmk'
+            :return: port states as bytes
+        """
+        self._pending = bytearray()
+        try:
+            for bus, address, data in transactions:
+                if bus == 'dac':
+                    self._dac_write_byte_edges(address, data)
+                else:
+                    self._lmk_write_edges(address, data)
+            return self.optimize(self._pending)
+        finally:
+            self._pending = None
+
+    def send(self, buf):
+        """Send port states rendered by :meth:`render` in a single bulk transfer.
+
+            :param bytes buf: port states
+        """
+        if not buf:
+            return
+        self.port_outputs()
+        if self.BULK:
+            self.port_write(buf)
+        else:
+            for state in buf:
+                self.gpio.write_port(state)
+            self._wire = buf[-1]
+        self.PORT = buf[-1]
+
     def close(self):
-        """Close the connection to the DAC card.
+        """Close the FTDI interfaces.
         """
         self.gpio.close()
+        self.gpio_dac.close()
+
+class MpsseTransport(Transport):
+    """SPI transport using the MPSSE engine of the FT2232H port B.
+
+        The DAC38RF82 sits on the MPSSE SPI pins (SCK, SDIO as MOSI, SDO as MISO, SDENB as CS0) and is clocked
+        in hardware. The LMK04828 pins are not reachable by the MPSSE clock, its transactions are therefore
+        rendered as a stream of MPSSE GPIO commands and executed in one USB transfer per register.
+    """
+    WIRE = 'mpsse-1'
+    WRITE_BYTES_NVE_MSB = 0x11
+    SET_BITS_LOW = 0x80
+    GET_BITS_LOW = 0x81
+    SEND_IMMEDIATE = 0x87
+
+    DAC_DIRECTION = int('1011',2) #SCK, SDIO and SDENB out, SDO in
+
+    def __init__(self, url_reset=Transport.URL_RESET, url_spi=Transport.URL_SPI, frequency=10E6):
+        """Open port A in bit-bang mode and port B in MPSSE SPI mode.
+
+            :param str url_reset: FTDI URL of the interface driving the DAC reset pin
+            :param str url_spi: FTDI URL of the interface carrying the SPI buses
+            :param float frequency: DAC SPI clock in Hz
+        """
+        from pyftdi import gpio, spi
+        self.gpio_dac = gpio.GpioController()
+        self.gpio_dac.open_from_url(url_reset,direction=int('11111111',2))
+
+        self.spi = spi.SpiController(cs_count=1)
+        self.spi.configure(url_spi)
+        self.port = self.spi.get_port(cs=0, freq=frequency, mode=0)
+
+        #LMK pins are plain GPIOs of the MPSSE, idle with CS high
+        self.spi.set_gpio_direction(0xF0, self.LMK_SCK | self.LMK_SDIO | self.LMK_CS)
+        self.spi.write_gpio(self.LMK_CS)
+
+    def dac_write_byte(self, address, data):
+        """Write a DAC register without page correction.
+
+            :param int address: Address of register
+            :param int data: data to write to register
+        """
+        self.port.write(bytes([address & 0x7F, (data >> 8) & 0xFF, data & 0xFF]))
+
+    def dac_read_byte(self, address):
+        """Read a DAC register without page correction.
+
+            :param int address: Address of register
+            :return: Register value
+        """
+        data = self.port.exchange(bytes([0x80 | (address & 0x7F)]), 2)
+        return (data[0] << 8) | data[1]
+
+    def _lmk_commands(self, send, nbits, nread=0):
+        """Render a LMK04828 transaction as MPSSE GPIO commands.
+
+            The edge sequence is the one of :class:`BitBangTransport`, with the DAC pins held idle.
+
+            :param int send: instruction word, MSB first
+            :param int nbits: number of bits of the instruction word
+            :param int nread: number of data bits to sample from SDIO afterwards
+            :return: MPSSE command buffer
+        """
+        idle = self.DAC_SDENB
+        out = self.DAC_DIRECTION | self.LMK_SCK | self.LMK_SDIO | self.LMK_CS
+        cmd = bytearray([self.SET_BITS_LOW, idle, out])
+        mask = 1 << (nbits - 1)
+        while mask > 0:
+            sdio = self.LMK_SDIO if send & mask else 0
+            cmd.extend((self.SET_BITS_LOW, idle | sdio, out,
+                        self.SET_BITS_LOW, idle | sdio | self.LMK_SCK, out))
+            mask = mask >> 1
+        if nread:
+            out &= ~self.LMK_SDIO
+            for _ in range(nread):
+                cmd.extend((self.SET_BITS_LOW, idle, out,
+                            self.SET_BITS_LOW, idle | self.LMK_SCK, out,
+                            self.GET_BITS_LOW))
+            out |= self.LMK_SDIO
+        cmd.extend((self.SET_BITS_LOW, idle | self.LMK_SCK | self.LMK_CS, out,
+                    self.SET_BITS_LOW, idle | self.LMK_CS, out))
+        return cmd
+
+    def lmk_write(self, address, data):
+        """Write a LMK04828 register.
+
+            :param int address: Address of register
+            :param int data: data
+        """
+        send = (address << 8) + data
+        self.spi.ftdi.write_data(self._lmk_commands(send, 24))
+
+    def lmk_read(self, address):
+        """Read a LMK04828 register.
+
+            :param int address: Address of register
+            :return: Data at address
+        """
+        send = (1 << 15) + address
+        cmd = self._lmk_commands(send, 16, 8)
+        cmd.append(self.SEND_IMMEDIATE)
+        self.spi.ftdi.write_data(cmd)
+        samples = self.spi.ftdi.read_data_bytes(8, 4)
+        data = 0
+        for port in samples:
+            data = (data << 1) | ((port & self.LMK_SDIO) > 0)
+        return data
+
+    def render(self, transactions):
+        """Render a sequence of register writes into one MPSSE command buffer.
+
+            DAC writes are clocked by the MPSSE engine, LMK04828 writes use GPIO commands.
+
+            :param transactions: sequence of (bus, address, data) with bus 'dac' (address without page) or 'lmk'
+            :return: MPSSE commands as bytes
+        """
+        idle = self.DAC_SDENB | self.LMK_CS
+        out = self.DAC_DIRECTION | self.LMK_SCK | self.LMK_SDIO | self.LMK_CS
+        cmd = bytearray()
+        for bus, address, data in transactions:
+            if bus == 'dac':
+                cmd.extend((self.SET_BITS_LOW, self.LMK_CS, out,
+                            self.WRITE_BYTES_NVE_MSB, 2, 0, address & 0x7F, (data >> 8) & 0xFF, data & 0xFF,
+                            self.SET_BITS_LOW, idle, out))
+            else:
+                cmd += self._lmk_commands((address << 8) + data, 24)
+        return bytes(cmd)
+
+    def send(self, buf):
+        """Send MPSSE commands rendered by :meth:`render` in one transfer.
+
+            :param bytes buf: MPSSE commands
+        """
+        self.spi.ftdi.write_data(buf)
+
+    def instrument(self, metrics):
+        """Count the USB traffic of the MPSSE into a :class:`Metrics`.
+
+            :param metrics: :class:`Metrics`
+        """
+        ftdi = self.spi.ftdi
+        metrics.counted(ftdi, 'write_data', 'usb_write', lambda args: len(args[0]))
+        metrics.counted(ftdi, 'read_data_bytes', 'read_port', lambda args: args[0], 'bytes_read')
+        metrics.counted(self.spi, 'set_gpio_direction', 'set_direction')
+
+    def close(self):
+        """Close the FTDI interfaces.
+        """
+        self.spi.terminate()
+        self.gpio_dac.close()
 
 if __name__ =="__main__":
     #Example Program
@@ -0,0 +1,241 @@
+#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+
+#    Copyright (C) 2017 Andreas Fognini
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""asyncio interface of the DDS.
+
+All FTDI I/O runs in one worker thread that owns the transport. The methods of :class:`AsyncDDS` queue
+an operation to the worker and return an awaitable. Operations queued while the worker is busy are
+executed back to back with their writes combined into one USB transfer::
+
+    async with AsyncDDS(config="./config/PLL_M9N5Ref1228_8MHz_PLLlock.cfg") as dds:
+        await dds.config_board()
+        await dds.start_up_sequence()
+        await asyncio.gather(dds.nco_freq_a(100), dds.nco_freq_b(200), dds.amplitude_b(0.5))
+"""
+
+import asyncio
+import concurrent.futures
+import queue
+import threading
+
+from pydualdds import DDS
+
+class DDSWorker(threading.Thread):
+    """Thread owning a :class:`pydualdds.DDS` and its FTDI interfaces.
+
+        Queued operations are executed in order. Up to PIPELINE operations waiting in the queue are taken
+        at once and run inside :meth:`pydualdds.DacCom.coalesce`, so their writes leave in one transfer.
+        Operations queued with pipeline=False, e.g. timed sweeps, always run on their own and outside coalesce, so
+        their writes are sent as they are made.
+    """
+    def __init__(self, factory, pipeline=64):
+        """
+            :param factory: callable without arguments creating the DDS, called in the worker thread
+            :param int pipeline: maximum number of operations combined
+        """
+        threading.Thread.__init__(self, name='pydualdds-io')
+        self.daemon = True
+        self.factory = factory
+        self.PIPELINE = pipeline
+        self.dds = None
+        self.operations = 0 #operations executed
+        self.groups = 0 #groups of combined operations executed
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, function, pipeline=True):
+        """Queue an operation.
+
+            :param function: callable taking the DDS as only argument
+            :param bool pipeline: allow combining the operation with other queued operations
+            :return: concurrent.futures.Future of the result
+        """
+        future = concurrent.futures.Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('DDS worker is closed')
+            self._queue.put((future, function, pipeline))
+        return future
+
+    def stop(self):
+        """Let the worker finish the queued operations, close the DDS and exit.
+        """
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+
+    def run(self):
+        try:
+            self.dds = self.factory()
+        except Exception as e:
+            item = self._queue.get()
+            while item is not None:
+                item[0].set_exception(e)
+                item = self._queue.get()
+            return
+
+        try:
+            item = self._queue.get()
+            while item is not None:
+                group = [item]
+                item = self._next(group)
+                self._execute(group)
+                if item is False:
+                    item = self._queue.get()
+        finally:
+            self.dds.dac.close()
+
+    def _next(self, group):
+        """Add the queued operations that can be combined with the first one of group.
+
+            :return: the next item not added, False if the queue is empty
+        """
+        if not group[0][2]:
+            return False
+        while len(group) < self.PIPELINE:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return False
+            if item is None or not item[2]:
+                return item
+            group.append(item)
+        return False
+
+    def _execute(self, group):
+        done = []
+        error = None
+        try:
+            if group[0][2]:
+                with self.dds.dac.coalesce():
+                    self._call(group, done)
+            else:
+                #on its own timing, e.g. a sweep with dwell, its writes must leave when they are made
+                self._call(group, done)
+        except Exception as e:
+            error = e #the combined transfer failed
+        self.operations += len(done)
+        self.groups += 1
+        for future, result, exception in done:
+            exception = exception or error
+            if exception is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
+
+    def _call(self, group, done):
+        """Call the operations of a group, appending (future, result, exception) to done.
+        """
+        for future, function, pipeline in group:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                with self.dds.dac.discard_on_error():
+                    done.append((future, function(self.dds), None))
+            except Exception as e:
+                done.append((future, None, e))
+
+class AsyncDDS(object):
+    """asyncio facade of :class:`pydualdds.DDS`.
+
+        The DDS operations of FORWARD are available as methods with the arguments of :class:`pydualdds.DDS`;
+        they queue the operation to the I/O worker and return an awaitable of its result. Operations are
+        executed in the order of the calls. Operations of SERIAL rely on their own timing and are never
+        combined with others.
+    """
+    FORWARD = ('config_board', 'attach', 'start_up_sequence', 'nco_freq_a', 'nco_freq_b', 'nco_phase_a',
+               'nco_phase_b', 'amplitude_a', 'amplitude_b', 'update', 'sweep', 'envelope', 'nco_sync')
+    SERIAL = ('sweep', 'envelope')
+
+    def __init__(self, *args, **kwargs):
+        """Start the I/O worker, which opens the board.
+
+            Arguments are passed on to :class:`pydualdds.DDS`. The keyword arguments factory, a callable
+            creating the DDS instead, and pipeline, the maximum number of operations combined, are taken out.
+        """
+        factory = kwargs.pop('factory', None)
+        pipeline = kwargs.pop('pipeline', 64)
+        if factory is None:
+            factory = lambda: DDS(*args, **kwargs)
+        self.worker = DDSWorker(factory, pipeline)
+        self.worker.start()
+
+    def __getattr__(self, name):
+        if name not in self.FORWARD:
+            raise AttributeError(name)
+        pipeline = name not in self.SERIAL
+        def method(*args, **kwargs):
+            return self.run(lambda dds: getattr(dds, name)(*args, **kwargs), pipeline)
+        method.__name__ = name
+        method.__doc__ = getattr(DDS, name).__doc__
+        return method
+
+    def run(self, function, pipeline=True):
+        """Run a function with the DDS in the I/O worker.
+
+            :param function: callable taking the :class:`pydualdds.DDS` as only argument
+            :param bool pipeline: allow combining the operation with other queued operations
+            :return: awaitable of the result
+        """
+        return asyncio.wrap_future(self.worker.submit(function, pipeline))
+
+    def dac_write(self, address, data, force=False):
+        """Write a DAC register, see :meth:`pydualdds.DacCom.dac_write`.
+        """
+        return self.run(lambda dds: dds.dac.dac_write(address, data, force))
+
+    def dac_read(self, address, cached=True):
+        """Read a DAC register, see :meth:`pydualdds.DacCom.dac_read`.
+        """
+        return self.run(lambda dds: dds.dac.dac_read(address, cached))
+
+    def lmk_write(self, address, data, force=False):
+        """Write a LMK04828 register, see :meth:`pydualdds.DacCom.lmk_write`.
+        """
+        return self.run(lambda dds: dds.dac.lmk_write(address, data, force))
+
+    def lmk_read(self, address, cached=True):
+        """Read a LMK04828 register, see :meth:`pydualdds.DacCom.lmk_read`.
+        """
+        return self.run(lambda dds: dds.dac.lmk_read(address, cached))
+
+    def write_batch(self, writes, force=False):
+        """Write many registers, see :meth:`pydualdds.DacCom.write_batch`.
+        """
+        writes = list(writes)
+        return self.run(lambda dds: dds.dac.write_batch(writes, force))
+
+    def read_batch(self, reads, cached=True):
+        """Read many registers, see :meth:`pydualdds.DacCom.read_batch`.
+        """
+        reads = list(reads)
+        return self.run(lambda dds: dds.dac.read_batch(reads, cached))
+
+    async def close(self):
+        """Wait for the queued operations and close the connection to the DAC card.
+        """
+        self.worker.stop()
+        await asyncio.get_event_loop().run_in_executor(None, self.worker.join)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -0,0 +1,157 @@
+#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+
+#    Copyright (C) 2017 Andreas Fognini
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of the register I/O against the simulated board.
+
+Reports per call the USB transactions, bytes on the wire and wall time of the register
+accesses and the DDS operations, and writes them as JSON::
+
+    python pydualdds_bench.py -o bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import sys
+import time
+
+from pydualdds import DDS
+from pydualdds_sim import EvmSimulator
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'PLL_M9N5Ref1228_8MHz_PLLlock.cfg')
+
+def alternating(function, values):
+    """Callable passing the values in turn to function, so that repeated calls change the registers.
+
+        :param function: callable taking one value
+        :param values: sequence of at least two values
+    """
+    values = itertools.cycle(values)
+    return lambda: function(next(values))
+
+class Benchmark(object):
+    """Run the DDS operations on a simulated board and count the USB traffic.
+    """
+    def __init__(self, config=CONFIG, bulk=True, shadow=True, sync=True):
+        """
+            :param str config: Path to configuration file
+            :param bool bulk: render transactions into bulk transfers
+            :param bool shadow: elide writes of unchanged registers
+            :param bool sync: sample reads in the transfer of their waveform
+        """
+        self.board = EvmSimulator()
+        self.transport = self.board.transport()
+        self.transport.BULK = bulk
+        self.transport.SYNC = sync
+        self.dds = DDS(config=config, transport=self.transport)
+        self.dds.dac.DEBUG = False
+        self.dds.dac.SHADOW = shadow
+        self.results = {}
+
+    def controllers(self):
+        """GPIO controllers whose traffic is counted.
+        """
+        return [self.transport.gpio, self.transport.gpio_dac]
+
+    def measure(self, name, function, calls=1):
+        """Run a function and record its traffic and wall time per call.
+
+            :param str name: name of the result
+            :param function: callable without arguments
+            :param int calls: number of repetitions
+            :return: result dictionary
+        """
+        for c in self.controllers():
+            c.reset_counters()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for _ in range(calls):
+                function()
+            seconds = time.perf_counter() - start
+        writes = sum(c.writes for c in self.controllers())
+        reads = sum(c.reads for c in self.controllers())
+        directions = sum(c.direction_changes for c in self.controllers())
+        result = {
+            'calls': calls,
+            'usb_transactions': (writes + reads + directions) / float(calls),
+            'writes': writes / float(calls),
+            'reads': reads / float(calls),
+            'direction_changes': directions / float(calls),
+            'bytes': sum(c.bytes_written + c.bytes_read for c in self.controllers()) / float(calls),
+            'seconds': seconds / calls,
+        }
+        self.results[name] = result
+        return result
+
+    def run(self, calls=20):
+        """Run the full suite.
+
+            :param int calls: repetitions of the single register accesses
+            :return: results by name
+        """
+        dds = self.dds
+        dac = dds.dac
+        self.measure('config_board', dds.config_board)
+        self.measure('start_up_sequence', dds.start_up_sequence)
+        self.measure('dac_write', alternating(lambda v: dac.dac_write(0x0132, v), (0x8400, 0x8401)), calls)
+        self.measure('dac_read', lambda: dac.dac_read(0x0132, cached=False), calls)
+        self.measure('lmk_write', alternating(lambda v: dac.lmk_write(0x0139, v), (0x02, 0x03)), calls)
+        self.measure('lmk_read', lambda: dac.lmk_read(0x0139, cached=False), calls)
+        reads = [k for k in sorted(dac.CONFIG.expected()) if k[0] == 'dac'][:32]
+        self.measure('dac_read_batch_32', lambda: dac.read_batch(reads, cached=False), calls)
+        self.measure('nco_freq_a', alternating(dds.nco_freq_a, (397.76, 400.0)), calls)
+        self.measure('nco_sync', lambda: dds.nco_sync(arm=True), calls)
+        self.measure('nco_sync_armed', dds.nco_sync, calls)
+        self.measure('nco_sync_pulse', dds.nco_sync_pulse, calls)
+        return self.results
+
+    def report(self):
+        """Results as a JSON serializable dictionary.
+        """
+        return {
+            'transport': type(self.transport).__name__,
+            'bulk': self.transport.BULK,
+            'sync': self.transport.SYNC,
+            'shadow': self.dds.dac.SHADOW,
+            'results': self.results,
+        }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark PyDualDDS register I/O on the simulated board.')
+    parser.add_argument('-o', '--output', help='write JSON results to this file instead of stdout')
+    parser.add_argument('-c', '--config', default=CONFIG, help='configuration file')
+    parser.add_argument('-n', '--calls', type=int, default=20, help='repetitions of the single accesses')
+    parser.add_argument('--no-bulk', action='store_true', help='write every edge on its own')
+    parser.add_argument('--no-shadow', action='store_true', help='write registers even if unchanged')
+    parser.add_argument('--no-sync', action='store_true', help='read the port once per sampled bit')
+    args = parser.parse_args(argv)
+
+    bench = Benchmark(config=args.config, bulk=not args.no_bulk, shadow=not args.no_shadow, sync=not args.no_sync)
+    bench.run(args.calls)
+    text = json.dumps(bench.report(), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+
+if __name__ == "__main__":
+    main()
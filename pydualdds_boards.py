@@ -0,0 +1,179 @@
+#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+
+#    Copyright (C) 2017 Andreas Fognini
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Drive several boards from one process.
+
+Each board is addressed by the serial number of its FT2232H or by a FTDI URL without interface. The boards
+are brought up in parallel and can be set to the same frequency plan at once::
+
+    boards = BoardManager(['FT1ABCDE', 'FT1ABCDF'])
+    boards.config_board()
+    boards.start_up_sequence()
+    boards.update(freq_a=100, freq_b=100, phase_b=90)
+"""
+
+import collections
+import concurrent.futures
+
+from pydualdds import DDS, BitBangTransport
+
+FTDI_VID = 0x0403
+FT2232H_PID = 0x6010
+
+def find_boards():
+    """Serial numbers of the FT2232H connected.
+
+        :return: list of serial numbers
+    """
+    from pyftdi.ftdi import Ftdi
+    serials = []
+    for device in Ftdi.find_all([(FTDI_VID, FT2232H_PID)], nocache=True):
+        descriptor = device[0]
+        #older pyftdi returns (vid, pid, serial, interfaces, description)
+        serials.append(getattr(descriptor, 'sn', None) or device[2])
+    return serials
+
+def board_urls(board):
+    """FTDI URLs of the interfaces of a board.
+
+        :param str board: serial number or FTDI URL without interface, e.g. 'ftdi://ftdi:2232h:FT1ABCDE'
+        :return: URL of the reset interface, URL of the SPI interface
+    """
+    if '://' not in board:
+        board = 'ftdi://ftdi:2232h:%s' % board
+    board = board.rstrip('/')
+    return board + '/1', board + '/2'
+
+class BoardErrors(RuntimeError):
+    """Operation failed on some of the boards.
+
+        The attribute errors holds the exception of each failed board, results the results of the others.
+    """
+    def __init__(self, errors, results):
+        RuntimeError.__init__(self, 'failed on %s' % ', '.join('%s: %s' % (b, e) for b, e in errors.items()))
+        self.errors = errors
+        self.results = results
+
+class BoardManager(object):
+    """One :class:`pydualdds.DDS` per board, operated in parallel on a thread pool.
+
+        Operations return an ordered dictionary of the result of each board by name. If an operation fails on
+        some boards, it still completes on the others and :class:`BoardErrors` is raised.
+    """
+    def __init__(self, boards, config="./config/PLL_M9N5Ref1228_8MHz_PLLlock.cfg", transport=BitBangTransport, threads=None):
+        """Open the boards in parallel.
+
+            :param boards: serial numbers or FTDI URLs without interface, see :func:`board_urls`
+            :param str config: Path to configuration file
+            :param transport: callable(url_reset, url_spi) creating the transport of a board
+            :param int threads: size of the thread pool, one thread per board by default
+        """
+        boards = list(boards)
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=threads or max(len(boards), 1))
+        self.dds = collections.OrderedDict((b, None) for b in boards)
+
+        def open_board(board):
+            return DDS(config=config, transport=transport(*board_urls(board)))
+        try:
+            self.dds.update(self._run(open_board, boards))
+        except BoardErrors as e:
+            for dds in e.results.values():
+                dds.dac.close()
+            self.pool.shutdown()
+            raise
+
+    @classmethod
+    def discover(cls, **kwargs):
+        """Create a manager of all connected boards.
+
+            :return: :class:`BoardManager`
+        """
+        return cls(find_boards(), **kwargs)
+
+    def __len__(self):
+        return len(self.dds)
+
+    def __iter__(self):
+        return iter(self.dds.values())
+
+    def __getitem__(self, board):
+        return self.dds[board]
+
+    def _run(self, function, boards):
+        futures = collections.OrderedDict((b, self.pool.submit(function, b)) for b in boards)
+        results = collections.OrderedDict()
+        errors = collections.OrderedDict()
+        for board, future in futures.items():
+            try:
+                results[board] = future.result()
+            except Exception as e:
+                errors[board] = e
+        if errors:
+            raise BoardErrors(errors, results)
+        return results
+
+    def map(self, function, boards=None):
+        """Run a function on the boards in parallel.
+
+            :param function: callable taking the :class:`pydualdds.DDS` of a board
+            :param boards: names of the boards, all by default
+            :return: results by board
+        """
+        if boards is None:
+            boards = list(self.dds)
+        return self._run(lambda b: function(self.dds[b]), boards)
+
+    def config_board(self, verify='full', warm=False):
+        """Configure all boards, see :meth:`pydualdds.DDS.config_board`.
+        """
+        return self.map(lambda dds: dds.config_board(verify=verify, warm=warm))
+
+    def attach(self):
+        """Attach to all running boards, see :meth:`pydualdds.DDS.attach`.
+        """
+        return self.map(lambda dds: dds.attach())
+
+    def start_up_sequence(self):
+        """Run the start up sequence on all boards, see :meth:`pydualdds.DDS.start_up_sequence`.
+        """
+        return self.map(lambda dds: dds.start_up_sequence())
+
+    def nco_sync(self):
+        """Synchronize the NCOs of each board, see :meth:`pydualdds.DDS.nco_sync`.
+        """
+        return self.map(lambda dds: dds.nco_sync())
+
+    def update(self, freq_a=None, freq_b=None, phase_a=None, phase_b=None, amp_a=None, amp_b=None):
+        """Set the same frequency plan on every board, see :meth:`pydualdds.DDS.update`.
+        """
+        return self.map(lambda dds: dds.update(freq_a, freq_b, phase_a, phase_b, amp_a, amp_b))
+
+    def update_each(self, plans):
+        """Set a frequency plan per board.
+
+            :param plans: dictionary of board name to keyword arguments of :meth:`pydualdds.DDS.update`
+            :return: results by board
+        """
+        return self._run(lambda b: self.dds[b].update(**plans[b]), list(plans))
+
+    def close(self):
+        """Close the connections to all boards.
+        """
+        for dds in self.dds.values():
+            dds.dac.close()
+        self.pool.shutdown()
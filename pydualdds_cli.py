@@ -0,0 +1,194 @@
+#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+
+#    Copyright (C) 2017 Andreas Fognini
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Command line interface of the DDS, installed as ``pydualdds``::
+
+    pydualdds configure
+    pydualdds freq a 397.76
+    pydualdds phase b 90
+    pydualdds amp ab 0.5
+    pydualdds sync
+    pydualdds dump --lmk
+    pydualdds run script.txt
+
+A script holds one command per line with the same syntax, '#' starts a comment. The whole script is checked
+before the board is touched and then executed in one session: consecutive freq, phase and amp commands are
+merged into one :meth:`pydualdds.DDS.update` and all register writes are combined into as few transfers as the
+transport allows.
+"""
+
+import argparse
+import shlex
+import sys
+
+from pydualdds import DDS
+
+CHANNELS = {'a': ('a',), 'b': ('b',), 'ab': ('a', 'b')}
+PARAMETERS = {'freq': 'freq_', 'phase': 'phase_', 'amp': 'amp_'}
+
+class ScriptError(ValueError):
+    """A line of a script is not a valid command.
+    """
+    pass
+
+class _Parser(argparse.ArgumentParser):
+    """Argument parser raising ScriptError instead of exiting, for script lines.
+    """
+    def error(self, message):
+        raise ScriptError(message)
+
+def add_commands(subparsers):
+    """Add the register commands, shared by the command line and scripts.
+
+        :param subparsers: result of add_subparsers of an argument parser
+    """
+    p = subparsers.add_parser('freq', help='set the NCO frequency in MHz')
+    p.add_argument('channel', choices=sorted(CHANNELS))
+    p.add_argument('value', type=float)
+    p = subparsers.add_parser('phase', help='set the NCO phase in degrees')
+    p.add_argument('channel', choices=sorted(CHANNELS))
+    p.add_argument('value', type=float)
+    p = subparsers.add_parser('amp', help='set the amplitude, 0 to 2')
+    p.add_argument('channel', choices=sorted(CHANNELS))
+    p.add_argument('value', type=float)
+    subparsers.add_parser('sync', help='synchronize the NCOs by SYSREF')
+    p = subparsers.add_parser('configure', help='configure the board and run the start up sequence')
+    p.add_argument('--verify', choices=('full', 'sampled', 'off'), default='full', help='read back verification')
+    p.add_argument('--warm', action='store_true', help='attach to the running board, write only differences')
+    p = subparsers.add_parser('dump', help='read back and print the configured registers')
+    group = p.add_mutually_exclusive_group()
+    group.add_argument('--dac', action='store_true', help='DAC registers only')
+    group.add_argument('--lmk', action='store_true', help='LMK04828 registers only')
+
+def script_parser():
+    parser = _Parser(prog='script', add_help=False)
+    add_commands(parser.add_subparsers(dest='command', parser_class=_Parser))
+    return parser
+
+def compile_script(lines):
+    """Parse the lines of a script.
+
+        :param lines: iterable of str
+        :return: list of parsed commands
+        :raises ScriptError: with the line number of the first invalid line
+    """
+    parser = script_parser()
+    commands = []
+    for number, line in enumerate(lines, 1):
+        words = shlex.split(line, comments=True)
+        if not words:
+            continue
+        try:
+            command = parser.parse_args(words)
+        except ScriptError as e:
+            raise ScriptError('line %d: %s' % (number, e))
+        if command.command is None:
+            raise ScriptError('line %d: no command' % number)
+        commands.append(command)
+    return commands
+
+def run_command(dds, command, out=sys.stdout):
+    """Execute a single parsed command.
+
+        :param dds: :class:`pydualdds.DDS`
+        :param command: parsed command
+        :param out: stream dump writes to
+    """
+    if command.command in PARAMETERS:
+        dds.update(**parameters(command))
+    elif command.command == 'sync':
+        dds.nco_sync()
+    elif command.command == 'configure':
+        if command.warm:
+            dds.attach()
+        else:
+            dds.config_board(verify=command.verify)
+            dds.start_up_sequence()
+    elif command.command == 'dump':
+        keys = [k for k in sorted(dds.dac.CONFIG.expected())
+                if not (command.dac and k[0] != 'dac') and not (command.lmk and k[0] != 'lmk')]
+        out.write("Bus:\tAdr:\tRead:\n")
+        for (bus, adr), value in zip(keys, dds.dac.read_batch(keys, cached=False)):
+            out.write(bus + "\t" + hex(adr) + "\t" + hex(value) + "\n")
+
+def parameters(command):
+    """Keyword arguments of :meth:`pydualdds.DDS.update` for a freq, phase or amp command.
+    """
+    return dict((PARAMETERS[command.command] + ch, command.value) for ch in CHANNELS[command.channel])
+
+def run_script(dds, commands, out=sys.stdout):
+    """Execute parsed commands in one session.
+
+        Consecutive freq, phase and amp commands are applied by one update, the register writes of all commands
+        are combined into as few transfers as the transport allows.
+
+        :param dds: :class:`pydualdds.DDS`
+        :param commands: result of :func:`compile_script`
+        :param out: stream dump writes to
+    """
+    with dds.dac.coalesce():
+        pending = {}
+        for command in commands:
+            if command.command in PARAMETERS:
+                pending.update(parameters(command))
+                continue
+            if pending:
+                dds.update(**pending)
+                pending = {}
+            run_command(dds, command, out)
+        if pending:
+            dds.update(**pending)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pydualdds', description='Control the DAC38RF82EVM dual DDS.')
+    parser.add_argument('-c', '--config', default="./config/PLL_M9N5Ref1228_8MHz_PLLlock.cfg", help='configuration file')
+    parser.add_argument('--sim', action='store_true', help='use the simulated board')
+    subparsers = parser.add_subparsers(dest='command')
+    add_commands(subparsers)
+    p = subparsers.add_parser('run', help='execute a script of commands in one session')
+    p.add_argument('script', help="script file, one command per line, '-' for stdin")
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error('a command is required')
+
+    commands = None
+    if args.command == 'run':
+        try:
+            if args.script == '-':
+                commands = compile_script(sys.stdin)
+            else:
+                with open(args.script) as f:
+                    commands = compile_script(f)
+        except (OSError, ScriptError) as e:
+            parser.error(str(e))
+
+    transport = None
+    if args.sim:
+        from pydualdds_sim import EvmSimulator
+        transport = EvmSimulator().transport()
+    dds = DDS(config=args.config, transport=transport)
+    try:
+        if commands is not None:
+            run_script(dds, commands)
+        else:
+            run_command(dds, args)
+    finally:
+        dds.dac.close()
+
+if __name__ == "__main__":
+    main()
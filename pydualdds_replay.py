@@ -0,0 +1,122 @@
+#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+
+#    Copyright (C) 2017 Andreas Fognini
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Replay of SPI transaction logs written by :class:`pydualdds.SpiRecorder`.
+
+The register writes of a log are sent back as fast as the transport allows, all writes between two DAC resets
+in one transfer. Reads are skipped. Record a sequence and replay it on the board or the simulator::
+
+    dds.dac.start_recording('bringup.log')
+    dds.config_board()
+    dds.start_up_sequence()
+    dds.dac.stop_recording()
+
+    python pydualdds_replay.py bringup.log
+    python pydualdds_replay.py --sim bringup.log
+    python pydualdds_replay.py --list bringup.log
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from pydualdds import DacCom, SpiRecorder
+
+DAC_PAGE_ADR = 0x09
+
+def segments(records):
+    """Register writes of a log, split at the DAC resets.
+
+        Writes of the DAC page register are dropped, pages are selected again from the page of each write.
+
+        :param records: records as returned by :meth:`pydualdds.SpiRecorder.read_log`
+        :return: list of (reset, writes) with reset True if the DAC is reset before the writes, and writes as
+                 (bus, address, data) for :meth:`pydualdds.DacCom.write_batch`
+    """
+    result = [(False, [])]
+    for timestamp, bus, read, page, address, value in records:
+        if bus == 'reset':
+            result.append((True, []))
+        elif read:
+            continue
+        elif bus == 'dac':
+            if address != DAC_PAGE_ADR:
+                result[-1][1].append(('dac', (page << 8) | address, value))
+        else:
+            result[-1][1].append(('lmk', address, value))
+    return result
+
+def replay(dac, records):
+    """Send the register writes of a log.
+
+        :param dac: :class:`pydualdds.DacCom`
+        :param records: records as returned by :meth:`pydualdds.SpiRecorder.read_log`
+        :return: dictionary with 'writes', 'transfers', 'seconds' and the writes per second 'rate'
+    """
+    writes = 0
+    transfers = 0
+    start = time.perf_counter()
+    for reset, batch in segments(records):
+        if reset:
+            dac.dac_reset()
+        if batch:
+            dac.write_batch(batch, force=True, reorder=False)
+            transfers += 1
+        writes += len(batch)
+    seconds = time.perf_counter() - start
+    return {'writes': writes, 'transfers': transfers, 'seconds': seconds, 'rate': writes/seconds if seconds else 0.0}
+
+def format_record(record):
+    """One line description of a record.
+
+        :param record: (timestamp, bus, read, page, address, value)
+        :return: str
+    """
+    timestamp, bus, read, page, address, value = record
+    if bus == 'reset':
+        return '%.6f\treset' % timestamp
+    return '%.6f\t%s\t%s\t%d\t%s\t%s' % (timestamp, bus, 'R' if read else 'W', page, hex(address), hex(value))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a SPI transaction log of PyDualDDS.')
+    parser.add_argument('log', help='binary log file')
+    parser.add_argument('-c', '--config', default="./config/PLL_M9N5Ref1228_8MHz_PLLlock.cfg", help='configuration file')
+    parser.add_argument('--sim', action='store_true', help='replay to the simulated board')
+    parser.add_argument('--list', action='store_true', help='print the records instead of replaying them')
+    args = parser.parse_args(argv)
+
+    records = SpiRecorder.read_log(args.log)
+    if args.list:
+        for r in records:
+            sys.stdout.write(format_record(r) + '\n')
+        return
+
+    transport = None
+    if args.sim:
+        from pydualdds_sim import EvmSimulator
+        transport = EvmSimulator().transport()
+    dac = DacCom(config=args.config, transport=transport)
+    try:
+        result = replay(dac, records)
+    finally:
+        dac.close()
+    sys.stdout.write(json.dumps(result, indent=2, sort_keys=True) + '\n')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+
+#    Copyright (C) 2017 Andreas Fognini
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""DDS changes at given times relative to the start of a sequence.
+
+Example, retune channel B 2.5 ms after the start and resynchronize::
+
+    scheduler = Scheduler(dds)
+    scheduler.freq(0.0, 'a', 100.0)
+    scheduler.freq(2.5e-3, 'b', 150.0)
+    scheduler.sync(2.5e-3)
+    scheduler.run()
+    print(scheduler.stats())
+"""
+
+import collections
+import os
+import threading
+import time
+
+from pydualdds import BARRIER
+
+class Scheduler(object):
+    """Send timestamped frequency, phase, amplitude and sync operations as close to their deadlines as possible.
+
+        Operations at the same time are merged: parameter changes into one :meth:`pydualdds.DDS.update`, followed
+        by the sync. The register traffic of every time is rendered into one buffer before the sequence starts,
+        a dedicated thread, with real-time priority if the system grants it, waits for each deadline and sends
+        the buffer. An operation is late by the time between its deadline and the start of its transfer, it
+        missed its deadline if it is late by more than the tolerance.
+
+        Do not use the DDS from other threads while a sequence runs.
+    """
+    OPERATIONS = ('freq', 'phase', 'amp', 'sync')
+    PARAMETERS = {'freq': 'freq_', 'phase': 'phase_', 'amp': 'amp_'}
+    CHANNELS = {'a': ('a',), 'b': ('b',), 'ab': ('a', 'b')}
+
+    def __init__(self, dds, tolerance=100e-6, lead=0.01, realtime=True):
+        """
+            :param dds: :class:`pydualdds.DDS`
+            :param float tolerance: lateness in seconds up to which a deadline counts as met
+            :param float lead: seconds from :meth:`start` to the start of the sequence if no start time is given
+            :param bool realtime: request real-time priority for the sending thread
+        """
+        self.dds = dds
+        self.TOLERANCE = tolerance
+        self.LEAD = lead
+        self.REALTIME = realtime
+        self.events = []
+        self.steps = []
+        self.lateness = []
+        self.durations = []
+        self.realtime = False #real-time priority granted
+        self.thread = None
+
+    def add(self, t, operation, channel='a', value=None):
+        """Add an operation.
+
+            :param float t: time in seconds after the start of the sequence
+            :param str operation: 'freq' (MHz), 'phase' (degrees), 'amp' (0-2) or 'sync'
+            :param str channel: 'a', 'b' or 'ab' for both
+            :param float value: new value, None for sync
+        """
+        if operation not in self.OPERATIONS:
+            raise ValueError('unknown operation %r' % operation)
+        if channel not in self.CHANNELS:
+            raise ValueError('unknown channel %r' % channel)
+        if operation != 'sync' and value is None:
+            raise ValueError('%s needs a value' % operation)
+        if t < 0:
+            raise ValueError('negative time')
+        self.events.append((t, len(self.events), operation, channel, value))
+
+    def freq(self, t, channel, freq):
+        """Set the frequency of a channel in MHz at time t.
+        """
+        self.add(t, 'freq', channel, freq)
+
+    def phase(self, t, channel, deg):
+        """Set the phase of a channel in degrees at time t.
+        """
+        self.add(t, 'phase', channel, deg)
+
+    def amp(self, t, channel, gain):
+        """Set the amplitude of a channel at time t.
+        """
+        self.add(t, 'amp', channel, gain)
+
+    def sync(self, t):
+        """Synchronize the NCOs at time t, see :meth:`pydualdds.DDS.nco_sync`.
+        """
+        self.add(t, 'sync')
+
+    def clear(self):
+        """Remove all operations and results.
+        """
+        self.events = []
+        self.steps = []
+        self.reset_stats()
+
+    def prepare(self):
+        """Render the register traffic of the operations.
+
+            Register writes are left out if the register holds the value, at the start or set by an earlier step.
+
+            :return: number of steps, one per distinct time
+        """
+        dds = self.dds
+        dac = dds.dac
+        planned = collections.ChainMap({}, dac.dac_shadow)
+        page = dac.DAC_PAGE
+        armed = dds.sync_armed()
+        steps = []
+        events = sorted(self.events)
+        i = 0
+        while i < len(events):
+            t = events[i][0]
+            params = {}
+            sync = None
+            while i < len(events) and events[i][0] == t:
+                operation, channel, value = events[i][2:]
+                if operation == 'sync':
+                    sync = not armed
+                    armed = True
+                else:
+                    for ch in self.CHANNELS[channel]:
+                        params[self.PARAMETERS[operation] + ch] = value
+                i += 1
+            writes = dac.order_writes(dds.update_writes(shadow=planned, **params), page) if params else []
+            if sync is not None:
+                writes += [BARRIER] + [('lmk', a, v) for a, v in (dds.SYNC_ARM if sync else []) + dds.SYNC_PULSE]
+            writes = [w for w in writes if w is not BARRIER]
+            transactions, updates, page = dac.plan_writes(writes, force=True, page=page)
+            for bus, address, data in updates:
+                if bus == 'dac':
+                    for k in dac.dac_shadow_keys(address):
+                        planned[k] = data
+            steps.append((t, dac.transport.render(transactions) if transactions else None, updates, page, sync))
+        self.steps = steps
+        return len(steps)
+
+    def start(self, t0=None):
+        """Render the operations and start sending them in the background.
+
+            The statistics of earlier runs are reset.
+
+            :param float t0: time.perf_counter() value of the start of the sequence, LEAD from now by default
+        """
+        if self.thread is not None:
+            raise RuntimeError('sequence is running')
+        self.reset_stats()
+        self.prepare()
+        if t0 is None:
+            t0 = time.perf_counter() + self.LEAD
+        self.thread = threading.Thread(target=self._run, args=(t0,), name='pydualdds-schedule')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def wait(self):
+        """Wait for the end of the sequence.
+
+            :return: :meth:`stats`
+        """
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        return self.stats()
+
+    def run(self, t0=None):
+        """Render and send the operations, returning at the end of the sequence.
+
+            :param float t0: time.perf_counter() value of the start of the sequence, LEAD from now by default
+            :return: :meth:`stats`
+        """
+        self.start(t0)
+        return self.wait()
+
+    def _raise_priority(self):
+        """Switch the calling thread to real-time scheduling.
+
+            :return: True if granted
+        """
+        try:
+            policy = os.SCHED_FIFO
+            os.sched_setscheduler(0, policy, os.sched_param(os.sched_get_priority_min(policy)))
+            return True
+        except (AttributeError, OSError):
+            return False
+
+    def _run(self, t0):
+        self.realtime = self.REALTIME and self._raise_priority()
+        dds = self.dds
+        dac = dds.dac
+        for t, buf, updates, page, sync in self.steps:
+            deadline = t0 + t
+            dds._wait_until(deadline)
+            start = time.perf_counter()
+            if buf is not None:
+                dac.commit_writes(buf, updates, page)
+            self.lateness.append(start - deadline)
+            self.durations.append(time.perf_counter() - start)
+            if sync:
+                dds._sync_armed = True
+
+    def reset_stats(self):
+        """Forget the recorded lateness.
+        """
+        self.lateness = []
+        self.durations = []
+
+    def stats(self):
+        """Lateness statistics of the steps sent so far.
+
+            :return: dictionary with count, missed (late by more than the tolerance), the times of the missed steps,
+                     min, max, mean, median and p99 of the lateness and the longest transfer in seconds
+        """
+        n = len(self.lateness)
+        if n == 0:
+            return {'count': 0, 'missed': 0, 'missed_times': []}
+        ordered = sorted(self.lateness)
+        missed = [step[0] for step, late in zip(self.steps, self.lateness) if late > self.TOLERANCE]
+        return {
+            'count': n,
+            'missed': len(missed),
+            'missed_times': missed,
+            'min': ordered[0],
+            'max': ordered[-1],
+            'mean': sum(ordered)/n,
+            'median': ordered[n//2],
+            'p99': ordered[min(n - 1, int(0.99*n))],
+            'transfer_max': max(self.durations),
+            'realtime': self.realtime,
+        }
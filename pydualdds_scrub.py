@@ -0,0 +1,237 @@
+#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+
+#    Copyright (C) 2017 Andreas Fognini
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Background check of the register contents of a running board.
+
+A :class:`Scrubber` reads the configured and shadowed registers back in small slices and reports, or repairs,
+registers that no longer hold their value, e.g. after a brown-out::
+
+    scrubber = Scrubber(dds, repair=True, callback=print)
+    scrubber.start()
+    ...
+    scrubber.stop()
+"""
+
+import collections
+import threading
+import time
+
+class Scrubber(object):
+    """Thread reading back the registers of a board while it is in use.
+
+        The expected value of a register is the shadow value if known, else the value of the configuration.
+        Registers set at run time (DAC_RUNTIME of :class:`pydualdds.DacCom`) are only checked against the shadow,
+        volatile registers and the DAC page register not at all.
+
+        Foreground calls have priority: while the scrubber runs, the register I/O methods of the
+        :class:`pydualdds.DacCom` take a bus lock and the scrubber gives the bus up after the register it is
+        reading as soon as a foreground call waits. It resumes only after the bus was idle for QUIET seconds.
+
+        A register found different is removed from the shadow, so the next foreground write to it is not elided,
+        and rewritten with its expected value if repair is set. Differences are passed to the callback and kept in
+        the attribute mismatches as (time, bus, address, expected value, read value).
+    """
+    #DacCom methods taking the bus lock while scrubbing
+    FOREGROUND = ('dac_reset', 'dac_write', 'dac_read', 'lmk_write', 'lmk_read', 'write_batch', 'read_batch',
+                  'commit_writes', 'dac_change_page', 'dac_write_byte', 'dac_read_byte')
+    #Transport methods taking the bus lock: release sends the writes held by DacCom.coalesce, render uses the
+    #port state of the transport
+    TRANSPORT_FOREGROUND = ('release', 'render')
+
+    def __init__(self, dds, period=10.0, slice_size=8, pause=0.01, quiet=0.05, repair=False, callback=None):
+        """
+            :param dds: :class:`pydualdds.DDS` or :class:`pydualdds.DacCom`
+            :param float period: seconds from the start of one scrub cycle to the next
+            :param int slice_size: registers read per bus access
+            :param float pause: seconds between slices
+            :param float quiet: seconds the bus must be idle before a slice
+            :param bool repair: rewrite registers found different
+            :param callback: callable(bus, address, expected value, read value) called on a difference
+        """
+        self.dac = getattr(dds, 'dac', dds)
+        self.PERIOD = period
+        self.SLICE = slice_size
+        self.PAUSE = pause
+        self.QUIET = quiet
+        self.REPAIR = repair
+        self.callback = callback
+
+        self.lock = threading.RLock()
+        self.thread = None
+        self.mismatches = collections.deque(maxlen=1000)
+        self.cycles = 0
+        self.reads = 0
+        self.repairs = 0
+        self.yields = 0 #slices cut short by a foreground call
+        self.last_foreground = 0.0
+        self._waiting = 0
+        self._stop = threading.Event()
+        self._installed = [] #(instance, name, previous attribute or None, wrapper)
+        self._token = None #identifies the wrappers of the current run
+
+    def start(self):
+        """Start scrubbing in the background.
+        """
+        if self.thread is not None:
+            return
+        self._token = token = object()
+        transport = self.dac.transport
+        for obj, names in ((self.dac, self.FOREGROUND), (transport, self.TRANSPORT_FOREGROUND)):
+            for name in names:
+                previous = obj.__dict__.get(name)
+                wrapper = self._foreground(getattr(obj, name), token)
+                setattr(obj, name, wrapper)
+                self._installed.append((obj, name, previous, wrapper))
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._run, name='pydualdds-scrub')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop scrubbing and release the bus lock of the foreground calls.
+
+            A wrapper another wrapper was installed over, e.g. by :meth:`pydualdds.Metrics.install`, stays in
+            place but no longer takes the lock.
+        """
+        if self.thread is None:
+            return
+        self._stop.set()
+        self.thread.join()
+        self.thread = None
+        self._token = None
+        for obj, name, previous, wrapper in reversed(self._installed):
+            if obj.__dict__.get(name) is not wrapper:
+                continue
+            if previous is None:
+                delattr(obj, name)
+            else:
+                setattr(obj, name, previous)
+        self._installed = []
+
+    def _foreground(self, function, token):
+        def call(*args, **kwargs):
+            if self._token is not token or threading.current_thread() is self.thread:
+                return function(*args, **kwargs)
+            self._waiting += 1
+            self.lock.acquire()
+            self._waiting -= 1
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.last_foreground = time.monotonic()
+                self.lock.release()
+        return call
+
+    def expected(self):
+        """Registers to check and their expected values.
+
+            :return: ordered dictionary (bus, address) -> value with DAC addresses of a single page
+        """
+        dac = self.dac
+        expected = collections.OrderedDict()
+        for bus, adr, value in dac.CONFIG.writes():
+            if bus == 'dac':
+                for key in dac.dac_shadow_keys(adr):
+                    if key not in dac.DAC_RUNTIME:
+                        expected[('dac', key)] = value
+            else:
+                expected[('lmk', adr)] = value
+        for adr, value in list(dac.dac_shadow.items()):
+            expected[('dac', adr)] = value
+        for adr, value in list(dac.lmk_shadow.items()):
+            expected[('lmk', adr)] = value
+        for key in list(expected):
+            bus, adr = key
+            if bus == 'dac' and (adr % 0x100 == dac.DAC_PAGE_ADR or adr in dac.DAC_VOLATILE):
+                del expected[key]
+            elif bus == 'lmk' and adr in dac.LMK_VOLATILE:
+                del expected[key]
+        return expected
+
+    def check(self, bus, address, value):
+        """Read a register back and handle a difference, with the bus lock held.
+
+            The DAC page selected before is selected again afterwards, buffers rendered in advance rely on it.
+
+            :return: True if the register holds the value
+        """
+        dac = self.dac
+        page = dac.DAC_PAGE
+        try:
+            return self._check(bus, address, value)
+        finally:
+            if page is not None and dac.DAC_PAGE != page:
+                dac.dac_change_page(page)
+
+    def _check(self, bus, address, value):
+        dac = self.dac
+        if bus == 'dac':
+            dac.dac_change_page(address >> 8)
+            read = dac.dac_read_byte(address % 0x100)
+        else:
+            read = dac.transport.lmk_read(address)
+        self.reads += 1
+        if read == value:
+            return True
+        self.mismatches.append((time.time(), bus, address, value, read))
+        if bus == 'dac':
+            dac.dac_shadow.pop(address, None)
+        else:
+            dac.lmk_shadow.pop(address, None)
+        if self.REPAIR:
+            if bus == 'dac':
+                dac.dac_write(address, value, force=True)
+            else:
+                dac.lmk_write(address, value, force=True)
+            self.repairs += 1
+        if self.callback is not None:
+            self.callback(bus, address, value, read)
+        return False
+
+    def scrub(self):
+        """Run one scrub cycle in slices, yielding to foreground calls.
+
+            :return: number of registers found different
+        """
+        found = 0
+        pending = list(self.expected().items())
+        while pending and not self._stop.is_set():
+            while time.monotonic() - self.last_foreground < self.QUIET or self._waiting:
+                if self._stop.wait(self.QUIET):
+                    return found
+            with self.lock:
+                done = 0
+                for (bus, address), value in pending[:self.SLICE]:
+                    if self._waiting:
+                        self.yields += 1
+                        break
+                    #the shadow may have changed since the cycle started
+                    shadow = self.dac.dac_shadow if bus == 'dac' else self.dac.lmk_shadow
+                    if not self.check(bus, address, shadow.get(address, value)):
+                        found += 1
+                    done += 1
+                del pending[:done]
+            self._stop.wait(self.PAUSE)
+        self.cycles += 1
+        return found
+
+    def _run(self):
+        while not self._stop.is_set():
+            start = time.monotonic()
+            self.scrub()
+            self._stop.wait(max(0.0, self.PERIOD - (time.monotonic() - start)))
@@ -0,0 +1,559 @@
+#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+
+#    Copyright (C) 2017 Andreas Fognini
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Share one board between several processes through a Unix domain socket.
+
+The server owns the DDS and its FTDI interfaces::
+
+    python pydualdds_server.py -s /tmp/pydualdds.sock -c ./config/PLL_M9N5Ref1228_8MHz_PLLlock.cfg
+
+Clients use :class:`DDSProxy` like a :class:`pydualdds.DDS`::
+
+    dds = DDSProxy('/tmp/pydualdds.sock')
+    dds.nco_freq_a(100)
+
+Protocol: every request is a header (request id, opcode, payload length) followed by the payload, every
+response a header (request id, status, payload length) followed by the payload. Integers are little endian.
+
+========== ================================== ==================================
+Opcode     Request payload                    Response payload
+========== ================================== ==================================
+SET        n x (parameter: u8, value: f64)
+DAC_WRITE  address: u16, data: u16
+LMK_WRITE  address: u16, data: u16
+DAC_READ   address: u16                       value: u16
+LMK_READ   address: u16                       value: u16
+CALL       call: u8, verify: u8, warm: u8     n x (bus: u8, address, set, read: u16)
+INVOKE     JSON {"name", "args", "kwargs"}    JSON result
+========== ================================== ==================================
+
+On error the status is 1 and the payload the error message in UTF-8. CALL runs one of the DDS methods of CALLS,
+which return register differences. INVOKE runs one of the DDS methods of INVOKE_CALLS, arrays are sent as JSON
+lists.
+
+Writes to the same register or parameter waiting for the I/O worker are merged, the latest value wins. All
+waiting writes are applied together, parameter sets through :meth:`pydualdds.DDS.update`, and queued operations
+share their USB transfers, see :mod:`pydualdds_async`.
+"""
+
+import argparse
+import collections
+import contextlib
+import errno
+import json
+import os
+import socket
+import socketserver
+import stat
+import struct
+import tempfile
+import threading
+
+from pydualdds import DDS
+from pydualdds_async import AsyncDDS, DDSWorker
+
+SOCKET = os.path.join(tempfile.gettempdir(), 'pydualdds.sock')
+
+HEADER = struct.Struct('<IBH')
+SET_ITEM = struct.Struct('<Bd')
+REGISTER = struct.Struct('<HH')
+ADDRESS = struct.Struct('<H')
+CALL_ARGS = struct.Struct('<BBB')
+DELTA = struct.Struct('<BHHH')
+
+OP_SET = 1
+OP_DAC_WRITE = 2
+OP_LMK_WRITE = 3
+OP_DAC_READ = 4
+OP_LMK_READ = 5
+OP_CALL = 6
+OP_INVOKE = 7
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+PARAMETERS = ('freq_a', 'freq_b', 'phase_a', 'phase_b', 'amp_a', 'amp_b')
+CALLS = ('config_board', 'start_up_sequence', 'attach')
+INVOKE_CALLS = ('nco_sync', 'nco_sync_pulse', 'sweep', 'envelope')
+BUSES = ('dac', 'lmk')
+VERIFY = ('full', 'sampled', 'off')
+
+def _plain(value):
+    """JSON encoding of NumPy arrays and scalars.
+    """
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+class DDSServerError(RuntimeError):
+    """An operation failed on the server.
+    """
+    pass
+
+class DDSRequestHandler(socketserver.BaseRequestHandler):
+    """Read the requests of one client and pass them to the server.
+    """
+    def setup(self):
+        self.lock = threading.Lock()
+
+    def handle(self):
+        stream = self.request.makefile('rb')
+        while True:
+            header = stream.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            request_id, opcode, length = HEADER.unpack(header)
+            payload = stream.read(length)
+            if len(payload) < length:
+                return
+            self.server.dispatch(opcode, payload, lambda status, data=b'', i=request_id: self.reply(i, status, data))
+
+    def reply(self, request_id, status, payload=b''):
+        """Send a response, called from the I/O worker for deferred results.
+
+            :param int request_id: id of the request
+            :param int status: STATUS_OK or STATUS_ERROR
+            :param bytes payload: response payload
+        """
+        with self.lock:
+            try:
+                self.request.sendall(HEADER.pack(request_id, status, len(payload)) + payload)
+            except OSError:
+                pass #client is gone
+
+class DDSServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix domain socket server owning a :class:`pydualdds.DDS`.
+
+        Each client is served by its own thread, all board I/O runs in one :class:`pydualdds_async.DDSWorker`.
+        The attribute coalesced counts the writes that were merged into a later write of the same register.
+    """
+    daemon_threads = True
+
+    def __init__(self, path=SOCKET, *args, **kwargs):
+        """Open the board and listen on the socket.
+
+            Further arguments are passed on to :class:`pydualdds.DDS`. The keyword arguments factory, a callable
+            creating the DDS instead, and pipeline, the maximum number of operations combined, are taken out.
+
+            :param str path: path of the Unix domain socket, a stale socket file is replaced
+            :raises OSError: EADDRINUSE if a server is listening on the socket
+        """
+        factory = kwargs.pop('factory', None)
+        pipeline = kwargs.pop('pipeline', 64)
+        if factory is None:
+            factory = lambda: DDS(*args, **kwargs)
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except ConnectionRefusedError:
+                os.unlink(path) #stale socket file
+            except FileNotFoundError:
+                pass
+            else:
+                raise OSError(errno.EADDRINUSE, 'a DDS server is listening on %s' % path)
+            finally:
+                probe.close()
+        self.path = path
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._pending = collections.OrderedDict() #(kind, key) -> (value, waiters)
+        self._scheduled = False
+        socketserver.UnixStreamServer.__init__(self, path, DDSRequestHandler)
+        self.worker = DDSWorker(factory, pipeline)
+        self.worker.start()
+
+    def server_close(self):
+        """Close the socket, finish the queued operations and close the board.
+        """
+        socketserver.UnixStreamServer.server_close(self)
+        self.worker.stop()
+        self.worker.join()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def dispatch(self, opcode, payload, reply):
+        """Execute a request.
+
+            :param int opcode: operation
+            :param bytes payload: request payload
+            :param reply: callable(status, payload) sending the response
+        """
+        def done(future, encode=None):
+            error = future.exception()
+            if error is not None:
+                reply(STATUS_ERROR, str(error).encode('utf-8'))
+            else:
+                try:
+                    data = encode(future.result()) if encode else b''
+                except Exception as e:
+                    reply(STATUS_ERROR, ('cannot encode the result: %s' % e).encode('utf-8'))
+                else:
+                    reply(STATUS_OK, data)
+
+        try:
+            if opcode == OP_SET:
+                items = [SET_ITEM.unpack_from(payload, i) for i in range(0, len(payload), SET_ITEM.size)]
+                self.write([(('param', PARAMETERS[p]), value) for p, value in items], reply)
+            elif opcode in (OP_DAC_WRITE, OP_LMK_WRITE):
+                address, data = REGISTER.unpack(payload)
+                self.write([((BUSES[opcode - OP_DAC_WRITE], address), data)], reply)
+            elif opcode in (OP_DAC_READ, OP_LMK_READ):
+                address, = ADDRESS.unpack(payload)
+                if opcode == OP_DAC_READ:
+                    future = self.worker.submit(lambda dds: dds.dac.dac_read(address))
+                else:
+                    future = self.worker.submit(lambda dds: dds.dac.lmk_read(address))
+                future.add_done_callback(lambda f: done(f, ADDRESS.pack))
+            elif opcode == OP_CALL:
+                call, verify, warm = CALL_ARGS.unpack(payload)
+                name = CALLS[call]
+                if name == 'config_board':
+                    function = lambda dds: dds.config_board(verify=VERIFY[verify], warm=bool(warm))
+                else:
+                    function = lambda dds: getattr(dds, name)()
+                future = self.worker.submit(function)
+                future.add_done_callback(lambda f: done(f, encode_deltas))
+            elif opcode == OP_INVOKE:
+                request = json.loads(payload.decode('utf-8'))
+                name = request['name']
+                if name not in INVOKE_CALLS:
+                    raise ValueError('unknown call %r' % name)
+                args = request.get('args', [])
+                kwargs = request.get('kwargs', {})
+                future = self.worker.submit(lambda dds: getattr(dds, name)(*args, **kwargs),
+                                            pipeline=name not in AsyncDDS.SERIAL)
+                future.add_done_callback(lambda f: done(f, lambda r: json.dumps(r, default=_plain).encode('utf-8')))
+            else:
+                raise ValueError('unknown opcode %d' % opcode)
+        except (struct.error, IndexError, KeyError, TypeError, ValueError, RuntimeError) as e:
+            reply(STATUS_ERROR, str(e).encode('utf-8'))
+
+    def write(self, items, waiter):
+        """Queue writes, merging them with waiting writes to the same register or parameter.
+
+            :param items: sequence of ((kind, key), value) with kind 'param', 'dac' or 'lmk'
+            :param waiter: callable(status, payload) called once all items are written
+        """
+        if not items:
+            waiter(STATUS_OK)
+            return
+        remaining = [len(items)]
+        errors = []
+        def written(error):
+            if error is not None:
+                errors.append(error)
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                if errors:
+                    waiter(STATUS_ERROR, str(errors[0]).encode('utf-8'))
+                else:
+                    waiter(STATUS_OK)
+
+        with self._lock:
+            for key, value in items:
+                waiters = []
+                if key in self._pending:
+                    waiters = self._pending.pop(key)[1]
+                    self.coalesced += 1
+                waiters.append(written)
+                self._pending[key] = (value, waiters)
+            if not self._scheduled:
+                self._scheduled = True
+                box = {}
+                future = self.worker.submit(lambda dds: self._flush(dds, box))
+                future.add_done_callback(lambda f: self._written(box, f))
+
+    def _flush(self, dds, box):
+        """Apply all waiting writes in their order, runs in the I/O worker.
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = collections.OrderedDict()
+            self._scheduled = False
+        box['pending'] = pending
+
+        writes = []
+        params = {}
+        for (kind, key), (value, waiters) in pending.items():
+            if kind == 'param':
+                if writes:
+                    dds.dac.write_batch(writes)
+                    writes = []
+                params[key] = value
+            else:
+                if params:
+                    dds.update(**params)
+                    params = {}
+                writes.append((kind, key, value))
+        if writes:
+            dds.dac.write_batch(writes)
+        if params:
+            dds.update(**params)
+
+    def _written(self, box, future):
+        error = future.exception()
+        for value, waiters in box.get('pending', {}).values():
+            for waiter in waiters:
+                waiter(error)
+
+def encode_deltas(deltas):
+    """Encode the register differences returned by config_board and attach.
+
+        :param deltas: list of (bus, address, set value, read value) or None
+        :return: response payload
+    """
+    return b''.join(DELTA.pack(BUSES.index(bus), adr, value, read) for bus, adr, value, read in deltas or [])
+
+def decode_deltas(payload):
+    """Decode the payload of :func:`encode_deltas`.
+
+        :param bytes payload: response payload
+        :return: list of (bus, address, set value, read value)
+    """
+    deltas = [DELTA.unpack_from(payload, i) for i in range(0, len(payload), DELTA.size)]
+    return [(BUSES[bus], adr, value, read) for bus, adr, value, read in deltas]
+
+class DDSClient(object):
+    """Connection to a :class:`DDSServer`.
+    """
+    def __init__(self, path=SOCKET):
+        """
+            :param str path: path of the Unix domain socket
+        """
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.stream = self.sock.makefile('rb')
+        self.lock = threading.Lock()
+        self._id = 0
+
+    def request(self, opcode, payload=b''):
+        """Send a request and wait for its response.
+
+            :param int opcode: operation
+            :param bytes payload: request payload
+            :return: response payload
+        """
+        with self.lock:
+            self._id = (self._id + 1) & 0xFFFFFFFF
+            self.sock.sendall(HEADER.pack(self._id, opcode, len(payload)) + payload)
+            header = self.stream.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise DDSServerError('connection closed by server')
+            request_id, status, length = HEADER.unpack(header)
+            data = self.stream.read(length)
+        if status != STATUS_OK:
+            raise DDSServerError(data.decode('utf-8', 'replace'))
+        return data
+
+    def set(self, **params):
+        """Set DDS parameters, see :meth:`pydualdds.DDS.update` for the names.
+        """
+        items = [(PARAMETERS.index(k), v) for k, v in params.items() if v is not None]
+        if items:
+            self.request(OP_SET, b''.join(SET_ITEM.pack(p, v) for p, v in items))
+
+    def call(self, name, verify='full', warm=False):
+        """Run one of CALLS on the server.
+
+            :return: list of (bus, address, set value, read value) returned by config_board and attach
+        """
+        payload = CALL_ARGS.pack(CALLS.index(name), VERIFY.index(verify), int(warm))
+        return decode_deltas(self.request(OP_CALL, payload))
+
+    def invoke(self, name, *args, **kwargs):
+        """Run one of INVOKE_CALLS on the server.
+
+            :return: result of the DDS method
+        """
+        request = {'name': name, 'args': args, 'kwargs': kwargs}
+        return json.loads(self.request(OP_INVOKE, json.dumps(request, default=_plain).encode('utf-8')).decode('utf-8'))
+
+    def close(self):
+        """Close the connection.
+        """
+        self.stream.close()
+        self.sock.close()
+
+class DacComProxy(object):
+    """Register access of a :class:`DDSProxy`, with the methods of :class:`pydualdds.DacCom`.
+    """
+    def __init__(self, client):
+        self.client = client
+
+    def dac_write(self, address, data, force=False):
+        """Write a DAC register. Writes are always shadowed on the server.
+        """
+        self.client.request(OP_DAC_WRITE, REGISTER.pack(address, data))
+
+    def dac_read(self, address, cached=True):
+        """Read a DAC register. Values are served from the shadow of the server if known.
+        """
+        return ADDRESS.unpack(self.client.request(OP_DAC_READ, ADDRESS.pack(address)))[0]
+
+    def lmk_write(self, address, data, force=False):
+        """Write a LMK04828 register. Writes are always shadowed on the server.
+        """
+        self.client.request(OP_LMK_WRITE, REGISTER.pack(address, data))
+
+    def lmk_read(self, address, cached=True):
+        """Read a LMK04828 register. Values are served from the shadow of the server if known.
+        """
+        return ADDRESS.unpack(self.client.request(OP_LMK_READ, ADDRESS.pack(address)))[0]
+
+    def close(self):
+        """Close the connection to the server, the board stays open.
+        """
+        self.client.close()
+
+class DDSProxy(object):
+    """Client side stand-in of :class:`pydualdds.DDS` forwarding to a :class:`DDSServer`.
+
+        It offers configuration, the parameter setters, update, batch, nco_sync, nco_sync_pulse, sweep and
+        envelope, and register access through dac (see :class:`DacComProxy`).
+    """
+    def __init__(self, path=SOCKET):
+        """
+            :param str path: path of the Unix domain socket
+        """
+        self.client = DDSClient(path)
+        self.dac = DacComProxy(self.client)
+        self._batch = None
+
+    def _set(self, **params):
+        if self._batch is not None:
+            self._batch.update((k, v) for k, v in params.items() if v is not None)
+        else:
+            self.client.set(**params)
+
+    def _invoke(self, name, *args):
+        if self._batch is not None:
+            raise RuntimeError('%s cannot be called inside batch(), call it after the block' % name)
+        return self.client.invoke(name, *args)
+
+    def config_board(self, verify='full', warm=False):
+        """See :meth:`pydualdds.DDS.config_board`.
+        """
+        deltas = self.client.call('config_board', verify, warm)
+        if warm:
+            return deltas
+
+    def attach(self):
+        """See :meth:`pydualdds.DDS.attach`.
+        """
+        return self.client.call('attach')
+
+    def start_up_sequence(self):
+        """See :meth:`pydualdds.DDS.start_up_sequence`.
+        """
+        self.client.call('start_up_sequence')
+
+    def nco_sync(self, arm=None):
+        """See :meth:`pydualdds.DDS.nco_sync`.
+        """
+        return self._invoke('nco_sync', arm)
+
+    def nco_sync_pulse(self):
+        """See :meth:`pydualdds.DDS.nco_sync_pulse`.
+        """
+        self._invoke('nco_sync_pulse')
+
+    def sweep(self, start=None, stop=None, step=None, channel='a', freqs=None, dwell=0.0):
+        """See :meth:`pydualdds.DDS.sweep`.
+        """
+        return self._invoke('sweep', start, stop, step, channel, freqs, dwell)
+
+    def envelope(self, gains_a=None, gains_b=None, dwell=0.0):
+        """See :meth:`pydualdds.DDS.envelope`.
+        """
+        return self._invoke('envelope', gains_a, gains_b, dwell)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Collect parameter changes and send them in one request, see :meth:`pydualdds.DDS.batch`.
+        """
+        if self._batch is not None:
+            yield self
+            return
+        self._batch = {}
+        try:
+            yield self
+            pending = self._batch
+        finally:
+            self._batch = None
+        self.client.set(**pending)
+
+    def nco_freq_a(self, freq):
+        """See :meth:`pydualdds.DDS.nco_freq_a`.
+        """
+        self._set(freq_a=freq)
+
+    def nco_freq_b(self, freq):
+        """See :meth:`pydualdds.DDS.nco_freq_b`.
+        """
+        self._set(freq_b=freq)
+
+    def nco_phase_a(self, deg):
+        """See :meth:`pydualdds.DDS.nco_phase_a`.
+        """
+        self._set(phase_a=deg)
+
+    def nco_phase_b(self, deg):
+        """See :meth:`pydualdds.DDS.nco_phase_b`.
+        """
+        self._set(phase_b=deg)
+
+    def amplitude_a(self, gain):
+        """See :meth:`pydualdds.DDS.amplitude_a`.
+        """
+        self._set(amp_a=gain)
+
+    def amplitude_b(self, gain):
+        """See :meth:`pydualdds.DDS.amplitude_b`.
+        """
+        self._set(amp_b=gain)
+
+    def update(self, freq_a=None, freq_b=None, phase_a=None, phase_b=None, amp_a=None, amp_b=None):
+        """Set several parameters at once, see :meth:`pydualdds.DDS.update`.
+        """
+        self._set(freq_a=freq_a, freq_b=freq_b, phase_a=phase_a, phase_b=phase_b, amp_a=amp_a, amp_b=amp_b)
+
+    def close(self):
+        """Close the connection to the server, the board stays open.
+        """
+        self.client.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Share a DAC38RF82EVM between processes through a Unix domain socket.')
+    parser.add_argument('-s', '--socket', default=SOCKET, help='path of the socket')
+    parser.add_argument('-c', '--config', default="./config/PLL_M9N5Ref1228_8MHz_PLLlock.cfg", help='configuration file')
+    parser.add_argument('--attach', action='store_true', help='attach to the running board before serving')
+    args = parser.parse_args(argv)
+
+    server = DDSServer(args.socket, config=args.config)
+    try:
+        if args.attach:
+            server.worker.submit(lambda dds: dds.attach()).result()
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+
+#    Copyright (C) 2017 Andreas Fognini
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from pydualdds import Transport, BitBangTransport
+
+class EvmSimulator(object):
+    """Pin-level model of the DAC38RF82 and the LMK04828 on the DAC38RF82EVM.
+
+        The simulator decodes the port states written by a GPIO controller exactly as the chips see them:
+        data is sampled on the rising edge of SCK while the chip select is low, read data is driven on the
+        falling edges following the instruction phase. It keeps both register files, including the DAC page
+        register 0x09 with its multi-page broadcast.
+
+        Use :meth:`gpio_controller` as drop-in for pyftdi's GpioController, e.g.::
+
+            board = EvmSimulator()
+            dds = DDS(transport=BitBangTransport(gpio_class=board.gpio_controller))
+    """
+    DAC_PAGE_ADR = 0x09
+    DAC_PAGES = (0b001, 0b010, 0b100)
+    DAC_GLOBAL_ADR = 0x0A #registers below are common to all pages
+
+    DAC_RESETB = int('00100000',2)
+
+    def __init__(self):
+        self.dac_registers = {} #(page, address) -> value, page 0 for the common registers
+        self.lmk_registers = {}
+        self.dac_page = 0
+
+        self.port = 0 #port B as driven by the FTDI
+        self.direction = 0xFF
+        self.drive = 0 #port B pins driven by the chips
+
+        self._dac = None
+        self._lmk = None
+
+    def gpio_controller(self):
+        """Create a GPIO controller attached to this board.
+
+            :return: :class:`SimGpioController`
+        """
+        return SimGpioController(self)
+
+    def transport(self, **kwargs):
+        """Create a bit-bang transport attached to this board.
+
+            :return: :class:`pydualdds.BitBangTransport`
+        """
+        return BitBangTransport(gpio_class=self.gpio_controller, **kwargs)
+
+    def dac_register(self, address):
+        """Value of a DAC register.
+
+            :param int address: Address of register with page prefix, e.g. 0x0128
+            :return: Register value
+        """
+        page = address >> 8
+        address = address % 0x100
+        if address < self.DAC_GLOBAL_ADR:
+            return self.dac_registers.get((0, address), 0)
+        return self.dac_registers.get((page, address), 0)
+
+    def lmk_register(self, address):
+        """Value of a LMK04828 register.
+
+            :param int address: Address of register
+            :return: Register value
+        """
+        return self.lmk_registers.get(address, 0)
+
+    def reset_pin(self, value):
+        """Drive the DAC reset pin on port A.
+
+            :param int value: port A state
+        """
+        if not value & self.DAC_RESETB:
+            self.dac_registers.clear()
+            self.dac_page = 0
+            self._dac = None
+
+    def _dac_store(self, address, data):
+        if address == self.DAC_PAGE_ADR:
+            self.dac_page = data & 0b111
+        if address < self.DAC_GLOBAL_ADR:
+            self.dac_registers[(0, address)] = data
+            return
+        for page in self.DAC_PAGES:
+            if self.dac_page & page:
+                self.dac_registers[(page, address)] = data
+
+    def _dac_load(self, address):
+        if address < self.DAC_GLOBAL_ADR:
+            return self.dac_registers.get((0, address), 0)
+        for page in self.DAC_PAGES:
+            if self.dac_page & page:
+                return self.dac_registers.get((page, address), 0)
+        return 0
+
+    def _level(self, port, direction):
+        return (port & direction) | (self.drive & ~direction & 0xFF)
+
+    def set_port(self, port, direction=None):
+        """Apply a new port B state and run the chips on the resulting edges.
+
+            :param int port: port value driven by the FTDI
+            :param int direction: direction bit field, 1 for output
+        """
+        if direction is None:
+            direction = self.direction
+        old = self._level(self.port, self.direction)
+        self.port = port
+        self.direction = direction
+        self._edges(old, self._level(port, direction))
+
+    def read(self):
+        """Pin levels of port B.
+
+            :return: Port value
+        """
+        return self._level(self.port, self.direction)
+
+    def _edges(self, old, new):
+        T = Transport
+        #DAC38RF82, 4 wire: sample SDIO on rising SCK, drive SDO on falling SCK
+        if old & T.DAC_SDENB and not new & T.DAC_SDENB:
+            self._dac = {'bits': 0, 'word': 0, 'read': None}
+        elif new & T.DAC_SDENB:
+            self._dac = None
+            self.drive &= ~T.DAC_SDO
+        if self._dac is not None:
+            rising = not old & T.DAC_SCK and new & T.DAC_SCK
+            falling = old & T.DAC_SCK and not new & T.DAC_SCK
+            state = self._dac
+            if rising and state['read'] is None:
+                state['word'] = (state['word'] << 1) | ((new & T.DAC_SDIO) > 0)
+                state['bits'] += 1
+                if state['bits'] == 8 and state['word'] & 0x80:
+                    state['read'] = self._dac_load(state['word'] & 0x7F)
+                elif state['bits'] == 24:
+                    self._dac_store((state['word'] >> 16) & 0x7F, state['word'] & 0xFFFF)
+            elif falling and state['read'] is not None:
+                state['read'] = (state['read'] << 1) & 0x1FFFF
+                self.drive = self.drive | T.DAC_SDO if state['read'] & 0x10000 else self.drive & ~T.DAC_SDO
+
+        #LMK04828, 3 wire: sample SDIO on rising SCK, drive read data on SDIO on falling SCK
+        if old & T.LMK_CS and not new & T.LMK_CS:
+            self._lmk = {'bits': 0, 'word': 0, 'read': None}
+        elif new & T.LMK_CS:
+            self._lmk = None
+            self.drive &= ~T.LMK_SDIO
+        if self._lmk is not None:
+            rising = not old & T.LMK_SCK and new & T.LMK_SCK
+            falling = old & T.LMK_SCK and not new & T.LMK_SCK
+            state = self._lmk
+            if rising and state['read'] is None:
+                state['word'] = (state['word'] << 1) | ((new & T.LMK_SDIO) > 0)
+                state['bits'] += 1
+                if state['bits'] == 16 and state['word'] & 0x8000:
+                    state['read'] = self.lmk_registers.get(state['word'] & 0x1FFF, 0)
+                elif state['bits'] == 24:
+                    self.lmk_registers[(state['word'] >> 8) & 0x1FFF] = state['word'] & 0xFF
+            elif falling and state['read'] is not None:
+                state['read'] = (state['read'] << 1) & 0x1FF
+                self.drive = self.drive | T.LMK_SDIO if state['read'] & 0x100 else self.drive & ~T.LMK_SDIO
+
+class SimGpioController(object):
+    """Drop-in replacement of pyftdi's GpioController driving an :class:`EvmSimulator`.
+
+        Interface 1 of the FTDI URL maps to the DAC reset port, interface 2 to the SPI port.
+        The controller counts its USB transactions and bytes in the attributes writes, reads,
+        direction_changes, bytes_written and bytes_read. It also offers :meth:`exchange` of pyftdi's
+        synchronous bit-bang mode, see :class:`pydualdds.SyncGpioController`.
+    """
+    def __init__(self, board=None):
+        """
+            :param board: simulated board, a new :class:`EvmSimulator` by default
+        """
+        if board is None:
+            board = EvmSimulator()
+        self.board = board
+        self.interface = None
+        self.reset_counters()
+
+    def reset_counters(self):
+        """Set the transaction counters to zero.
+        """
+        self.writes = 0
+        self.reads = 0
+        self.direction_changes = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+
+    def open_from_url(self, url, direction=0):
+        """Attach to the simulated interface selected by the URL.
+
+            :param str url: FTDI URL, e.g. 'ftdi://ftdi:2232h/2'
+            :param int direction: direction bit field, 1 for output
+        """
+        self.interface = int(url.rstrip('/').rsplit('/', 1)[-1])
+        if self.interface == 2:
+            self.board.direction = direction
+
+    configure = open_from_url
+
+    def close(self):
+        """Detach from the board.
+        """
+        self.interface = None
+
+    def set_direction(self, pins, direction):
+        """Change the direction of the port pins.
+
+            :param int pins: pins to change
+            :param int direction: direction bit field, 1 for output
+        """
+        self.direction_changes += 1
+        if self.interface == 2:
+            new = (self.board.direction & ~pins) | (direction & pins)
+            self.board.set_port(self.board.port, new & 0xFF)
+
+    def write_port(self, value):
+        """Write a single port state.
+
+            :param int value: port value
+        """
+        self._write(bytes([value]))
+
+    def write(self, out):
+        """Write a sequence of port states in one transfer.
+
+            :param out: port states, bytes or a single int
+        """
+        self._write(out)
+
+    def _write(self, out):
+        if isinstance(out, int):
+            out = bytes([out])
+        self.writes += 1
+        self.bytes_written += len(out)
+        for value in out:
+            if self.interface == 1:
+                self.board.reset_pin(value)
+            else:
+                self.board.set_port(value)
+
+    def read_port(self):
+        """Read the port pins.
+
+            :return: Port value
+        """
+        self.reads += 1
+        self.bytes_read += 1
+        if self.interface == 1:
+            return 0xFF
+        return self.board.read()
+
+    def exchange(self, out):
+        """Write port states and sample the pins in one transfer, as in synchronous bit-bang mode.
+
+            :param bytes out: port states
+            :return: one byte per state, the pin levels just before the state was applied
+        """
+        self.writes += 1
+        self.reads += 1
+        self.bytes_written += len(out)
+        self.bytes_read += len(out)
+        levels = bytearray()
+        for value in out:
+            if self.interface == 1:
+                levels.append(0xFF)
+                self.board.reset_pin(value)
+            else:
+                levels.append(self.board.read())
+                self.board.set_port(value)
+        return bytes(levels)
@@ -30,9 +30,11 @@ setup(
     description = ("PyDuyalDDS installer."),
     license = "GPLv3",
     keywords = "DDS, Sine, Frequency, Phase, Synthesizer",
-    py_modules =["PyDualDDS"],
+    py_modules =["pydualdds", "pydualdds_sim", "pydualdds_bench", "pydualdds_async", "pydualdds_server", "pydualdds_boards", "pydualdds_replay", "pydualdds_scrub", "pydualdds_cli", "pydualdds_schedule"],
     setup_requires=[],
     install_requires=['pyftdi'],
+    extras_require={'numpy': ['numpy']},
+    entry_points={'console_scripts': ['pydualdds = pydualdds_cli:main']},
     long_description=read('README.md'),
     #test_suite="tests",
     classifiers=[
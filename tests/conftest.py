@@ -0,0 +1,63 @@
+#    Copyright (C) 2017 Andreas Fognini
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Fixtures running the library against the simulated board, see :mod:`pydualdds_sim`.
+"""
+
+import os
+
+import pytest
+
+from pydualdds import DDS, CompiledConfig
+from pydualdds_sim import EvmSimulator
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config',
+                      'PLL_M9N5Ref1228_8MHz_PLLlock.cfg')
+
+def make_dds(board, **kwargs):
+    """DDS on a simulated board after the full bring-up.
+
+        :param board: :class:`pydualdds_sim.EvmSimulator`
+        :return: :class:`pydualdds.DDS`
+    """
+    dds = DDS(config=CONFIG, transport=board.transport(**kwargs))
+    dds.dac.DEBUG = False
+    dds.config_board()
+    dds.start_up_sequence()
+    return dds
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keep the compiled configurations of a test out of the user's cache.
+    """
+    path = str(tmp_path / 'cache')
+    monkeypatch.setattr(CompiledConfig, 'CACHE_DIR', path)
+    return path
+
+@pytest.fixture
+def board():
+    return EvmSimulator()
+
+@pytest.fixture
+def dds(board):
+    return make_dds(board)
+
+@pytest.fixture
+def gpio(dds):
+    """Simulated GPIO controller of the SPI port, with its counters reset.
+    """
+    controller = dds.dac.transport.gpio
+    controller.reset_counters()
+    return controller
@@ -0,0 +1,90 @@
+"""asyncio facade and its I/O worker on the simulated board.
+"""
+
+import asyncio
+
+import pytest
+
+from pydualdds_async import AsyncDDS
+
+from .conftest import make_dds
+
+def run(board, coroutine_function, **kwargs):
+    """Run coroutine_function(AsyncDDS, DDS) against the board.
+    """
+    box = {}
+    def factory():
+        box['dds'] = make_dds(board)
+        return box['dds']
+    async def main():
+        async with AsyncDDS(factory=factory, **kwargs) as dds:
+            await dds.run(lambda dds: None)
+            return await coroutine_function(dds, box['dds'])
+    return asyncio.run(main())
+
+def test_forwarded_operations(board):
+    async def operations(dds, sync_dds):
+        await dds.nco_freq_a(110.0)
+        await dds.update(freq_b=120.0, amp_b=0.5)
+        envelope = await dds.envelope([0.2, 0.4])
+        sweep = await dds.sweep(100.0, 102.0, 1.0, channel='a')
+        armed = await dds.nco_sync(arm=True)
+        return sync_dds, envelope, sweep, armed
+    dds, envelope, sweep, armed = run(board, operations)
+    assert board.dac_register(0x021E) == dds.frequency_word(120.0)[0]
+    assert board.dac_register(0x011E) == dds.frequency_word(102.0)[0]
+    assert board.dac_register(0x0132) == int(dds.gain_words(0.4))
+    assert board.dac_register(0x0232) == int(dds.gain_words(0.5))
+    assert envelope['steps'] == 2 and sweep['steps'] == 3 and armed is True
+
+def test_register_access(board):
+    async def access(dds, sync_dds):
+        await dds.dac_write(0x0132, 0x8123)
+        await dds.lmk_write(0x0100, 0x09)
+        await dds.write_batch([('dac', 0x0232, 0x8124)])
+        reads = [await dds.dac_read(0x0132, cached=False), await dds.lmk_read(0x0100, cached=False)]
+        return reads + await dds.read_batch([('dac', 0x0232), ('lmk', 0x0100)], cached=False)
+    assert run(board, access) == [0x8123, 0x09, 0x8124, 0x09]
+
+def test_queued_operations_are_combined(board):
+    async def burst(dds, sync_dds):
+        gpio = sync_dds.dac.transport.gpio
+        worker = dds.worker
+        operations, groups = worker.operations, worker.groups
+        gpio.reset_counters()
+        await asyncio.gather(*[dds.dac_write(0x0132, 0x8000 + i) for i in range(20)])
+        return worker.operations - operations, worker.groups - groups, gpio.writes
+    operations, groups, writes = run(board, burst)
+    assert operations == 20
+    assert groups < operations
+    assert writes <= groups
+    assert board.dac_register(0x0132) == 0x8000 + 19
+
+def test_serial_sweep_is_not_coalesced(board):
+    async def sweep(dds, sync_dds):
+        gpio = sync_dds.dac.transport.gpio
+        gpio.reset_counters()
+        result = await dds.sweep(100.0, 104.0, 1.0, dwell=0.005)
+        return result, gpio.writes
+    result, writes = run(board, sweep)
+    assert result['steps'] == 5
+    assert writes == 5
+
+def test_failed_operation_does_not_spoil_group(board):
+    def fail(dds):
+        dds.dac.dac_write(0x0132, 0x1234)
+        raise RuntimeError('failed operation')
+    async def group(dds, sync_dds):
+        futures = [dds.dac_write(0x0232, 0x4321), dds.run(fail), dds.dac_write(0x0432, 0x0055)]
+        return await asyncio.gather(*futures, return_exceptions=True), sync_dds
+    results, dds = run(board, group)
+    assert isinstance(results[1], RuntimeError)
+    assert board.dac_register(0x0232) == 0x4321
+    assert board.dac_register(0x0132) != 0x1234
+    assert dds.dac.dac_shadow.get(0x0132) != 0x1234
+
+def test_unknown_operation(board):
+    async def unknown(dds, sync_dds):
+        with pytest.raises(AttributeError):
+            dds.dac_reset
+    run(board, unknown)
@@ -0,0 +1,76 @@
+"""Bring-up, read back verification and warm attach on the simulated board.
+"""
+
+import os
+
+import pytest
+
+from pydualdds import DDS, CompiledConfig, ConfigurationError
+from pydualdds_sim import EvmSimulator
+
+from .conftest import CONFIG, make_dds
+
+def board_value(board, bus, address):
+    if bus == 'dac':
+        return board.dac_register(address)
+    return board.lmk_register(address)
+
+def test_bring_up_writes_configuration(board, dds):
+    expected = dds.dac.CONFIG.expected()
+    assert expected
+    wrong = [(bus, hex(adr)) for (bus, adr), value in expected.items()
+             if (bus, adr) not in dds.dac.DAC_VOLATILE and board_value(board, bus, adr) != value]
+    assert wrong == []
+
+def test_verify_reports_dropped_write(board):
+    store = board._dac_store
+    def drop(address, data):
+        if address != 0x0A:
+            store(address, data)
+    board._dac_store = drop
+    dds = DDS(config=CONFIG, transport=board.transport())
+    dds.dac.DEBUG = False
+    with pytest.raises(ConfigurationError) as error:
+        dds.config_board(verify='full')
+    assert error.value.mismatches
+    assert all(bus == 'dac' and adr % 0x100 == 0x0A for bus, adr, value, read in error.value.mismatches)
+
+def test_verify_off_round_trip(board):
+    dds = DDS(config=CONFIG, transport=board.transport())
+    dds.dac.DEBUG = False
+    dds.config_board(verify='off')
+    assert dds.dac.config_deltas() == []
+
+def test_attach_writes_only_differences(board, dds):
+    board.lmk_registers[0x0100] ^= 0x01
+    board.dac_registers[(1, 0x0C)] ^= 0x10
+
+    other = DDS(config=CONFIG, transport=board.transport())
+    other.dac.DEBUG = False
+    deltas = other.attach()
+    assert sorted((bus, adr) for bus, adr, value, read in deltas) == [('dac', 0x010C), ('lmk', 0x0100)]
+    assert other.dac.config_deltas() == []
+    assert other.attach() == []
+
+def test_compiled_configuration_is_cached(cache_dir):
+    first = CompiledConfig.load(CONFIG)
+    assert os.path.exists(CompiledConfig.cache_path(CONFIG))
+    second = CompiledConfig.load(CONFIG)
+    assert second.writes() == first.writes()
+
+def test_truncated_cache_is_recompiled(cache_dir, tmp_path):
+    CompiledConfig.load(CONFIG)
+    path = CompiledConfig.cache_path(CONFIG)
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:len(data)//2])
+    fresh = CompiledConfig.load(CONFIG, cache_dir=str(tmp_path / 'fresh'))
+    assert CompiledConfig.load(CONFIG).writes() == fresh.writes()
+
+def test_second_board_configures_from_rendered_stream(cache_dir):
+    boards = [EvmSimulator(), EvmSimulator()]
+    for board in boards:
+        make_dds(board)
+    assert boards[0].dac_registers == boards[1].dac_registers
+    assert boards[0].lmk_registers == boards[1].lmk_registers
@@ -0,0 +1,81 @@
+"""Planning of register writes: broadcast merge, page selection and batches.
+"""
+
+import pytest
+
+from pydualdds import BARRIER
+
+def test_equal_channel_writes_merge_into_broadcast(dds):
+    writes = dds.dac.order_writes([('dac', 0x011E, 5), ('dac', 0x021E, 5), ('dac', 0x011F, 1), ('dac', 0x021F, 2)])
+    assert ('dac', 0x031E, 5) in writes
+    assert ('dac', 0x011E, 5) not in writes and ('dac', 0x021E, 5) not in writes
+    assert ('dac', 0x011F, 1) in writes and ('dac', 0x021F, 2) in writes
+
+def test_merge_stops_at_barrier(dds):
+    writes = dds.dac.order_writes([('dac', 0x011E, 5), BARRIER, ('dac', 0x021E, 5)])
+    assert ('dac', 0x031E, 5) not in writes
+
+def test_update_same_frequency_uses_broadcast_page(board, dds, gpio):
+    dds.update(freq_a=123.0, freq_b=123.0)
+    words = dds.frequency_word(123.0)
+    for i, word in enumerate(words):
+        assert board.dac_register(0x011E + i) == word
+        assert board.dac_register(0x021E + i) == word
+    assert dds.dac.DAC_PAGE == 0b011
+
+    separate = gpio.bytes_written
+    gpio.reset_counters()
+    dds.update(freq_a=124.0)
+    dds.update(freq_b=124.0)
+    assert gpio.bytes_written > separate
+
+def test_plan_counts_page_writes(dds):
+    transactions, updates, page = dds.dac.plan_writes([('dac', 0x0132, 1), ('dac', 0x0232, 2)], force=True, page=1)
+    assert updates.page_writes == 1
+    assert updates.start_page == 1
+    assert page == 2
+    transactions, updates, page = dds.dac.plan_writes([('dac', 0x0132, 1)], force=True, page=None)
+    assert transactions[0] == ('dac', dds.dac.DAC_PAGE_ADR, 1)
+    assert updates.start_page is None
+
+def test_commit_selects_start_page_again(board, dds):
+    dac = dds.dac
+    dac.dac_change_page(1)
+    transactions, updates, page = dac.plan_writes([('dac', 0x0132, 0x8155)], force=True, page=dac.DAC_PAGE)
+    buf = dac.transport.render(transactions)
+    before = board.dac_register(0x0232)
+    dac.dac_change_page(2)
+    dac.commit_writes(buf, updates, page)
+    assert board.dac_register(0x0132) == 0x8155
+    assert board.dac_register(0x0232) == before
+
+def test_batch_applies_changes_in_one_update(board, dds, gpio):
+    with dds.batch():
+        dds.nco_freq_a(150.0)
+        dds.amplitude_b(0.25)
+        dds.update(phase_a=90.0)
+        assert gpio.writes == 0
+    assert board.dac_register(0x011E) == dds.frequency_word(150.0)[0]
+    assert board.dac_register(0x011C) == dds.phase_word(90.0)
+    assert board.dac_register(0x0232) == int(dds.gain_words(0.25))
+
+@pytest.mark.parametrize('call', [
+    lambda dds: dds.nco_sync(),
+    lambda dds: dds.nco_sync_pulse(),
+    lambda dds: dds.sweep(100.0, 101.0, 1.0),
+    lambda dds: dds.envelope([0.5]),
+])
+def test_batch_refuses_immediate_writes(board, dds, call):
+    before = board.dac_register(0x011E)
+    with pytest.raises(RuntimeError):
+        with dds.batch():
+            dds.nco_freq_a(150.0)
+            call(dds)
+    assert board.dac_register(0x011E) == before
+
+def test_sync_rearms_without_shadow(board, dds):
+    assert dds.nco_sync(arm=True)
+    assert dds.sync_armed()
+    dds.dac.SHADOW = False
+    assert not dds.sync_armed()
+    assert dds.nco_sync()
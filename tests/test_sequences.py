@@ -0,0 +1,146 @@
+"""Sweeps, hop tables, envelopes, scheduled sequences and the scrubber on the simulated board.
+"""
+
+import threading
+
+import pytest
+
+from pydualdds import HopTable
+from pydualdds_schedule import Scheduler
+from pydualdds_scrub import Scrubber
+
+def test_sweep_ends_on_last_frequency(board, dds):
+    result = dds.sweep(100.0, 104.0, 1.0, channel='ab')
+    assert result['steps'] == 5
+    for i, word in enumerate(dds.frequency_word(104.0)):
+        assert board.dac_register(0x011E + i) == word
+        assert board.dac_register(0x021E + i) == word
+    assert dds.dac.config_deltas() == []
+
+def test_sweep_steps_are_paced(board, dds):
+    gpio = dds.dac.transport.gpio
+    gpio.reset_counters()
+    result = dds.sweep(freqs=[100.0, 101.0, 102.0], channel='b', dwell=0.01)
+    assert result['steps'] == 3
+    assert result['seconds'] >= 0.02
+    assert gpio.writes == 3
+    assert board.dac_register(0x021E) == dds.frequency_word(102.0)[0]
+
+def test_hop_table_is_independent_of_page(board, dds):
+    freqs = [100.0, 200.0, 300.0]
+    table = HopTable(dds, freqs, phases=[0.0, 90.0, 180.0], channel='a')
+    for index in (2, 0, 1):
+        dds.dac.dac_change_page(2)
+        table.hop(index)
+        assert board.dac_register(0x011E) == dds.frequency_word(freqs[index])[0]
+        assert board.dac_register(0x011C) == dds.phase_word(90.0*index)
+    assert table.stats()['count'] == 3
+
+def test_envelope_drops_repeated_steps(board, dds):
+    result = dds.envelope([0.1, 0.5, 0.5, 1.0], [0.2, 0.2, 0.2, 0.2])
+    assert result['steps'] == 3
+    assert result['dropped'] == 1
+    assert board.dac_register(0x0132) == int(dds.gain_words(1.0))
+    assert board.dac_register(0x0232) == int(dds.gain_words(0.2))
+
+def test_envelope_dwell_keeps_channel(board, dds):
+    before = board.dac_register(0x0232)
+    def wait(deadline, wait=dds._wait_until):
+        wait(deadline)
+        dds.dac.dac_change_page(2)
+    dds._wait_until = wait
+    dds.envelope([0.3, 0.6, 0.9], dwell=0.001)
+    assert board.dac_register(0x0132) == int(dds.gain_words(0.9))
+    assert board.dac_register(0x0232) == before
+
+def test_schedule_keeps_channel_between_steps(board, dds):
+    dds.amplitude_b(0.5)
+    dds.amplitude_a(0.5)
+    before = board.dac_register(0x0232)
+    def wait(deadline, wait=dds._wait_until):
+        dds.dac.dac_change_page(2) #e.g. a scrubber read between two steps
+        wait(deadline)
+    dds._wait_until = wait
+    scheduler = Scheduler(dds, realtime=False)
+    scheduler.amp(0.0, 'a', 0.3)
+    scheduler.amp(0.002, 'a', 0.9)
+    scheduler.freq(0.004, 'a', 150.0)
+    stats = scheduler.run()
+    assert stats['count'] == 3
+    assert board.dac_register(0x0132) == int(dds.gain_words(0.9))
+    assert board.dac_register(0x011E) == dds.frequency_word(150.0)[0]
+    assert board.dac_register(0x0232) == before
+
+def test_schedule_statistics_restart(dds):
+    scheduler = Scheduler(dds, realtime=False)
+    scheduler.freq(0.0, 'a', 100.0)
+    scheduler.freq(0.001, 'a', 101.0)
+    assert scheduler.run()['count'] == 2
+    assert scheduler.run()['count'] == 2
+
+def test_scrubber_repairs_and_keeps_page(board, dds):
+    found = []
+    scrubber = Scrubber(dds, repair=True, callback=lambda *args: found.append(args[:2]))
+    board.dac_registers[(1, 0x32)] ^= 0x10
+    board.lmk_registers[0x0139] ^= 0x01
+    dds.dac.dac_change_page(2)
+    assert scrubber.scrub() == 2
+    assert sorted(found) == [('dac', 0x0132), ('lmk', 0x0139)]
+    assert dds.dac.DAC_PAGE == 2 and board.dac_page == 2
+    assert scrubber.scrub() == 0
+    assert dds.dac.config_deltas() == []
+
+def test_scrubber_unwraps_cleanly(dds):
+    dac = dds.dac
+    scrubber = Scrubber(dds)
+    scrubber.start()
+    assert all(name in vars(dac) for name in Scrubber.FOREGROUND)
+    scrubber.stop()
+    assert not any(name in vars(dac) for name in Scrubber.FOREGROUND)
+    assert not any(name in vars(dac.transport) for name in Scrubber.TRANSPORT_FOREGROUND)
+
+@pytest.mark.parametrize('metrics_first', [False, True])
+def test_scrubber_and_metrics_unwrap_in_any_order(dds, metrics_first):
+    if metrics_first:
+        metrics = dds.instrument()
+    scrubber = Scrubber(dds, period=60.0)
+    scrubber.start()
+    if metrics_first:
+        dds.uninstrument()
+        dds.amplitude_a(0.3)
+        assert 'dac_write' in vars(dds.dac) #the scrubber keeps its wrapper
+        scrubber.stop()
+    else:
+        metrics = dds.instrument()
+        scrubber.stop()
+        dds.amplitude_a(0.3)
+        assert metrics.counters['bytes_written'] > 0 #the metrics wrappers survive the scrubber
+        dds.uninstrument()
+
+    #wrappers left in the chain no longer take the bus lock
+    scrubber.lock.acquire()
+    try:
+        worker = threading.Thread(target=dds.amplitude_a, args=(0.4,))
+        worker.start()
+        worker.join(5.0)
+        assert not worker.is_alive()
+    finally:
+        scrubber.lock.release()
+
+def test_scrubber_locks_release_and_render(dds):
+    transport = dds.dac.transport
+    scrubber = Scrubber(dds, period=60.0)
+    owned = []
+    for name in Scrubber.TRANSPORT_FOREGROUND:
+        function = getattr(transport, name)
+        def probe(*args, function=function):
+            owned.append(scrubber.lock._is_owned())
+            return function(*args)
+        setattr(transport, name, probe)
+    scrubber.start()
+    try:
+        with dds.dac.coalesce():
+            dds.sweep(freqs=[100.0, 101.0])
+    finally:
+        scrubber.stop()
+    assert owned and all(owned)
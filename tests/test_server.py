@@ -0,0 +1,115 @@
+"""Unix domain socket server and its clients on the simulated board, one request per opcode at least.
+"""
+
+import errno
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+import pydualdds_server
+from pydualdds_server import DDSClient, DDSProxy, DDSServer, DDSServerError
+
+from .conftest import make_dds
+
+@pytest.fixture
+def server(board, tmp_path):
+    box = {}
+    def factory():
+        box['dds'] = make_dds(board)
+        return box['dds']
+    server = DDSServer(str(tmp_path / 'dds.sock'), factory=factory)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    server.worker.submit(lambda dds: None).result()
+    server.dds = box['dds']
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def client(server):
+    client = DDSClient(server.path)
+    yield client
+    client.close()
+
+def test_set(board, server, client):
+    dds = server.dds
+    client.set(freq_a=130.0, phase_b=45.0, amp_a=0.5)
+    assert board.dac_register(0x011E) == dds.frequency_word(130.0)[0]
+    assert board.dac_register(0x021C) == dds.phase_word(45.0)
+    assert board.dac_register(0x0132) == int(dds.gain_words(0.5))
+
+def test_register_write_and_read(board, client):
+    client.request(pydualdds_server.OP_DAC_WRITE, pydualdds_server.REGISTER.pack(0x0132, 0x8123))
+    client.request(pydualdds_server.OP_LMK_WRITE, pydualdds_server.REGISTER.pack(0x0100, 0x09))
+    assert (board.dac_register(0x0132), board.lmk_register(0x0100)) == (0x8123, 0x09)
+    board.lmk_registers[0x0182] = 0x05 #volatile, read from the board
+    read = lambda opcode, address: pydualdds_server.ADDRESS.unpack(
+        client.request(opcode, pydualdds_server.ADDRESS.pack(address)))[0]
+    assert read(pydualdds_server.OP_DAC_READ, 0x0132) == 0x8123
+    assert read(pydualdds_server.OP_LMK_READ, 0x0182) == 0x05
+
+def test_call(board, client):
+    board.lmk_registers[0x0100] ^= 0x01
+    deltas = client.call('config_board', 'full', True)
+    assert [(bus, adr) for bus, adr, value, read in deltas] == [('lmk', 0x0100)]
+    assert client.call('attach') == []
+    assert client.call('start_up_sequence') == []
+    with pytest.raises(ValueError):
+        client.call('nco_sync')
+
+def test_invoke(board, server, client):
+    assert client.invoke('nco_sync', True) is True
+    assert client.invoke('nco_sync_pulse') is None
+    sweep = client.invoke('sweep', 100.0, 102.0, 1.0, 'b')
+    assert sweep['steps'] == 3
+    assert board.dac_register(0x021E) == server.dds.frequency_word(102.0)[0]
+    envelope = client.invoke('envelope', np.array([0.2, 0.4]), None, 0.0)
+    assert envelope['steps'] == 2
+    with pytest.raises(DDSServerError):
+        client.invoke('config_board')
+
+def test_unknown_opcode(client):
+    with pytest.raises(DDSServerError):
+        client.request(99)
+
+def test_encoding_failure_is_reported(client, monkeypatch):
+    def fail(deltas):
+        raise TypeError('cannot encode')
+    monkeypatch.setattr(pydualdds_server, 'encode_deltas', fail)
+    client.sock.settimeout(5.0)
+    with pytest.raises(DDSServerError):
+        client.call('start_up_sequence')
+
+def test_live_server_is_not_replaced(server):
+    with pytest.raises(OSError) as error:
+        DDSServer(server.path, factory=lambda: None)
+    assert error.value.errno == errno.EADDRINUSE
+
+def test_stale_socket_is_replaced(board, tmp_path):
+    path = str(tmp_path / 'stale.sock')
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    server = DDSServer(path, factory=lambda: make_dds(board))
+    server.server_close()
+
+def test_proxy(board, server):
+    proxy = DDSProxy(server.path)
+    try:
+        with proxy.batch():
+            proxy.nco_freq_a(140.0)
+            proxy.amplitude_b(0.25)
+            with pytest.raises(RuntimeError):
+                proxy.nco_sync()
+        dds = server.dds
+        assert board.dac_register(0x011E) == dds.frequency_word(140.0)[0]
+        assert board.dac_register(0x0232) == int(dds.gain_words(0.25))
+        assert proxy.nco_sync(arm=True) is True
+        proxy.dac.dac_write(0x0132, 0x8111)
+        assert proxy.dac.dac_read(0x0132) == 0x8111
+    finally:
+        proxy.close()
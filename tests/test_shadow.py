@@ -0,0 +1,62 @@
+"""Write elision and cached reads of the register shadow.
+"""
+
+def test_unchanged_update_is_elided(dds, gpio):
+    dds.update(freq_a=100.0, phase_b=45.0, amp_a=0.7)
+    assert gpio.writes > 0
+    gpio.reset_counters()
+    dds.update(freq_a=100.0, phase_b=45.0, amp_a=0.7)
+    assert gpio.writes == 0
+    assert gpio.bytes_written == 0
+
+def test_only_trigger_is_sent_for_same_frequency(dds, gpio):
+    dds.nco_freq_a(100.0)
+    changed = gpio.bytes_written
+    gpio.reset_counters()
+    dds.nco_freq_a(100.0)
+    assert 0 < gpio.bytes_written < changed
+
+def test_forced_write_is_sent(board, dds, gpio):
+    dds.dac.dac_write(0x0132, 0x8400)
+    gpio.reset_counters()
+    board.dac_registers[(1, 0x32)] = 0
+    dds.dac.dac_write(0x0132, 0x8400, force=True)
+    assert gpio.writes > 0
+    assert board.dac_register(0x0132) == 0x8400
+
+def test_shadow_off_writes_every_time(dds, gpio):
+    dds.dac.SHADOW = False
+    dds.amplitude_a(0.5)
+    gpio.reset_counters()
+    dds.amplitude_a(0.5)
+    assert gpio.writes > 0
+
+def test_broadcast_write_updates_both_pages(dds, gpio):
+    dds.dac.dac_write(0x0332, 0x8123)
+    gpio.reset_counters()
+    dds.dac.dac_write(0x0132, 0x8123)
+    dds.dac.dac_write(0x0232, 0x8123)
+    assert gpio.writes == 0
+
+def test_read_is_served_from_shadow(board, dds, gpio):
+    dds.dac.dac_write(0x0132, 0x8400)
+    board.dac_registers[(1, 0x32)] = 0x8001
+    assert dds.dac.dac_read(0x0132) == 0x8400
+    assert gpio.reads == 0
+    assert dds.dac.dac_read(0x0132, cached=False) == 0x8001
+    assert gpio.reads > 0
+
+def test_alarm_registers_are_not_cached(board, dds, gpio):
+    address = 0x0164
+    board.dac_registers[(1, 0x64)] = 0x0001
+    assert dds.dac.dac_read(address) == 0x0001
+    board.dac_registers[(1, 0x64)] = 0x0000
+    assert dds.dac.dac_read(address) == 0x0000
+    assert gpio.reads > 0
+
+def test_invalidate_forgets_writes(board, dds, gpio):
+    dds.amplitude_a(0.5)
+    dds.dac.shadow_invalidate()
+    gpio.reset_counters()
+    dds.amplitude_a(0.5)
+    assert gpio.writes > 0
@@ -0,0 +1,133 @@
+"""Bit-bang transport on the simulated port: sync reads, batching, held writes and metrics.
+"""
+
+import pytest
+
+from pydualdds import SyncGpioController
+
+from .conftest import make_dds
+
+def board_values(board, keys):
+    return [board.dac_register(a) if bus == 'dac' else board.lmk_register(a) for bus, a in keys]
+
+@pytest.mark.parametrize('sync', [True, False])
+def test_reads_match_board(board, dds, sync):
+    dds.dac.transport.SYNC = sync
+    keys = [('dac', 0x0132), ('dac', 0x0232), ('dac', 0x0103), ('lmk', 0x0139), ('lmk', 0x0100)]
+    assert [dds.dac.dac_read(a, cached=False) if bus == 'dac' else dds.dac.lmk_read(a, cached=False)
+            for bus, a in keys] == board_values(board, keys)
+    assert dds.dac.read_batch(keys, cached=False) == board_values(board, keys)
+
+def test_sync_read_batch_is_one_exchange(board, dds, gpio):
+    keys = [k for k in sorted(dds.dac.CONFIG.expected()) if k[0] == 'dac'][:32]
+    values = dds.dac.read_batch(keys, cached=False)
+    assert values == board_values(board, keys)
+    assert gpio.reads == 1
+    assert gpio.direction_changes <= 2
+
+def test_read_without_sync_samples_the_port_per_bit(board, dds, gpio):
+    dds.dac.transport.SYNC = False
+    dds.dac.dac_read(0x0132, cached=False)
+    assert gpio.reads == 16
+
+def test_exchange_is_chunked(board, dds):
+    transport = dds.dac.transport
+    sizes = []
+    exchange = transport.gpio.exchange
+    def record(out):
+        sizes.append(len(out))
+        return exchange(out)
+    transport.gpio.exchange = record
+    keys = sorted(dds.dac.CONFIG.expected())
+    assert dds.dac.read_batch(keys, cached=False) == board_values(board, keys)
+    assert len(sizes) > 1
+    assert max(sizes) <= min(transport.SYNC_CHUNK, SyncGpioController.CHUNK)
+
+def test_coalesced_writes_leave_in_one_transfer(board, dds, gpio):
+    with dds.dac.coalesce():
+        dds.dac.dac_write(0x0132, 0x8101)
+        dds.dac.dac_write(0x0232, 0x8202)
+        dds.dac.lmk_write(0x0100, 0x09)
+        assert gpio.writes == 0
+    assert gpio.writes == 1
+    assert (board.dac_register(0x0132), board.dac_register(0x0232), board.lmk_register(0x0100)) == \
+        (0x8101, 0x8202, 0x09)
+
+def test_failed_operation_drops_its_held_writes(board, dds):
+    dac = dds.dac
+    with dac.coalesce():
+        dac.dac_write(0x0232, 0x4321)
+        with pytest.raises(RuntimeError):
+            with dac.discard_on_error():
+                dac.dac_write(0x0132, 0x1234)
+                raise RuntimeError('failed operation')
+    assert board.dac_register(0x0232) == 0x4321
+    assert board.dac_register(0x0132) != 0x1234
+    assert dac.dac_shadow.get(0x0132) != 0x1234
+
+def test_failed_release_invalidates_shadow(board, dds):
+    dac = dds.dac
+    gpio = dac.transport.gpio
+    def fail(out):
+        raise OSError('USB gone')
+    gpio.write = fail
+    with pytest.raises(OSError):
+        with dac.coalesce():
+            dac.dac_write(0x0132, 0x7777)
+    del gpio.write
+    assert 0x0132 not in dac.dac_shadow
+    dac.dac_write(0x0132, 0x7777)
+    assert board.dac_register(0x0132) == 0x7777
+
+def test_optimized_buffer_writes_same_registers(board, dds, monkeypatch):
+    transport = dds.dac.transport
+    transactions = [('dac', dds.dac.DAC_PAGE_ADR, 1), ('dac', 0x32, 0x8155), ('lmk', 0x0100, 0x08)]
+    rendered = transport.render(transactions)
+    monkeypatch.setattr(transport, 'optimize', bytes)
+    assert len(rendered) < len(transport.render(transactions))
+    transport.send(rendered)
+    dds.dac.DAC_PAGE = 1
+    assert board.dac_register(0x0132) == 0x8155
+    assert board.lmk_register(0x0100) == 0x08
+
+def test_metrics_count_sync_reads(board, dds):
+    metrics = dds.instrument()
+    gpio = dds.dac.transport.gpio
+    gpio.reset_counters()
+    dds.dac.read_batch([('dac', 0x0132), ('lmk', 0x0139)], cached=False)
+    counters = metrics.snapshot()['counters']
+    assert counters['usb_exchange'] == gpio.reads
+    assert counters['read_port'] == gpio.reads
+    assert counters['bytes_read'] == gpio.bytes_read > 0
+    dds.uninstrument()
+
+def test_metrics_count_page_switches(board):
+    switches = [0]
+    store = board._dac_store
+    def count(address, data):
+        if address == 0x09:
+            switches[0] += 1
+        store(address, data)
+    board._dac_store = count
+    dds = make_dds(board)
+    metrics = dds.instrument()
+    switches[0] = 0
+    dds.nco_freq_b(120.0)
+    dds.dac.read_batch([('dac', 0x011E), ('dac', 0x021E), ('dac', 0x0432)], cached=False)
+    dds.envelope([0.5, 0.7], [0.5, 0.2])
+    assert metrics.counters['page_switch'] == switches[0] > 0
+    dds.uninstrument()
+
+def test_dac_com_forwards_port_members(dds):
+    dac = dds.dac
+    transport = dac.transport
+    assert dac.gpio is transport.gpio
+    assert dac.gpio_dac is transport.gpio_dac
+    assert (dac.LMK_CS, dac.DAC_SDENB) == (transport.LMK_CS, transport.DAC_SDENB)
+    dac.set_bit_on_port(dac.DAC_SCK, True)
+    assert dac.PORT == transport.PORT and transport.PORT & dac.DAC_SCK
+    dac.PORT = dac.set_bit(dac.PORT, dac.DAC_SCK, False)
+    dac.port_flush()
+    assert not transport.PORT & dac.DAC_SCK
+    with pytest.raises(AttributeError):
+        dac.no_such_member